@@ -1,6 +1,10 @@
-from django.contrib import admin
-from django.utils.html import format_html
-from .models import Category, Exhibit, ExhibitPhoto, Document, ExhibitHistory
+from django.contrib import admin, messages
+from django.db.models import Count
+from django.urls import reverse
+from django.utils.html import format_html, format_html_join
+from .models import (Category, Exhibit, ExhibitPhoto, Document, ExhibitHistory,
+                     StocktakeSession, CollectionStat)
+from . import documents, duplicates
 
 
 # ==================== INLINE МОДЕЛИ ====================
@@ -38,6 +42,21 @@ class ExhibitHistoryInline(admin.TabularInline):
         return False
 
 
+def warn_about_duplicates(request, photo):
+    """Предупреждение, если такое же фото уже есть в архиве"""
+    similar = duplicates.similar_photos(photo)
+    if not similar:
+        return
+    links = format_html_join(
+        ', ', '<a href="{}">{}</a> ({} бит)',
+        ((reverse('admin:museum_exhibitphoto_change', args=[other.pk]),
+          other.exhibit.title, d) for d, other in similar[:5])
+    )
+    messages.warning(request, format_html(
+        'Фото «{}» похоже на уже загруженные: {}', photo.title or photo.photo.name, links
+    ))
+
+
 # ==================== АДМИН-КЛАССЫ ====================
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -55,13 +74,14 @@ class CategoryAdmin(admin.ModelAdmin):
 class ExhibitAdmin(admin.ModelAdmin):
     # Отображение в списке
     list_display = ['inventory_number', 'title', 'category', 'status', 
-                   'is_featured', 'created_at', 'created_by']
+                   'is_featured', 'view_count', 'created_at', 'created_by']
     list_filter = ['status', 'category', 'created_at', 'is_featured']
     search_fields = ['title', 'description', 'inventory_number', 
                     'catalog_number', 'tags', 'author']
     list_editable = ['status', 'is_featured']
     readonly_fields = ['created_at', 'updated_at', 'created_by', 
-                      'last_modified_by', 'get_photo_count', 'get_document_count']
+                      'last_modified_by', 'get_photo_count', 'get_document_count',
+                      'view_count', 'get_dating_display']
     
     # Inline модели
     inlines = [ExhibitPhotoInline, DocumentInline, ExhibitHistoryInline]
@@ -77,7 +97,7 @@ class ExhibitAdmin(admin.ModelAdmin):
         }),
         ('📅 Историческая информация', {
             'fields': ['acquisition_date', 'acquisition_source',
-                      'creation_date', 'author', 'historical_context'],
+                      'creation_date', 'get_dating_display', 'author', 'historical_context'],
             'classes': ['collapse']
         }),
         ('📏 Физические характеристики', {
@@ -92,7 +112,7 @@ class ExhibitAdmin(admin.ModelAdmin):
         ('⚙️ Системная информация', {
             'fields': ['status', 'is_featured', 'created_at', 'updated_at',
                       'created_by', 'last_modified_by', 'get_photo_count',
-                      'get_document_count'],
+                      'get_document_count', 'view_count'],
             'classes': ['collapse']
         }),
     ]
@@ -105,12 +125,23 @@ class ExhibitAdmin(admin.ModelAdmin):
         return obj.get_document_count()
     get_document_count.short_description = 'Документов'
     
+    def get_dating_display(self, obj):
+        return obj.get_dating_display() or '—'
+    get_dating_display.short_description = 'Годы создания'
+    
     def save_model(self, request, obj, form, change):
         # Автоматическое заполнение created_by и last_modified_by
         if not obj.pk:
             obj.created_by = request.user
         obj.last_modified_by = request.user
         super().save_model(request, obj, form, change)
+    
+    def save_formset(self, request, form, formset, change):
+        super().save_formset(request, form, formset, change)
+        if formset.model is ExhibitPhoto:
+            for photo_form in formset.forms:
+                if 'photo' in photo_form.changed_data and photo_form.instance.pk:
+                    warn_about_duplicates(request, photo_form.instance)
 
 
 @admin.register(ExhibitPhoto)
@@ -119,7 +150,7 @@ class ExhibitPhotoAdmin(admin.ModelAdmin):
     list_filter = ['is_primary', 'uploaded_at']
     search_fields = ['exhibit__title', 'title', 'description']
     list_editable = ['is_primary']
-    readonly_fields = ['uploaded_at', 'uploaded_by']
+    readonly_fields = ['uploaded_at', 'uploaded_by', 'ahash', 'dhash', 'phash']
     
     def photo_preview(self, obj):
         if obj.photo:
@@ -132,14 +163,27 @@ class ExhibitPhotoAdmin(admin.ModelAdmin):
         if not obj.pk:
             obj.uploaded_by = request.user
         super().save_model(request, obj, form, change)
+        if 'photo' in form.changed_data:
+            warn_about_duplicates(request, obj)
 
 
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
-    list_display = ['exhibit', 'title', 'document_type', 'upload_date', 'uploaded_by']
-    list_filter = ['document_type', 'upload_date']
+    list_display = ['exhibit', 'title', 'document_type', 'upload_date', 'uploaded_by',
+                   'extraction_status', 'page_count']
+    list_filter = ['document_type', 'upload_date', 'extraction_status']
     search_fields = ['exhibit__title', 'title', 'description']
-    readonly_fields = ['upload_date', 'uploaded_by']
+    readonly_fields = ['upload_date', 'uploaded_by', 'extraction_status', 'page_count',
+                      'extracted_at', 'extraction_error']
+    actions = ['extract_text']
+    
+    @admin.action(description='Извлечь текст заново (в фоне)')
+    def extract_text(self, request, queryset):
+        ids = list(queryset.values_list('pk', flat=True))
+        queryset.update(extraction_status='pending')
+        for pk in ids:
+            documents.schedule(pk)
+        self.message_user(request, f"Поставлено в очередь документов: {len(ids)}")
     
     def save_model(self, request, obj, form, change):
         if not obj.pk:
@@ -157,4 +201,52 @@ class ExhibitHistoryAdmin(admin.ModelAdmin):
     date_hierarchy = 'changed_at'
     
     def has_add_permission(self, request):
-        return False
\ No newline at end of file
+        return False
+
+
+@admin.register(StocktakeSession)
+class StocktakeSessionAdmin(admin.ModelAdmin):
+    list_display = ['title', 'storage_location', 'status', 'started_at',
+                   'started_by', 'get_scan_count', 'get_links']
+    list_filter = ['status', 'started_at']
+    search_fields = ['title', 'storage_location']
+    readonly_fields = ['started_at', 'closed_at', 'started_by']
+    actions = ['close_sessions']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(scan_count=Count('scans'))
+    
+    def get_scan_count(self, obj):
+        return obj.scan_count
+    get_scan_count.short_description = 'Сканирований'
+    get_scan_count.admin_order_field = 'scan_count'
+    
+    def get_links(self, obj):
+        return format_html('<a href="{}">Сканировать</a> | <a href="{}">Отчет</a>',
+                          reverse('museum:stocktake_scan_page', kwargs={'pk': obj.pk}),
+                          reverse('museum:stocktake_report', kwargs={'pk': obj.pk}))
+    get_links.short_description = 'Действия'
+    
+    @admin.action(description='Завершить выбранные инвентаризации')
+    def close_sessions(self, request, queryset):
+        for session in queryset.filter(status='open'):
+            session.close()
+    
+    def save_model(self, request, obj, form, change):
+        if not obj.pk:
+            obj.started_by = request.user
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(CollectionStat)
+class CollectionStatAdmin(admin.ModelAdmin):
+    list_display = ['dimension', 'label', 'exhibit_count', 'estimated_total',
+                   'insurance_total', 'updated_at']
+    list_filter = ['dimension']
+    search_fields = ['label', 'key']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
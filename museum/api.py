@@ -0,0 +1,300 @@
+"""
+JSON API (v1) только для чтения: экспонаты, категории, фотографии, документы.
+
+Все ответы строятся через values(), без создания экземпляров моделей.
+Параметры запроса:
+    ?fields=title,author        - только нужные колонки (id добавляется всегда)
+    ?embed=category,photos      - вложенные связи (без N+1: один запрос на связь)
+    ?after=<cursor>&limit=50    - курсорная пагинация по id
+    ?ids=1,2,3                  - пакетная выборка по id
+    ?inventory_number=А-1,А-2   - пакетная выборка по инвентарным номерам
+"""
+import base64
+import binascii
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from django.views.decorators.http import require_safe
+
+from .models import Exhibit, Category, ExhibitPhoto, Document
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_BATCH_SIZE = 200
+
+
+# ==================== ОПИСАНИЕ РЕСУРСОВ ====================
+# embed: имя -> ('fk', поле внешнего ключа, поля) или ('reverse', модель, поле внешнего ключа, поля)
+RESOURCES = {
+    'exhibits': {
+        'model': Exhibit,
+        'filter': {'status': 'published'},
+        'fields': ('id', 'title', 'short_description', 'description',
+                   'inventory_number', 'catalog_number', 'category_id', 'tags',
+                   'acquisition_date', 'creation_date', 'year_from', 'year_to', 'author',
+                   'historical_context', 'size', 'weight', 'material', 'color',
+                   'is_featured', 'created_at', 'updated_at'),
+        'default_fields': ('id', 'title', 'short_description', 'inventory_number',
+                           'category_id', 'tags', 'updated_at'),
+        'batch_keys': ('inventory_number',),
+        'files': (),
+        'embed': {
+            'category': ('fk', 'category', ('id', 'name', 'icon')),
+            'photos': ('reverse', ExhibitPhoto, 'exhibit_id',
+                       ('id', 'photo', 'title', 'is_primary')),
+            'documents': ('reverse', Document, 'exhibit_id',
+                          ('id', 'document', 'title', 'document_type')),
+        },
+    },
+    'categories': {
+        'model': Category,
+        'filter': {},
+        'fields': ('id', 'name', 'description', 'parent_id', 'icon'),
+        'default_fields': ('id', 'name', 'parent_id', 'icon'),
+        'batch_keys': (),
+        'files': (),
+        'embed': {
+            'parent': ('fk', 'parent', ('id', 'name')),
+        },
+    },
+    'photos': {
+        'model': ExhibitPhoto,
+        'filter': {'exhibit__status': 'published'},
+        'fields': ('id', 'exhibit_id', 'photo', 'title', 'description',
+                   'is_primary', 'uploaded_at'),
+        'default_fields': ('id', 'exhibit_id', 'photo', 'title', 'is_primary'),
+        'batch_keys': (),
+        'files': ('photo',),
+        'embed': {
+            'exhibit': ('fk', 'exhibit', ('id', 'title', 'inventory_number')),
+        },
+    },
+    'documents': {
+        'model': Document,
+        'filter': {'exhibit__status': 'published'},
+        'fields': ('id', 'exhibit_id', 'document', 'title', 'document_type',
+                   'description', 'upload_date'),
+        'default_fields': ('id', 'exhibit_id', 'document', 'title', 'document_type'),
+        'batch_keys': (),
+        'files': ('document',),
+        'embed': {
+            'exhibit': ('fk', 'exhibit', ('id', 'title', 'inventory_number')),
+        },
+    },
+}
+
+
+class ApiError(Exception):
+    """Ошибка в параметрах запроса (ответ 400)"""
+
+
+# ==================== РАЗБОР ПАРАМЕТРОВ ====================
+def _split_param(request, name):
+    """Значения параметра: поддерживает и ?x=1,2 и ?x=1&x=2"""
+    values = []
+    for raw in request.GET.getlist(name):
+        values.extend(item.strip() for item in raw.split(',') if item.strip())
+    return values
+
+
+def _parse_fields(request, resource):
+    requested = _split_param(request, 'fields')
+    if not requested:
+        return list(resource['default_fields'])
+    unknown = set(requested) - set(resource['fields'])
+    if unknown:
+        raise ApiError(f"Неизвестные поля: {', '.join(sorted(unknown))}")
+    if 'id' not in requested:
+        requested.insert(0, 'id')
+    return requested
+
+
+def _parse_embed(request, resource):
+    requested = _split_param(request, 'embed')
+    unknown = set(requested) - set(resource['embed'])
+    if unknown:
+        raise ApiError(f"Неизвестные связи: {', '.join(sorted(unknown))}")
+    return requested
+
+
+def _parse_limit(request):
+    try:
+        limit = int(request.GET.get('limit', PAGE_SIZE))
+    except ValueError:
+        raise ApiError("limit должен быть числом")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def encode_cursor(pk):
+    return base64.urlsafe_b64encode(str(pk).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ApiError("Некорректный курсор")
+
+
+# ==================== СЕРИАЛИЗАЦИЯ ====================
+def _file_urls(model, rows, file_fields):
+    """Заменяет имена файлов на URL хранилища"""
+    for name in file_fields:
+        storage = model._meta.get_field(name).storage
+        for row in rows:
+            if name in row:
+                row[name] = storage.url(row[name]) if row[name] else None
+
+
+def _fetch_rows(queryset, resource, fields, embed):
+    """Выборка строк + вложенные связи; по одному запросу на каждую reverse-связь"""
+    model = resource['model']
+    fk_columns = {}
+    for name in embed:
+        spec = resource['embed'][name]
+        if spec[0] == 'fk':
+            fk_columns[name] = [f'{spec[1]}__{column}' for column in spec[2]]
+
+    columns = list(fields)
+    for extra in fk_columns.values():
+        columns.extend(extra)
+    rows = list(queryset.values(*columns))
+
+    # Связи "многие к одному" приходят одним JOIN'ом, раскладываем по вложенным объектам
+    for name, extra in fk_columns.items():
+        prefix_len = len(resource['embed'][name][1]) + 2
+        for row in rows:
+            nested = {column[prefix_len:]: row.pop(column) for column in extra}
+            row[name] = nested if nested.get('id') is not None else None
+
+    # Обратные связи: один запрос на связь для всей страницы
+    ids = [row['id'] for row in rows]
+    for name in embed:
+        spec = resource['embed'][name]
+        if spec[0] != 'reverse':
+            continue
+        _, related_model, fk_name, related_fields = spec
+        grouped = {pk: [] for pk in ids}
+        related_rows = list(
+            related_model.objects.filter(**{f'{fk_name}__in': ids})
+            .values(fk_name, *related_fields)
+        )
+        file_fields = [f.name for f in related_model._meta.concrete_fields
+                       if f.name in related_fields and hasattr(f, 'storage')]
+        _file_urls(related_model, related_rows, file_fields)
+        for related in related_rows:
+            grouped[related.pop(fk_name)].append(related)
+        for row in rows:
+            row[name] = grouped[row['id']]
+
+    _file_urls(model, rows, resource['files'])
+    return rows
+
+
+def _json_response(request, payload, status=200):
+    """JSON-ответ с сильным ETag; при совпадении If-None-Match - 304"""
+    body = json.dumps(payload, cls=DjangoJSONEncoder, ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+    etag = quote_etag(hashlib.sha256(body).hexdigest()[:32])
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if status == 200 and if_none_match:
+        etags = parse_etags(if_none_match)
+        if '*' in etags or etag in etags:
+            # 304 несет те же заголовки кэширования, что и полный ответ (RFC 9110, 15.4.5)
+            return _cache_headers(HttpResponseNotModified(), etag)
+
+    response = HttpResponse(body, status=status,
+                            content_type='application/json; charset=utf-8')
+    return _cache_headers(response, etag)
+
+
+def _cache_headers(response, etag):
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+
+def _error(message, status=400):
+    return JsonResponse({'error': message}, status=status,
+                        json_dumps_params={'ensure_ascii': False})
+
+
+# ==================== ПРЕДСТАВЛЕНИЯ ====================
+@require_safe
+def resource_list(request, resource):
+    """Список объектов ресурса: курсорная пагинация или пакетная выборка"""
+    spec = RESOURCES.get(resource)
+    if spec is None:
+        return _error("Ресурс не найден", status=404)
+
+    try:
+        fields = _parse_fields(request, spec)
+        embed = _parse_embed(request, spec)
+        queryset = spec['model'].objects.filter(**spec['filter']).order_by('pk')
+
+        # Пакетная выборка
+        batch = {'id': _split_param(request, 'ids')}
+        for key in spec['batch_keys']:
+            batch[key] = _split_param(request, key)
+        batch = {key: values for key, values in batch.items() if values}
+        if batch:
+            if sum(len(values) for values in batch.values()) > MAX_BATCH_SIZE:
+                raise ApiError(f"Не более {MAX_BATCH_SIZE} значений за запрос")
+            if len(batch) > 1:
+                raise ApiError("Укажите только один способ пакетной выборки")
+            if 'id' in batch:
+                try:
+                    batch['id'] = [int(pk) for pk in batch['id']]
+                except ValueError:
+                    raise ApiError("ids должны быть числами")
+            lookup = next(iter(batch))
+            queryset = queryset.filter(**{f'{lookup}__in': batch[lookup]})
+            select = fields if lookup in fields else fields + [lookup]
+            rows = _fetch_rows(queryset, spec, select, embed)
+            found = {row[lookup] for row in rows}
+            if lookup not in fields:
+                for row in rows:
+                    row.pop(lookup)
+            missing = [value for value in batch[lookup] if value not in found]
+            return _json_response(request, {'results': rows, 'missing': missing})
+
+        # Курсорная пагинация
+        limit = _parse_limit(request)
+        after = request.GET.get('after')
+        if after:
+            queryset = queryset.filter(pk__gt=decode_cursor(after))
+        rows = _fetch_rows(queryset[:limit + 1], spec, fields, embed)
+    except ApiError as exc:
+        return _error(str(exc))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['id'])
+    return _json_response(request, {'results': rows, 'next': next_cursor})
+
+
+@require_safe
+def resource_detail(request, resource, pk):
+    """Один объект ресурса"""
+    spec = RESOURCES.get(resource)
+    if spec is None:
+        return _error("Ресурс не найден", status=404)
+
+    try:
+        fields = _parse_fields(request, spec)
+        embed = _parse_embed(request, spec)
+    except ApiError as exc:
+        return _error(str(exc))
+
+    queryset = spec['model'].objects.filter(pk=pk, **spec['filter'])
+    rows = _fetch_rows(queryset, spec, fields, embed)
+    if not rows:
+        return _error("Объект не найден", status=404)
+    return _json_response(request, rows[0])
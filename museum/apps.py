@@ -3,4 +3,7 @@ from django.apps import AppConfig
 class MuseumConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'museum'
-    verbose_name = 'Музей'  # Это название будет в админке
\ No newline at end of file
+    verbose_name = 'Музей'  # Это название будет в админке
+
+    def ready(self):
+        from . import signals  # noqa: F401 - подключаем обработчики сигналов
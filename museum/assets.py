@@ -0,0 +1,309 @@
+"""
+Статические файлы сайта: сторонние библиотеки, сборка и раздача.
+
+Bootstrap и Font Awesome скачиваются командой build_assets в static/vendor
+(версии и контрольные суммы закреплены ниже), собственные CSS/JS сжимаются
+в static/dist. После collectstatic ManifestStaticFilesStorage дает файлам
+имена с хэшем содержимого, рядом кладутся .gz/.br, и serve_static отдает
+их с заголовком immutable - повторные визиты не делают запросов за статикой.
+
+Пока файлы не собраны, тег {% asset_tag %} подключает библиотеки с CDN,
+а ManifestStorage отдает ссылки без хэша (с предупреждением в журнале)
+вместо ошибки 500 на каждой странице.
+"""
+import gzip
+import hashlib
+import base64
+import logging
+import mimetypes
+import os
+import re
+import urllib.request
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import (
+    ManifestStaticFilesStorage, StaticFilesStorage, staticfiles_storage,
+)
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.html import format_html
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+BOOTSTRAP_VERSION = '5.3.0'
+FONTAWESOME_VERSION = '6.4.0'
+
+BOOTSTRAP_CDN = f'https://cdn.jsdelivr.net/npm/bootstrap@{BOOTSTRAP_VERSION}/dist'
+FONTAWESOME_CDN = f'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/{FONTAWESOME_VERSION}'
+FONTAWESOME_FONTS = ('fa-brands-400', 'fa-regular-400', 'fa-solid-900', 'fa-v4compatibility')
+
+# Файлы, подключаемые в шаблонах: имя -> (путь в static, CDN, integrity)
+ASSETS = {
+    'bootstrap.css': (
+        f'vendor/bootstrap/{BOOTSTRAP_VERSION}/css/bootstrap.min.css',
+        f'{BOOTSTRAP_CDN}/css/bootstrap.min.css',
+        'sha384-9ndCyUaIbzAi2FUVXJi0CjmCapSmO7SnpJef0486qhLnuZ2cdeRhO02iuK6FUUVM',
+    ),
+    'bootstrap.js': (
+        f'vendor/bootstrap/{BOOTSTRAP_VERSION}/js/bootstrap.bundle.min.js',
+        f'{BOOTSTRAP_CDN}/js/bootstrap.bundle.min.js',
+        'sha384-geWF76RCwLtnZ8qwWowPQNguL3RmwHVBC9FhGdlKrxdiJJigb/j/68SIy3Te4Bkz',
+    ),
+    'fontawesome.css': (
+        f'vendor/fontawesome/{FONTAWESOME_VERSION}/css/all.min.css',
+        f'{FONTAWESOME_CDN}/css/all.min.css',
+        'sha512-iecdLmaskl7CVkqkXNQ/ZH/XLlvWZOJyj7Yy7tcenmpD1ypASozpmT/E0iPtmFIB46ZmdtAc9eNBvH0H/ZpiBw==',
+    ),
+    # Собственные файлы: сжатая сборка, если есть, иначе исходник
+    'museum.css': ('dist/museum.min.css', 'css/museum.css', ''),
+    'museum.js': ('dist/museum.min.js', 'js/museum.js', ''),
+    'deepzoom.js': ('dist/deepzoom.min.js', 'js/deepzoom.js', ''),
+}
+
+# Что скачивает build_assets: (путь в static, URL, integrity или '')
+VENDOR_FILES = [
+    (path, url, integrity)
+    for path, url, integrity in ASSETS.values() if path.startswith('vendor/')
+] + [
+    (f'vendor/fontawesome/{FONTAWESOME_VERSION}/webfonts/{font}.{ext}',
+     f'{FONTAWESOME_CDN}/webfonts/{font}.{ext}', '')
+    for font in FONTAWESOME_FONTS for ext in ('woff2', 'ttf')
+]
+
+# Сборки собственных файлов: результат -> исходники (по порядку)
+BUNDLES = {
+    'dist/museum.min.css': ['css/museum.css'],
+    'dist/museum.min.js': ['js/museum.js'],
+    'dist/deepzoom.min.js': ['js/deepzoom.js'],
+}
+
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.map', '.ttf', '.html', '.xml'}
+MIN_COMPRESS_SIZE = 256
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+STATIC_MAX_AGE = 60 * 60
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+# Комментарий или строка в кавычках: строки при сжатии CSS не меняются
+CSS_TOKEN = re.compile(r'/\*.*?\*/|"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\'', re.S)
+
+logger = logging.getLogger(__name__)
+
+
+def source_dir():
+    """Каталог исходников статики (первый из STATICFILES_DIRS)"""
+    return Path(settings.STATICFILES_DIRS[0])
+
+
+# ==================== СТОРОННИЕ БИБЛИОТЕКИ ====================
+def check_integrity(content, integrity):
+    """Сверяет файл со значением integrity ('sha384-...') из SRI"""
+    algorithm, _, expected = integrity.partition('-')
+    digest = base64.b64encode(hashlib.new(algorithm, content).digest()).decode()
+    return digest == expected
+
+
+def _without_source_map(content):
+    # Карты исходников не скачиваются, а ManifestStaticFilesStorage требует их наличия
+    return re.sub(rb'\n?/[*/]# sourceMappingURL=[^\n]*', b'', content)
+
+
+def vendor(force=False, timeout=30):
+    """Скачивает библиотеки в static/vendor. Возвращает список скачанных путей."""
+    downloaded = []
+    for path, url, integrity in VENDOR_FILES:
+        target = source_dir() / path
+        if target.exists() and not force:
+            continue
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            content = response.read()
+        if integrity and not check_integrity(content, integrity):
+            raise ValueError(f"Контрольная сумма не совпала: {url}")
+        if path.endswith(('.css', '.js')):
+            content = _without_source_map(content)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(content)
+        downloaded.append(path)
+    return downloaded
+
+
+# ==================== СБОРКА ====================
+def _minify_css_code(text):
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    # Пробел после двоеточия убирается только в объявлениях ("{color: red" / ";margin: 0"):
+    # в селекторе "div :first-child" он значимый
+    text = re.sub(r'([{;][-\w]+):\s+', r'\1:', text)
+    return text.replace(';}', '}')
+
+
+def minify_css(text):
+    """Убирает комментарии и лишние пробелы; строки в кавычках остаются как есть"""
+    # Комментарии удаляются за один проход со строками: "/*" внутри строки - не комментарий
+    text = CSS_TOKEN.sub(lambda match: '' if match.group().startswith('/*') else match.group(),
+                         text)
+    parts = CSS_TOKEN.split(text)
+    strings = CSS_TOKEN.findall(text)
+    result = [_minify_css_code(parts[0])]
+    for string, code in zip(strings, parts[1:]):
+        result.extend((string, _minify_css_code(code)))
+    return ''.join(result).strip()
+
+
+def minify_js(text):
+    """
+    Сжатие JS через rjsmin (requirements.txt). Без него файл не меняется:
+    построчная чистка портит строки и шаблонные литералы, а размер при раздаче
+    все равно уменьшают .gz/.br.
+    """
+    try:
+        import rjsmin
+    except ImportError:
+        return text
+    return rjsmin.jsmin(text)
+
+
+def build_bundles():
+    """Собирает и сжимает собственные CSS/JS в static/dist"""
+    built = []
+    for target, sources in BUNDLES.items():
+        text = '\n'.join((source_dir() / source).read_text(encoding='utf-8') for source in sources)
+        text = minify_css(text) if target.endswith('.css') else minify_js(text)
+        path = source_dir() / target
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text + '\n', encoding='utf-8')
+        built.append(target)
+    return built
+
+
+def has_brotli():
+    try:
+        import brotli
+    except ImportError:
+        return False
+    return brotli is not None
+
+
+def precompress(root):
+    """
+    Кладет рядом с файлами STATIC_ROOT версии .gz и .br. Пакет Brotli - в
+    requirements.txt; без него создаются только .gz (build_assets предупреждает).
+    """
+    brotli = None
+    if has_brotli():
+        import brotli
+
+    count = 0
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = Path(directory) / name
+            if path.suffix not in COMPRESSIBLE or path.stat().st_size < MIN_COMPRESS_SIZE:
+                continue
+            content = path.read_bytes()
+            variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                variants.append(('.br', brotli.compress(content, quality=11)))
+            for suffix, compressed in variants:
+                if len(compressed) < len(content):
+                    Path(f'{path}{suffix}').write_bytes(compressed)
+                    count += 1
+    return count
+
+
+# ==================== ПОДКЛЮЧЕНИЕ В ШАБЛОНАХ ====================
+class ManifestStorage(ManifestStaticFilesStorage):
+    """
+    Статика с хэшем в имени (STORAGES в продакшене). Файла нет в манифесте
+    (collectstatic не запускали или файл добавлен после) - ссылка без хэша
+    и предупреждение в журнале, а не ошибка 500 на каждой странице.
+    """
+
+    def url(self, name, force=False):
+        try:
+            return super().url(name, force)
+        except ValueError:
+            if name not in _unhashed:
+                _unhashed.add(name)
+                logger.warning("Файла %s нет в манифесте статики - запустите "
+                               "python manage.py build_assets", name)
+            return StaticFilesStorage.url(self, name)
+
+
+_unhashed = set()
+_available = {}
+
+
+def _is_available(path):
+    """Есть ли файл среди собранной (или, в DEBUG, исходной) статики"""
+    if settings.DEBUG:
+        return finders.find(path) is not None
+    if path not in _available:
+        try:
+            staticfiles_storage.url(path)
+        except ValueError:
+            # Файла нет в манифесте (не был собран)
+            _available[path] = False
+        else:
+            _available[path] = path not in _unhashed and staticfiles_storage.exists(path)
+    return _available[path]
+
+
+def asset_html(name):
+    """<link>/<script> для файла из ASSETS: локальный, если собран, иначе CDN"""
+    path, fallback, integrity = ASSETS[name]
+    if _is_available(path):
+        url, attrs = staticfiles_storage.url(path), ''
+    elif fallback.startswith('https://'):
+        url, attrs = fallback, format_html(' integrity="{}" crossorigin="anonymous"', integrity)
+    else:
+        url, attrs = staticfiles_storage.url(fallback), ''
+    if name.endswith('.css'):
+        return format_html('<link rel="stylesheet" href="{}"{}>', url, attrs)
+    return format_html('<script src="{}"{}></script>', url, attrs)
+
+
+# ==================== РАЗДАЧА ====================
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def _accepted_encodings(request):
+    accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    return {part.split(';')[0].strip() for part in accepted.split(',')}
+
+
+def serve_static(request, path):
+    """
+    Раздача STATIC_ROOT: предварительно сжатые версии по Accept-Encoding,
+    файлы с хэшем в имени кэшируются браузером навсегда (immutable).
+    """
+    try:
+        fullpath = Path(safe_join(settings.STATIC_ROOT, path))
+    except ValueError:
+        raise Http404
+    if not fullpath.is_file():
+        raise Http404
+
+    stat = fullpath.stat()
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        content_type, _ = mimetypes.guess_type(fullpath.name)
+        served, encoding = fullpath, None
+        accepted = _accepted_encodings(request)
+        for name, suffix in ENCODINGS:
+            candidate = fullpath.with_name(fullpath.name + suffix)
+            if name in accepted and candidate.is_file():
+                served, encoding = candidate, name
+                break
+        response = FileResponse(served.open('rb'),
+                                content_type=content_type or 'application/octet-stream')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Last-Modified'] = http_date(stat.st_mtime)
+
+    response.headers['Vary'] = 'Accept-Encoding'
+    if HASHED_NAME.search(fullpath.name):
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = f'public, max-age={STATIC_MAX_AGE}'
+    return response
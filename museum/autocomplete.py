@@ -0,0 +1,260 @@
+"""
+Автодополнение для строки поиска.
+
+Префиксный индекс - отсортированный список (ключ, подсказка), поиск через bisect.
+Индекс строится лениво один раз на воркер и обновляется точечно из сигналов
+сохранения. Изменения записываются в журнал в общем кэше: версия - номер
+последней записи, запись - id измененного экспоната. Воркер, отставший на
+несколько версий, перечитывает только эти экспонаты; полностью индекс
+перестраивается, если журнал неполон (кэш очищен, записи истекли) или
+изменений слишком много.
+"""
+import bisect
+import heapq
+import threading
+
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from . import tenants
+from .db_routers import use_primary
+from .facets import split_tags
+from .models import Exhibit, Category
+
+VERSION_KEY = 'autocomplete:version'
+CHANGE_KEY = 'autocomplete:change:%d'
+CHANGE_TIMEOUT = 60 * 60
+MAX_REPLAY = 500       # изменений, после которых дешевле перестроить индекс
+FULL_REBUILD = 0       # запись журнала: перестроить индекс целиком
+MIN_WORD_LENGTH = 2
+SHORT_PREFIX = 2       # выдача для коротких префиксов (много совпадений) запоминается
+KEY_END = chr(0x10FFFF)
+
+# Порядок групп в выдаче
+KIND_ORDER = {'exhibit': 0, 'inventory': 1, 'category': 2, 'author': 3, 'tag': 4}
+
+
+def normalize(value):
+    return ' '.join(value.lower().replace('ё', 'е').split())
+
+
+# ==================== ИНДЕКС ====================
+class PrefixIndex:
+    """Отсортированный массив ключей с точечным добавлением и удалением"""
+
+    def __init__(self):
+        self.keys = []           # [(нормализованный ключ, подсказка)]
+        self.suggestions = {}    # подсказка -> {'label', 'ids', 'keys': {ключ: число экспонатов}}
+        self.by_exhibit = {}     # id экспоната -> {(ключ, подсказка)}
+        self.short_results = {}  # (короткий префикс, limit) -> выдача
+
+    @staticmethod
+    def _entries(row, category_names):
+        """Ключи и подсказки одного экспоната"""
+        pk = row['id']
+        entries = []
+        title = normalize(row['title'])
+        if title:
+            entries.append((title, ('exhibit', pk), row['title']))
+            for word in title.split()[1:]:
+                if len(word) >= MIN_WORD_LENGTH:
+                    entries.append((word, ('exhibit', pk), row['title']))
+        if row['inventory_number']:
+            entries.append((normalize(row['inventory_number']), ('inventory', pk),
+                            f"{row['inventory_number']} - {row['title']}"))
+        if row['author']:
+            author = normalize(row['author'])
+            for word in author.split():
+                if len(word) >= MIN_WORD_LENGTH:
+                    entries.append((word, ('author', row['author']), row['author']))
+        for tag in split_tags(row['tags']):
+            entries.append((normalize(tag), ('tag', tag), tag))
+        if row['category_id'] in category_names:
+            name = category_names[row['category_id']]
+            entries.append((normalize(name), ('category', row['category_id']), name))
+        return entries
+
+    def add(self, row, category_names, sort=True):
+        self.short_results = {}
+        contributed = set()
+        for key, suggestion, label in self._entries(row, category_names):
+            if (key, suggestion) in contributed:
+                continue
+            contributed.add((key, suggestion))
+            info = self.suggestions.setdefault(
+                suggestion, {'label': label, 'ids': set(), 'keys': {}}
+            )
+            info['ids'].add(row['id'])
+            # Один ключ может приходить от нескольких экспонатов (общий тег, автор)
+            count = info['keys'].get(key, 0)
+            info['keys'][key] = count + 1
+            if count == 0:
+                if sort:
+                    bisect.insort(self.keys, (key, suggestion))
+                else:
+                    self.keys.append((key, suggestion))
+        self.by_exhibit[row['id']] = contributed
+
+    def remove(self, pk):
+        self.short_results = {}
+        contributed = self.by_exhibit.pop(pk, ())
+        for key, suggestion in contributed:
+            info = self.suggestions[suggestion]
+            info['keys'][key] -= 1
+            if info['keys'][key] == 0:
+                del info['keys'][key]
+                position = bisect.bisect_left(self.keys, (key, suggestion))
+                if position < len(self.keys) and self.keys[position] == (key, suggestion):
+                    del self.keys[position]
+        for suggestion in {suggestion for _, suggestion in contributed}:
+            info = self.suggestions[suggestion]
+            info['ids'].discard(pk)
+            if not info['ids']:
+                del self.suggestions[suggestion]
+
+    def _rank(self, item):
+        suggestion, exact = item
+        info = self.suggestions[suggestion]
+        return not exact, KIND_ORDER[suggestion[0]], -len(info['ids']), info['label']
+
+    def search(self, prefix, limit):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        short = len(prefix) <= SHORT_PREFIX
+        if short and (prefix, limit) in self.short_results:
+            return self.short_results[(prefix, limit)]
+        # Ранжируются все ключи с этим префиксом: границы диапазона - через bisect
+        start = bisect.bisect_left(self.keys, (prefix,))
+        end = bisect.bisect_left(self.keys, (prefix + KEY_END,), start)
+        found = {}
+        for position in range(start, end):
+            key, suggestion = self.keys[position]
+            found[suggestion] = found.get(suggestion, False) or key == prefix
+        results = [(suggestion, self.suggestions[suggestion]['label'])
+                   for suggestion, _ in heapq.nsmallest(limit, found.items(), key=self._rank)]
+        if short:
+            self.short_results[(prefix, limit)] = results
+        return results
+
+
+FIELDS = ('id', 'title', 'inventory_number', 'author', 'tags', 'category_id')
+
+_lock = threading.Lock()
+
+
+def _state():
+    """Индекс и его версия в памяти процесса (отдельно для каждого музея)"""
+    state = tenants.local('autocomplete')
+    state.setdefault('version', None)
+    state.setdefault('index', None)
+    return state
+
+
+def _category_names():
+    return dict(Category.objects.values_list('id', 'name'))
+
+
+@use_primary()
+def _build():
+    index = PrefixIndex()
+    names = _category_names()
+    for row in Exhibit.objects.filter(status='published').values(*FIELDS).iterator():
+        index.add(row, names, sort=False)
+    index.keys.sort()
+    return index
+
+
+def _get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def _bump_version():
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
+        return 2
+
+
+def _record(change):
+    """Запись в журнал: id экспоната или FULL_REBUILD. Возвращает ее версию."""
+    version = _bump_version()
+    cache.set(CHANGE_KEY % version, change, CHANGE_TIMEOUT)
+    return version
+
+
+@use_primary()
+def _apply(index, exhibit_ids):
+    """Перечитывает экспонаты из базы и заменяет их ключи в индексе"""
+    rows = {row['id']: row for row in Exhibit.objects.filter(
+        pk__in=exhibit_ids, status='published').values(*FIELDS)}
+    names = _category_names() if rows else {}
+    for pk in exhibit_ids:
+        index.remove(pk)
+        if pk in rows:
+            index.add(rows[pk], names)
+
+
+def _replay(state, version):
+    """Применяет изменения из журнала после локальной версии; False - нужна перестройка"""
+    local_version = state['version']
+    if state['index'] is None or local_version is None \
+            or not 0 < version - local_version <= MAX_REPLAY:
+        return False
+    keys = [CHANGE_KEY % number for number in range(local_version + 1, version + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) < len(keys) or FULL_REBUILD in changes.values():
+        return False
+    _apply(state['index'], set(changes.values()))
+    return True
+
+
+def get_index():
+    version = _get_version()
+    state = _state()
+    if state['version'] != version or state['index'] is None:
+        with _lock:
+            if state['version'] != version or state['index'] is None:
+                if not _replay(state, version):
+                    state['index'] = _build()
+                state['version'] = version
+    return state['index']
+
+
+def refresh_exhibit(exhibit_id):
+    """Точечное обновление после сохранения/удаления экспоната"""
+    state = _state()
+    with _lock:
+        version = _record(exhibit_id)
+        # Без чужих изменений между версиями - сразу применяем свое,
+        # иначе журнал проиграется целиком при следующем запросе
+        if state['index'] is not None and state['version'] == version - 1:
+            _apply(state['index'], {exhibit_id})
+            state['version'] = version
+
+
+def invalidate():
+    """Полный сброс индекса во всех воркерах (например, после переименования категории)"""
+    _record(FULL_REBUILD)
+
+
+# ==================== ПОИСК ====================
+def suggest(query, limit=10):
+    """Подсказки для строки поиска: [{'label', 'kind', 'url'}]"""
+    list_url = reverse('museum:exhibit_list')
+    results = []
+    for (kind, value), label in get_index().search(query, limit):
+        if kind in ('exhibit', 'inventory'):
+            url = reverse('museum:exhibit_detail', kwargs={'pk': value})
+        elif kind == 'category':
+            url = f'{list_url}?category={value}'
+        else:
+            url = f'{list_url}?{urlencode({kind: value})}'
+        results.append({'label': label, 'kind': kind, 'url': url})
+    return results
@@ -0,0 +1,164 @@
+"""
+Разбор свободной датировки экспоната (поле creation_date) в диапазон лет.
+
+Понимает типичные записи:
+    1941, 1941 г., 12.05.1941, май 1941 года     -> 1941-1941
+    1941-1945, с 1941 по 1945 гг., 1941/42       -> 1941-1945, 1941-1942
+    около 1941, ок. 1941 г., ~1941, circa 1941   -> 1936-1946
+    1940-е, 40-е годы, начало 1940-х             -> 1940-1949, 1940-1942
+    30-40-е годы XX века, 1930-1940-е, 60-е гг. XIX в. -> 1930-1949, 1860-1869
+    XX век, 20 в., начало XX века, XVIII-XIX вв. -> 1900-1999, 1900-1932, 1700-1899
+    первая половина XX века, II половина XX века, вторая половина 1950-х
+    нач. XX в., сер. XIX в., кон. 1980-х, II пол. XX в. (сокращения)
+Нераспознанная строка дает (None, None). Результат хранится в индексируемых
+полях year_from/year_to и используется для запросов по пересечению периодов.
+"""
+import re
+from datetime import date
+
+CIRCA_MARGIN = 5      # лет в обе стороны для "около"
+MIN_YEAR = 1000       # четырехзначные годы вне диапазона - не годы (номера, размеры)
+
+ROMAN = {'I': 1, 'V': 5, 'X': 10, 'L': 50, 'C': 100}
+
+# Уточнение внутри десятилетия или века: доля периода (начало, конец)
+PARTS = [
+    (r'(?:перв\w*|1(?:-?\w+)?|(?<!\w)I)\s+(?:половин\w*|пол\.)', (0, 0.5)),
+    (r'(?:втор\w*|2(?:-?\w+)?|(?<!\w)II)\s+(?:половин\w*|пол\.)', (0.5, 1)),
+    (r'перв\w*\s+четверт\w*', (0, 0.25)),
+    (r'последн\w*\s+четверт\w*', (0.75, 1)),
+    (r'нач(?:ал\w*|\.)|ранн\w*', (0, 0.33)),
+    (r'сер(?:един\w*|\.)', (0.33, 0.67)),
+    (r'кон(?:\w*|\.)|поздн\w*', (0.67, 1)),
+]
+
+PART = '|'.join(f'(?:{pattern})' for pattern, _ in PARTS)
+ROMAN_NUMBER = r'[IVXLC]+'
+
+CENTURY = re.compile(
+    rf'(?:(?P<part>{PART})\s+)?(?P<number>{ROMAN_NUMBER}|\d{{1,2}})(?:\s*-?\s*(?:й|ый|ого|го))?'
+    rf'\s*(?:-\s*(?:(?P<part_to>{PART})\s+)?(?P<number_to>{ROMAN_NUMBER}|\d{{1,2}})\s*)?'
+    rf'(?:век\w*|в\.|вв\.?)',
+    re.IGNORECASE,
+)
+DECADE_SUFFIX = r'\s*-?\s*(?:е|х|ые|ых)\b'
+# "1940-е", "30-40-е", "1930-е - 1940-е"; век после двузначных десятилетий -
+# "60-е гг. XIX в." (без века - XX)
+DECADE = re.compile(
+    rf'(?:(?P<part>{PART})\s+)?(?P<year>\d{{4}}|\d0)(?:{DECADE_SUFFIX})?'
+    rf'(?:\s*-\s*(?P<year_to>\d{{4}}|\d0))?{DECADE_SUFFIX}'
+    rf'(?:\s*(?:год\w*|гг\.?))?'
+    rf'(?:\s*(?P<century>{ROMAN_NUMBER}|\d{{1,2}})(?:\s*-?\s*(?:й|ый|ого|го))?\s*(?:век\w*|в\.))?',
+    re.IGNORECASE,
+)
+YEAR = re.compile(r'(?<![\d.])(?:\d{1,2}[./]\d{1,2}[./])?(?P<year>\d{4})(?:/(?P<short>\d{2}))?(?!\d)')
+CIRCA = re.compile(r'(?:^|\s)(?:около|ок\.|примерно|приблизительно|circa|ca?\.)\s*|~\s*', re.IGNORECASE)
+
+
+def _roman(value):
+    value = value.upper()
+    total = 0
+    for current, following in zip(value, value[1:] + ' '):
+        number = ROMAN[current]
+        total += -number if ROMAN.get(following, 0) > number else number
+    return total
+
+
+def _century_number(value):
+    return int(value) if value.isdigit() else _roman(value)
+
+
+def _part(text, start, end):
+    """Сужает период [start, end] по словам "начало", "вторая половина" и т.п."""
+    if not text:
+        return start, end
+    length = end - start + 1
+    for pattern, (low, high) in PARTS:
+        if re.fullmatch(pattern, text, re.IGNORECASE):
+            return start + round(length * low), start + round(length * high) - 1
+    return start, end
+
+
+def _decade_year(value, century):
+    """Первый год десятилетия: "1940" или "40" (век - из записи, иначе XX)"""
+    year = int(value)
+    if year < 100:
+        year += (century - 1) * 100 if century else 1900
+    return year
+
+
+def _periods(text):
+    """Все периоды, упомянутые в строке: [(позиция, с, по)]"""
+    periods = []
+    taken = []
+
+    def free(match):
+        return all(match.end() <= a or match.start() >= b for a, b in taken)
+
+    # Десятилетия - первыми: "30-40-е годы XX века" не должно стать всем веком
+    for match in DECADE.finditer(text):
+        century = _century_number(match['century']) if match['century'] else None
+        first = _decade_year(match['year'], century)
+        last = _decade_year(match['year_to'], century) if match['year_to'] else first
+        if first % 10 or last % 10 or not MIN_YEAR <= first <= last:
+            continue
+        start, end = _part(match['part'], first, last + 9)
+        periods.append((match.start(), start, end))
+        taken.append(match.span())
+
+    for match in CENTURY.finditer(text):
+        if not free(match):
+            continue
+        first = _century_number(match['number'])
+        last = _century_number(match['number_to']) if match['number_to'] else first
+        if not 1 <= first <= last <= 21:
+            continue
+        start = _part(match['part'], (first - 1) * 100, first * 100 - 1)[0]
+        end = _part(match['part_to'] or (match['part'] if first == last else None),
+                    (last - 1) * 100, last * 100 - 1)[1]
+        periods.append((match.start(), start, end))
+        taken.append(match.span())
+
+    for match in YEAR.finditer(text):
+        if not free(match):
+            continue
+        year = int(match['year'])
+        if not MIN_YEAR <= year <= date.today().year:
+            continue
+        end = year
+        if match['short']:
+            end = year // 100 * 100 + int(match['short'])
+            end = end if end >= year else end + 100
+        periods.append((match.start(), year, end))
+        taken.append(match.span())
+
+    return sorted(periods)
+
+
+def parse(text):
+    """Строка датировки -> (год начала, год конца) или (None, None)"""
+    text = re.sub(r'[–—−]', '-', (text or '').strip())
+    if not text:
+        return None, None
+    # "до 1917", "после войны" - границу с одной стороны не угадать
+    if re.match(r'(?:до|после|не\s+позднее|не\s+ранее)\b', text, re.IGNORECASE):
+        return None, None
+    periods = _periods(text)
+    if not periods:
+        return None, None
+    start = min(period[1] for period in periods)
+    end = max(period[2] for period in periods)
+    if len(periods) == 1 and CIRCA.search(text):
+        start, end = start - CIRCA_MARGIN, end + CIRCA_MARGIN
+    return start, end
+
+
+def decades(start, end):
+    """Десятилетия, которые задевает период: 1938-1941 -> [1930, 1940]"""
+    return list(range(start // 10 * 10, end // 10 * 10 + 1, 10))
+
+
+def format_range(start, end):
+    if start is None:
+        return ''
+    return str(start) if start == end else f'{start}–{end}'
@@ -0,0 +1,167 @@
+"""
+Маршрутизация запросов к базе.
+
+Запросы музея-арендатора (museum/tenants.py) идут в его базу - TenantRouter
+стоит в DATABASE_ROUTERS первым. Для основного сайта чтение публичных
+страниц - с реплик, все записи - в основную базу.
+
+Запрос читает с основной базы ("закреплен"), если:
+  - это не GET/HEAD/OPTIONS (форма, загрузка файла);
+  - это админка;
+  - посетитель сам что-то записал в последние MUSEUM_PRIMARY_PIN_SECONDS секунд
+    (cookie), чтобы он сразу видел свои изменения.
+Вне запроса (команды управления, shell, фоновые потоки) чтение тоже с основной
+базы: там обычно читают, чтобы потом записать. Внутри запроса с основной базы
+читают блоки use_primary() - перестройка индексов под новой версией (иначе
+в кэш попадет индекс с отстающей реплики) и пересчеты перед записью.
+Реплика, отстающая больше MUSEUM_REPLICA_MAX_LAG секунд, временно не используется.
+"""
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from . import tenants
+
+PIN_COOKIE = 'museum_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+LAG_CHECK_INTERVAL = 2  # сек между проверками отставания одной реплики
+
+# Служебные приложения всегда работают с основной базой (сессии, права)
+PRIMARY_APPS = {'auth', 'sessions', 'admin', 'contenttypes'}
+
+# Значение на время запроса задает ReplicaPinningMiddleware; вне запроса - основная база
+_pinned = contextvars.ContextVar('museum_db_pinned', default=True)
+_lag_cache = {}
+_lag_lock = threading.Lock()
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica_')]
+
+
+@contextmanager
+def use_primary():
+    """Читать с основной базы внутри блока (или функции - как декоратор)"""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+# ==================== ОТСТАВАНИЕ РЕПЛИК ====================
+def _sqlite_mtime(path):
+    """Время последнего изменения файла базы с учетом WAL"""
+    times = [os.path.getmtime(name) for name in (path, f'{path}-wal') if os.path.exists(name)]
+    return max(times) if times else 0
+
+
+def sync_marker(path):
+    """Файл с временем последней синхронизации SQLite-реплики"""
+    return f'{path}.synced'
+
+
+def measure_lag(alias):
+    """Отставание реплики в секундах (None - реплика недоступна)"""
+    connection = connections[alias]
+    try:
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+                    "THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+                )
+                lag = cursor.fetchone()[0]
+                return float(lag or 0)
+        if connection.vendor == 'sqlite':
+            # Копия SQLite-файла (команда sync_sqlite_replicas). Если основная база
+            # менялась после синхронизации, в реплике может не быть записей, сделанных
+            # с момента синхронизации, - это время и есть отставание (худший случай)
+            primary = _sqlite_mtime(str(connections[DEFAULT_DB_ALIAS].settings_dict['NAME']))
+            with open(sync_marker(connection.settings_dict['NAME'])) as marker:
+                synced_at = float(marker.read())
+            if primary <= synced_at:
+                return 0.0
+            return max(0.0, time.time() - synced_at)
+    except (DatabaseError, OSError, ValueError):
+        return None
+    return 0.0
+
+
+def is_healthy(alias):
+    """Реплика доступна и отстает не больше допустимого (проверка кэшируется)"""
+    now = time.monotonic()
+    checked = _lag_cache.get(alias)
+    if checked is None or now - checked[0] > LAG_CHECK_INTERVAL:
+        with _lag_lock:
+            checked = _lag_cache.get(alias)
+            if checked is None or now - checked[0] > LAG_CHECK_INTERVAL:
+                lag = measure_lag(alias)
+                healthy = lag is not None and lag <= settings.MUSEUM_REPLICA_MAX_LAG
+                checked = (now, healthy)
+                _lag_cache[alias] = checked
+    return checked[1]
+
+
+# ==================== РОУТЕРЫ ====================
+class TenantRouter:
+    """Чтение и запись музея-арендатора - в его базу (без музея решает следующий роутер)"""
+
+    def db_for_read(self, model, **hints):
+        return tenants.database()
+
+    def db_for_write(self, model, **hints):
+        return tenants.database()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _pinned.get() or model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+        healthy = [alias for alias in replica_aliases() if is_healthy(alias)]
+        if not healthy:
+            return DEFAULT_DB_ALIAS
+        return random.choice(healthy)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему вместе с данными от основной базы
+        return db == DEFAULT_DB_ALIAS
+
+
+# ==================== MIDDLEWARE ====================
+class ReplicaPinningMiddleware:
+    """Закрепляет запрос за основной базой, когда нужны свежие данные"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        writes = request.method not in SAFE_METHODS
+        pin = (writes
+               or request.path.startswith('/admin/')
+               or PIN_COOKIE in request.COOKIES)
+        token = _pinned.set(pin)
+        try:
+            response = self.get_response(request)
+        finally:
+            _pinned.reset(token)
+
+        if writes and response.status_code < 500:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.MUSEUM_PRIMARY_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
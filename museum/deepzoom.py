@@ -0,0 +1,595 @@
+"""
+Пирамиды тайлов (формат Deep Zoom, DZI) для больших фотографий экспонатов.
+
+Вместо оригинала на десятки мегабайт браузер загружает только видимые
+тайлы нужного уровня. Пирамида создается в фоне по первому запросу тайла:
+пока ее нет, тайл отвечает 503 с Retry-After, а просмотрщик показывает
+уменьшенную копию и повторяет запрос. Уровни режутся горизонтальными
+полосами высотой в тайл, каждая полоса масштабируется отдельно.
+Готовые тайлы лежат на диске (MEDIA_ROOT/tiles музея) и отдаются с заголовком
+immutable: в URL входит версия, которая меняется при замене файла.
+
+Память ограничена:
+  - с pyvips (если установлен) источник читается libvips по областям,
+    полноразмерный уровень доступен для любых размеров и форматов;
+  - с Pillow источник декодируется один раз на всю пирамиду: JPEG - сразу
+    уменьшенным (draft, до 1/8), остальные форматы - целиком, если в них не больше
+    MAX_DECODE_PIXELS пикселей, а файлы без сжатия (TIFF, BMP) - полосами.
+    Крупные уровни масштабируются из строк источника, мелкие уровни и копии -
+    из уменьшенной копии (не больше OVERVIEW_PIXELS), которая собирается
+    полоса за полосой: в памяти не бывает больше полосы источника.
+    Уровни, для которых пришлось бы декодировать больше, не создаются -
+    пирамида заканчивается на меньшем разрешении; большие сжатые PNG/TIFF
+    без pyvips открываются как обычные фото.
+Ограничение Image.MAX_IMAGE_PIXELS здесь не применяется - декодирование
+ограничено этим модулем, поэтому большие JPEG-сканы тоже получают копии и тайлы.
+"""
+import functools
+import hashlib
+import logging
+import math
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseRedirect
+from django.shortcuts import get_object_or_404
+from django.utils.cache import add_never_cache_headers, patch_cache_control
+from django.views.decorators.http import require_safe
+from PIL import Image, ImageMode
+
+from . import tenants
+from .models import ExhibitPhoto
+
+logger = logging.getLogger(__name__)
+
+TILE_SIZE = 254
+OVERLAP = 1
+TILE_FORMAT = 'jpg'
+QUALITY = 85
+MIN_ZOOM_SIZE = 2000                 # фото меньше этого открываются как обычно
+MAX_DECODE_PIXELS = 40_000_000       # ~120 МБ RGB при декодировании Pillow
+BAND_PIXELS = 4_000_000              # пикселей в одной полосе файла без сжатия
+OVERVIEW_PIXELS = 4_000_000          # уменьшенная копия источника для мелких уровней
+PREVIEW_SIZES = (160, 480, 1200)     # миниатюра, карточка в списке, главное фото на странице
+JPEG_MAX_REDUCE = 8
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+RENDER_WORKERS = 1                   # пирамид одновременно на процесс (память)
+ZOOMABLE_TIMEOUT = 60 * 60 * 24 * 30  # сек; ключ с версией файла - замена файла не ждет
+RETRY_AFTER = 2                      # сек: когда повторить запрос тайла, пока пирамида строится
+
+# Ошибки чтения файла: пирамида и копии не создаются
+READ_ERRORS = (OSError, SyntaxError, ValueError, Image.DecompressionBombError)
+
+_locks = {}                          # ключ -> [блокировка, число ожидающих]
+_locks_lock = threading.Lock()
+_rendering = set()
+_executor = None
+
+
+@contextmanager
+def _locked(key):
+    """Блокировка по ключу; освободившаяся удаляется из словаря"""
+    with _locks_lock:
+        entry = _locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _locks_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _locks[key]
+
+
+@functools.cache
+def has_vips():
+    try:
+        import pyvips
+    except (ImportError, OSError):
+        return False
+    return pyvips is not None
+
+
+def version(photo):
+    """Версия файла фото: новый файл - новые URL тайлов"""
+    return hashlib.sha1(photo.photo.name.encode()).hexdigest()[:12]
+
+
+def tiles_dir(photo):
+    return tenants.media_root() / 'tiles' / str(photo.pk) / version(photo)
+
+
+def _write(path, save):
+    """Атомарная запись: параллельный запрос не увидит недописанный файл"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            save(file)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+# ==================== ЧТЕНИЕ ИСТОЧНИКА (PILLOW) ====================
+def _open(path):
+    """
+    Открывает файл без проверки Image.MAX_IMAGE_PIXELS: открытие читает только
+    заголовок, а сколько декодировать, решает PillowSource
+    """
+    image_format = Image.registered_extensions().get(os.path.splitext(str(path))[1].lower())
+    if image_format in Image.OPEN:
+        factory, _ = Image.OPEN[image_format]
+        try:
+            return factory(path)
+        except SyntaxError:
+            # Расширение не соответствует содержимому
+            pass
+    return Image.open(path)
+
+
+def _raw_stride(rawmode, width):
+    """Байт в строке несжатых данных (None - формат строки неизвестен)"""
+    if rawmode == '1':
+        return (width + 7) // 8
+    try:
+        mode = ImageMode.getmode(rawmode)
+    except KeyError:
+        return None
+    return width * len(mode.bands) * int(mode.typestr[-1])
+
+
+def _band_tiles(image):
+    """
+    Части файла, которые декодируются независимо: полосы TIFF или
+    несжатые данные, нарезанные по BAND_PIXELS. None - файл читается только целиком.
+    """
+    if len(image.tile) > 1:
+        return list(image.tile)
+    if len(image.tile) != 1 or image.tile[0].codec_name != 'raw':
+        return None
+    tile = image.tile[0]
+    x0, y0, x1, y1 = tile.extents
+    args = tile.args if isinstance(tile.args, tuple) else (tile.args, 0, 1)
+    rawmode, stride, orientation = (tuple(args) + (0, 1))[:3]
+    stride = stride or _raw_stride(rawmode, x1 - x0)
+    if not stride:
+        return None
+    rows = max(1, BAND_PIXELS // (x1 - x0))
+    tiles = []
+    for top in range(y0, y1, rows):
+        bottom = min(y1, top + rows)
+        # Строки снизу вверх (BMP): полоса лежит в файле ближе к началу, чем верхние
+        first = top - y0 if orientation >= 0 else y1 - bottom
+        tiles.append(tile._replace(extents=(x0, top, x1, bottom),
+                                   offset=tile.offset + first * stride,
+                                   args=(rawmode, stride, orientation)))
+    return tiles
+
+
+class PillowSource:
+    """
+    Источник для Pillow: декодируется один раз целиком (JPEG - сразу уменьшенным
+    до размера size) или читается полосами. size - размер после draft.
+    """
+
+    def __init__(self, path, jpeg, size=None):
+        self.path = path
+        self.image = None
+        self.tiles = None
+        self.overview = None
+        with _open(path) as image:
+            if jpeg and size:
+                image.draft('RGB', size)
+            self.size = image.size
+            if image.width * image.height <= MAX_DECODE_PIXELS:
+                self.image = image.convert('RGB')
+            else:
+                self.tiles = _band_tiles(image)
+                if self.tiles is None:
+                    raise ValueError(f"{path}: слишком большой файл без pyvips")
+
+    @classmethod
+    def can_open(cls, path, jpeg):
+        """Уложится ли чтение файла в ограничение памяти (для JPEG - с draft до 1/8)"""
+        with _open(path) as image:
+            pixels = image.width * image.height
+            if jpeg:
+                return pixels / JPEG_MAX_REDUCE ** 2 <= MAX_DECODE_PIXELS
+            return pixels <= MAX_DECODE_PIXELS or _band_tiles(image) is not None
+
+    def close(self):
+        for image in (self.image, self.overview):
+            if image is not None:
+                image.close()
+
+    def _rows(self, top, bottom):
+        """Строки [top, bottom) (или чуть больше - до границ полос) и первая из них"""
+        if self.image is not None:
+            return self.image, 0
+        tiles = [tile for tile in self.tiles if tile.extents[1] < bottom and tile.extents[3] > top]
+        band_top = min(tile.extents[1] for tile in tiles)
+        band_bottom = max(tile.extents[3] for tile in tiles)
+        image = _open(self.path)
+        # Декодируются только нужные полосы - в изображение высотой с них
+        image._size = (image.width, band_bottom - band_top)
+        if hasattr(image, '_tile_size'):
+            # TIFF выделяет память под изображение по _tile_size, а не по size
+            image._tile_size = image._size
+        image.tile = [tile._replace(extents=(tile.extents[0], tile.extents[1] - band_top,
+                                             tile.extents[2], tile.extents[3] - band_top))
+                      for tile in tiles]
+        with image:
+            return image.convert('RGB'), band_top
+
+    def _reduced_rows(self, factor, top, bottom):
+        """
+        Строки [top, bottom), уменьшенные в factor раз (границы выравниваются
+        на factor), и первая из них. Полосы файла декодируются по одной.
+        """
+        width, height = self.size
+        top -= top % factor
+        bottom = min(height, bottom + -bottom % factor)
+        if self.image is not None:
+            return self.image.crop((0, top, width, bottom)).reduce(factor), top
+        result = Image.new('RGB', (math.ceil(width / factor), math.ceil((bottom - top) / factor)))
+        done, carry = top, None
+        while done + (carry.height if carry else 0) < bottom:
+            start = done + (carry.height if carry else 0)
+            band, band_top = self._rows(start, start + 1)
+            end = min(bottom, band_top + band.height)
+            rows = band.crop((0, start - band_top, width, end - band_top))
+            band.close()
+            if carry is not None:
+                # Остаток прошлой полосы - меньше factor строк
+                joined = Image.new('RGB', (width, carry.height + rows.height))
+                joined.paste(carry, (0, 0))
+                joined.paste(rows, (0, carry.height))
+                rows = joined
+            usable = rows.height if end == bottom else rows.height - rows.height % factor
+            if usable:
+                part = rows.crop((0, 0, width, usable)).reduce(factor)
+                result.paste(part, (0, (done - top) // factor))
+            carry = rows.crop((0, usable, width, rows.height)) if usable < rows.height else None
+            done += usable
+        return result, top
+
+    def _overview_factor(self):
+        width, height = self.size
+        factor = 1
+        while width * height > OVERVIEW_PIXELS * factor ** 2:
+            factor *= 2
+        return factor
+
+    def scaled_rows(self, width, height, top, bottom):
+        """Строки [top, bottom) источника, уменьшенного до width x height"""
+        source_width, source_height = self.size
+        ratio = source_height / height
+        # Целое уменьшение (reduce) до запаса в 2 раза, остальное - фильтром LANCZOS
+        factor = 2 ** max(0, math.floor(math.log2(max(1, ratio / 2))))
+        overview_factor = self._overview_factor()
+        source_top, source_bottom = top * ratio, bottom * ratio
+        if factor >= overview_factor:
+            # Мелкий уровень: из уменьшенной копии, а не из строк источника
+            if self.overview is None:
+                self.overview, _ = self._reduced_rows(overview_factor, 0, source_height)
+            factor, base, base_top = overview_factor, self.overview, 0
+        else:
+            # Запас на ширину фильтра LANCZOS (3 пикселя результата)
+            margin = math.ceil(3 * ratio) + 1
+            rows_top = max(0, math.floor(source_top) - margin)
+            rows_bottom = min(source_height, math.ceil(source_bottom) + margin)
+            if factor > 1:
+                base, base_top = self._reduced_rows(factor, rows_top, rows_bottom)
+            else:
+                base, base_top = self._rows(rows_top, rows_bottom)
+        box = (0, (source_top - base_top) / factor,
+               source_width / factor, (source_bottom - base_top) / factor)
+        return base.resize((width, bottom - top), Image.Resampling.LANCZOS, box=box)
+
+    def scaled(self, width, height):
+        """Источник целиком, уменьшенный до width x height (по полосам)"""
+        result = Image.new('RGB', (width, height))
+        for top in range(0, height, TILE_SIZE):
+            bottom = min(height, top + TILE_SIZE)
+            result.paste(self.scaled_rows(width, height, top, bottom), (0, top))
+        return result
+
+
+# ==================== ГЕОМЕТРИЯ ПИРАМИДЫ ====================
+class Pyramid:
+    """Уровни DZI: уровень max_level - исходный размер, каждый ниже - вдвое меньше"""
+
+    def __init__(self, width, height, jpeg=False):
+        self.width = width
+        self.height = height
+        self.jpeg = jpeg
+        self.max_level = math.ceil(math.log2(max(width, height, 1)))
+
+    @classmethod
+    def for_photo(cls, photo):
+        """Пирамида для фото; None, если Pillow не уложится в MAX_DECODE_PIXELS"""
+        width, height = _dimensions(photo)
+        jpeg = _is_jpeg(photo)
+        if not has_vips() and width * height > MAX_DECODE_PIXELS:
+            if not PillowSource.can_open(photo.photo.path, jpeg):
+                return None
+            if jpeg:
+                # Верхний уровень уменьшается вдвое, пока JPEG с draft
+                # не уложится в ограничение памяти
+                shrink = 2
+                while width * height / shrink ** 2 > MAX_DECODE_PIXELS:
+                    shrink *= 2
+                width, height = math.ceil(width / shrink), math.ceil(height / shrink)
+        return cls(width, height, jpeg)
+
+    def level_size(self, level):
+        scale = 2 ** (self.max_level - level)
+        return math.ceil(self.width / scale), math.ceil(self.height / scale)
+
+    def tile_count(self, level):
+        width, height = self.level_size(level)
+        return math.ceil(width / TILE_SIZE), math.ceil(height / TILE_SIZE)
+
+    def tile_box(self, level, col, row):
+        """Область тайла в координатах уровня (с перекрытием)"""
+        width, height = self.level_size(level)
+        left = col * TILE_SIZE - (OVERLAP if col else 0)
+        top = row * TILE_SIZE - (OVERLAP if row else 0)
+        right = min(width, (col + 1) * TILE_SIZE + OVERLAP)
+        bottom = min(height, (row + 1) * TILE_SIZE + OVERLAP)
+        return left, top, right, bottom
+
+    def has_tile(self, level, col, row):
+        if not 0 <= level <= self.max_level:
+            return False
+        cols, rows = self.tile_count(level)
+        return 0 <= col < cols and 0 <= row < rows
+
+    def descriptor(self):
+        """XML-описание для просмотрщика"""
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+            f'TileSize="{TILE_SIZE}" Overlap="{OVERLAP}" Format="{TILE_FORMAT}">'
+            f'<Size Width="{self.width}" Height="{self.height}"/></Image>\n'
+        )
+
+
+def _dimensions(photo):
+    if photo.width and photo.height:
+        return photo.width, photo.height
+    with _open(photo.photo.path) as image:
+        return image.size
+
+
+def _is_jpeg(photo):
+    return os.path.splitext(photo.photo.name)[1].lower() in ('.jpg', '.jpeg')
+
+
+def is_zoomable(photo):
+    """
+    Большое фото, для которого на странице включаются тайлы и уменьшенные копии.
+    Проверка может открыть файл, поэтому ответ кэшируется по фото и версии файла.
+    """
+    if not (photo.width and photo.height) or max(photo.width, photo.height) <= MIN_ZOOM_SIZE:
+        return False
+    key = f'deepzoom:zoomable:{photo.pk}:{version(photo)}'
+    zoomable = cache.get(key) if photo.pk else None
+    if zoomable is None:
+        try:
+            zoomable = Pyramid.for_photo(photo) is not None
+        except READ_ERRORS:
+            zoomable = False
+        if photo.pk:
+            cache.set(key, zoomable, ZOOMABLE_TIMEOUT)
+    return zoomable
+
+
+# ==================== СОЗДАНИЕ ТАЙЛОВ ====================
+def _strips(pyramid, level):
+    """Горизонтальные полосы уровня: (row, top, bottom) в координатах уровня"""
+    _, rows = pyramid.tile_count(level)
+    for row in range(rows):
+        _, top, _, bottom = pyramid.tile_box(level, 0, row)
+        yield row, top, bottom
+
+
+def _save_strip(strip, pyramid, level, row, directory):
+    cols, _ = pyramid.tile_count(level)
+    for col in range(cols):
+        left, _, right, _ = pyramid.tile_box(level, col, row)
+        tile = strip.crop((left, 0, right, strip.height))
+        _write(directory / f'{col}_{row}.{TILE_FORMAT}',
+               lambda file: tile.save(file, 'JPEG', quality=QUALITY))
+
+
+def _render_pillow(source, pyramid, level, directory):
+    width, height = pyramid.level_size(level)
+    for row, top, bottom in _strips(pyramid, level):
+        # Масштабируется только полоса, а не весь уровень
+        _save_strip(source.scaled_rows(width, height, top, bottom), pyramid, level, row, directory)
+
+
+def _render_vips(path, pyramid, level, directory):
+    import pyvips
+
+    width, height = pyramid.level_size(level)
+    cols, _ = pyramid.tile_count(level)
+    # thumbnail уменьшает уже при чтении; большие файлы libvips держит на диске
+    image = pyvips.Image.thumbnail(path, width, height=height, size='force')
+    for row, top, bottom in _strips(pyramid, level):
+        for col in range(cols):
+            left, _, right, _ = pyramid.tile_box(level, col, row)
+            data = image.crop(left, top, right - left, bottom - top) \
+                .write_to_buffer(f'.{TILE_FORMAT}', Q=QUALITY)
+            _write(directory / f'{col}_{row}.{TILE_FORMAT}', lambda file: file.write(data))
+
+
+def render_pyramid(path, pyramid, directory):
+    """
+    Создает все уровни пирамиды, от мелких к крупным (мелкие нужны просмотрщику
+    первыми). Pillow декодирует источник один раз на всю пирамиду.
+    """
+    source = None
+    try:
+        if not has_vips():
+            source = PillowSource(path, pyramid.jpeg, (pyramid.width, pyramid.height))
+        for level in range(pyramid.max_level + 1):
+            level_dir = directory / str(level)
+            if (level_dir / '.done').exists():
+                continue
+            if source is not None:
+                _render_pillow(source, pyramid, level, level_dir)
+            else:
+                _render_vips(path, pyramid, level, level_dir)
+            level_dir.mkdir(parents=True, exist_ok=True)
+            (level_dir / '.done').touch()
+    except READ_ERRORS:
+        # Тайлов не будет: просмотрщик остается с уменьшенной копией
+        logger.exception("Не удалось создать тайлы %s", path)
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / '.failed').touch()
+    finally:
+        if source is not None:
+            source.close()
+
+
+def _get_executor():
+    global _executor
+    with _locks_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS,
+                                           thread_name_prefix='deepzoom')
+    return _executor
+
+
+def _render_in_background(path, pyramid, directory):
+    try:
+        render_pyramid(path, pyramid, directory)
+    except Exception:
+        # Например, нехватка памяти: следующий запрос тайла попробует снова
+        logger.exception("Ошибка при создании тайлов %s", path)
+    finally:
+        with _locks_lock:
+            _rendering.discard(directory)
+
+
+def schedule(photo, pyramid):
+    """Ставит пирамиду фото в очередь фонового создания (один раз)"""
+    directory = tiles_dir(photo)
+    with _locks_lock:
+        if directory in _rendering:
+            return
+        _rendering.add(directory)
+    _get_executor().submit(_render_in_background, photo.photo.path, pyramid, directory)
+
+
+PENDING = object()
+
+
+def tile_path(photo, level, col, row):
+    """
+    Путь к тайлу; PENDING - уровень еще создается в фоне; None - тайла нет
+    (или пирамиду создать не удалось)
+    """
+    pyramid = Pyramid.for_photo(photo)
+    if pyramid is None or not pyramid.has_tile(level, col, row):
+        return None
+    directory = tiles_dir(photo)
+    if (directory / str(level) / '.done').exists():
+        return directory / str(level) / f'{col}_{row}.{TILE_FORMAT}'
+    if (directory / '.failed').exists():
+        return None
+    schedule(photo, pyramid)
+    return PENDING
+
+
+def preview_path(photo, size):
+    """Уменьшенная копия фото (сторона не больше size), кэшируется на диске"""
+    path = tiles_dir(photo) / f'preview_{size}.{TILE_FORMAT}'
+    if path.exists():
+        return path
+    with _locked((tenants.current(), photo.pk, version(photo), f'preview_{size}')):
+        if not path.exists():
+            if has_vips():
+                import pyvips
+
+                data = pyvips.Image.thumbnail(photo.photo.path, size) \
+                    .write_to_buffer(f'.{TILE_FORMAT}', Q=QUALITY)
+                _write(path, lambda file: file.write(data))
+            else:
+                width, height = _dimensions(photo)
+                scale = min(1, size / max(width, height))
+                target = (max(1, round(width * scale)), max(1, round(height * scale)))
+                source = PillowSource(photo.photo.path, _is_jpeg(photo), target)
+                try:
+                    image = source.scaled(*target)
+                finally:
+                    source.close()
+                _write(path, lambda file: image.save(file, 'JPEG', quality=QUALITY))
+    return path
+
+
+# ==================== ПРЕДСТАВЛЕНИЯ ====================
+def _get_photo(request, pk, photo_version):
+    photo = get_object_or_404(ExhibitPhoto.objects.select_related('exhibit'), pk=pk)
+    if photo.exhibit.status != 'published' and not request.user.is_authenticated:
+        raise Http404
+    # Старые URL после замены файла больше не действуют
+    if photo_version != version(photo) or not is_zoomable(photo):
+        raise Http404
+    return photo
+
+
+def _cache_forever(response, photo):
+    """Версия в URL меняется вместе с файлом, поэтому ответ не устаревает"""
+    audience = 'public' if photo.exhibit.status == 'published' else 'private'
+    patch_cache_control(response, max_age=IMMUTABLE_MAX_AGE, immutable=True, **{audience: True})
+    return response
+
+
+@require_safe
+def photo_dzi(request, pk, photo_version):
+    """Описание пирамиды для просмотрщика"""
+    photo = _get_photo(request, pk, photo_version)
+    response = HttpResponse(Pyramid.for_photo(photo).descriptor(),
+                            content_type='application/xml; charset=utf-8')
+    return _cache_forever(response, photo)
+
+
+@require_safe
+def photo_tile(request, pk, photo_version, level, col, row):
+    """Тайл пирамиды; пирамида создается в фоне при первом обращении"""
+    photo = _get_photo(request, pk, photo_version)
+    path = tile_path(photo, level, col, row)
+    if path is None:
+        raise Http404
+    if path is PENDING:
+        response = HttpResponse("Тайлы еще создаются", status=503,
+                                content_type='text/plain; charset=utf-8')
+        response['Retry-After'] = str(RETRY_AFTER)
+        add_never_cache_headers(response)
+        return response
+    return _cache_forever(FileResponse(path.open('rb'), content_type='image/jpeg'), photo)
+
+
+@require_safe
+def photo_preview(request, pk, photo_version, size):
+    """Уменьшенная копия большого скана для страницы экспоната"""
+    if size not in PREVIEW_SIZES:
+        raise Http404
+    photo = _get_photo(request, pk, photo_version)
+    try:
+        path = preview_path(photo, size)
+    except READ_ERRORS:
+        logger.exception("Не удалось создать уменьшенную копию фото %s", photo.pk)
+        # Лучше оригинал, чем пустое место на странице
+        return HttpResponseRedirect(photo.photo.url)
+    return _cache_forever(FileResponse(path.open('rb'), content_type='image/jpeg'), photo)
@@ -0,0 +1,345 @@
+"""
+Извлечение текста из документов экспонатов и поиск по нему.
+
+Текст читается постранично: PDF - через pypdf (если установлен), текстовые
+файлы - фрагментами по PAGE_CHARS символов, поэтому даже 500-страничный скан
+не держится в памяти целиком. Страницы без текстового слоя и изображения
+передаются в OCR, если он подключен (MUSEUM_OCR_BACKEND - путь к функции,
+принимающей байты изображения и возвращающей строку).
+
+Страницы пишутся в DocumentPage пачками; полнотекстовый индекс по ним -
+FTS5 в SQLite и GIN по tsvector в PostgreSQL (см. миграцию 0004).
+Извлечение выполняется в фоне пулом потоков после загрузки документа
+и командой extract_documents.
+
+Поиск запускается на первой странице каждого поиска по экспонатам, поэтому
+короткие запросы (меньше MIN_QUERY_LENGTH символов) не ищутся, а найденные
+страницы кэшируются до следующего извлечения или удаления документа.
+"""
+import codecs
+import contextvars
+import hashlib
+import io
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connections, router, transaction
+from django.utils import timezone
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+
+from .db_routers import use_primary
+from .models import Document, DocumentPage
+
+logger = logging.getLogger(__name__)
+
+PDF_EXTENSIONS = {'.pdf'}
+TEXT_EXTENSIONS = {'.txt', '.md', '.csv', '.html', '.htm', '.xml', '.json'}
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp', '.webp'}
+
+PAGE_CHARS = 4000           # размер "страницы" текстового файла
+READ_CHUNK = 64 * 1024      # байт за одно чтение текстового файла
+SAVE_BATCH = 50             # страниц в одном INSERT
+PDF_READER_PAGES = 50       # страниц на один PdfReader: он держит все разобранные объекты
+MAX_ERROR_LENGTH = Document._meta.get_field('extraction_error').max_length
+
+MIN_QUERY_LENGTH = 3        # короче - поиск по документам не выполняется
+VERSION_KEY = 'documents:version'
+SEARCH_TIMEOUT = 60 * 10
+
+# Метки начала и конца совпадения в сниппетах (заменяются на <mark> после экранирования)
+MARK_START, MARK_END = '\x02', '\x03'
+
+
+class UnsupportedDocument(Exception):
+    """Формат файла не поддерживается или нет нужной библиотеки"""
+
+
+def normalize(text):
+    """Схлопывает пробелы, чтобы хранилище было компактным"""
+    return re.sub(r'\s+', ' ', text or '').strip()
+
+
+# ==================== OCR ====================
+def get_ocr():
+    """Функция OCR из MUSEUM_OCR_BACKEND или None"""
+    backend = settings.MUSEUM_OCR_BACKEND
+    return import_string(backend) if backend else None
+
+
+def tesseract_ocr(image_bytes):
+    """Пример локального OCR: pytesseract + Pillow (MUSEUM_OCR_BACKEND='museum.documents.tesseract_ocr')"""
+    import pytesseract
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        return pytesseract.image_to_string(image, lang='rus+eng')
+
+
+# ==================== ЧТЕНИЕ ПО СТРАНИЦАМ ====================
+def _pdf_pages(file, ocr):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise UnsupportedDocument("Для PDF нужен пакет pypdf")
+
+    reader = PdfReader(file)
+    for number in range(len(reader.pages)):
+        if number and not number % PDF_READER_PAGES:
+            # Кэш объектов прочитанных страниц уходит вместе со старым reader
+            reader = PdfReader(file)
+        page = reader.pages[number]
+        text = page.extract_text() or ''
+        if not text.strip() and ocr is not None:
+            # Скан без текстового слоя: распознаем изображения страницы
+            text = ' '.join(ocr(image.data) for image in page.images)
+        yield text
+
+
+def _detect_encoding(head):
+    """UTF-8 или, если байты ему не соответствуют, cp1251 (старые файлы из Word/1С)"""
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as error:
+        # Начало файла могло оборваться посреди многобайтового символа
+        if error.start < len(head) - 3:
+            return 'cp1251'
+    return 'utf-8'
+
+
+def _split_page(buffer):
+    """Отрезает страницу по границе слова"""
+    cut = buffer.rfind(' ', PAGE_CHARS // 2, PAGE_CHARS)
+    cut = cut if cut > 0 else PAGE_CHARS
+    return buffer[:cut], buffer[cut:]
+
+
+def _text_pages(file):
+    """Текстовый файл фрагментами по PAGE_CHARS символов"""
+    encoding = _detect_encoding(file.read(READ_CHUNK))
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    buffer = ''
+    for chunk in file.chunks(READ_CHUNK):
+        buffer += decoder.decode(chunk)
+        while len(buffer) >= PAGE_CHARS:
+            page, buffer = _split_page(buffer)
+            yield page
+    buffer += decoder.decode(b'', final=True)
+    while buffer.strip():
+        page, buffer = _split_page(buffer) if len(buffer) > PAGE_CHARS else (buffer, '')
+        yield page
+
+
+def iter_pages(document, ocr=None):
+    """Текст документа по страницам (генератор, файл открыт только на время чтения)"""
+    extension = document.get_file_extension()
+    if extension not in PDF_EXTENSIONS | TEXT_EXTENSIONS | IMAGE_EXTENSIONS:
+        raise UnsupportedDocument(f"Формат {extension or 'без расширения'} не поддерживается")
+    if extension in IMAGE_EXTENSIONS and ocr is None:
+        raise UnsupportedDocument("Для изображений нужен OCR (MUSEUM_OCR_BACKEND)")
+
+    with document.document.open('rb') as file:
+        if extension in PDF_EXTENSIONS:
+            yield from _pdf_pages(file, ocr)
+        elif extension in TEXT_EXTENSIONS:
+            yield from _text_pages(file)
+        else:
+            yield ocr(file.read())
+
+
+# ==================== ИЗВЛЕЧЕНИЕ ====================
+def _finish(document, status, page_count=0, error=''):
+    Document.objects.filter(pk=document.pk).update(
+        extraction_status=status,
+        page_count=page_count,
+        extracted_at=timezone.now(),
+        extraction_error=error[:MAX_ERROR_LENGTH],
+    )
+    invalidate()
+
+
+def _replace_pages(document):
+    """Заменяет страницы документа; при ошибке транзакция откатывается целиком"""
+    batch, saved = [], 0
+    with transaction.atomic(using=router.db_for_write(DocumentPage)):
+        DocumentPage.objects.filter(document=document).delete()
+        for number, text in enumerate(iter_pages(document, get_ocr()), start=1):
+            text = normalize(text)
+            if not text:
+                continue
+            batch.append(DocumentPage(document=document, number=number, text=text))
+            if len(batch) >= SAVE_BATCH:
+                DocumentPage.objects.bulk_create(batch)
+                saved += len(batch)
+                batch = []
+        DocumentPage.objects.bulk_create(batch)
+        saved += len(batch)
+    return saved
+
+
+def extract_document(document):
+    """
+    Извлекает текст документа заново. Возвращает новый статус.
+    Если извлечь не удалось, прежние страницы остаются и по ним можно искать.
+    """
+    try:
+        saved = _replace_pages(document)
+    except UnsupportedDocument as error:
+        # Новый файл не читается - страницы прежнего файла ему не соответствуют
+        DocumentPage.objects.filter(document=document).delete()
+        _finish(document, 'unsupported', 0, str(error))
+        return 'unsupported'
+    except Exception as error:
+        logger.exception("Не удалось извлечь текст документа %s", document.pk)
+        _finish(document, 'failed', document.pages.count(), f"{type(error).__name__}: {error}")
+        return 'failed'
+
+    status = 'done' if saved else 'empty'
+    _finish(document, status, saved)
+    return status
+
+
+def extract_by_id(pk):
+    """Задача для пула: отдельный поток работает со своими соединениями с базой"""
+    close_old_connections()
+    try:
+        # Документ только что сохранен - на реплике его может еще не быть
+        with use_primary():
+            document = Document.objects.filter(pk=pk).first()
+            return extract_document(document) if document else None
+    finally:
+        connections.close_all()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Общий пул фоновых потоков извлечения (MUSEUM_EXTRACTION_WORKERS)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.MUSEUM_EXTRACTION_WORKERS,
+                thread_name_prefix='document-extraction',
+            )
+    return _executor
+
+
+def schedule(pk):
+    """Ставит документ в очередь фонового извлечения"""
+    # Поток пула выполняет задачу в контексте запроса - с базой того же музея
+    get_executor().submit(contextvars.copy_context().run, extract_by_id, pk)
+
+
+# ==================== ПОИСК ====================
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def invalidate():
+    """Сбрасывает кэш результатов поиска по документам во всех воркерах"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
+
+
+def _fts_query(query):
+    """Запрос пользователя -> FTS5: все слова, каждое как префикс"""
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _search_sqlite(connection, query, limit):
+    match = _fts_query(query)
+    if not match:
+        return []
+    sql = (
+        "SELECT p.id, p.document_id, p.number, "
+        "snippet(museum_documentpage_fts, 0, %s, %s, '…', 16) "
+        "FROM museum_documentpage_fts f "
+        "JOIN museum_documentpage p ON p.id = f.rowid "
+        "WHERE museum_documentpage_fts MATCH %s "
+        "ORDER BY f.rank LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [MARK_START, MARK_END, match, limit])
+        return cursor.fetchall()
+
+
+def _search_postgresql(connection, query, limit):
+    options = f'StartSel={MARK_START}, StopSel={MARK_END}, MaxWords=30, MinWords=10'
+    sql = (
+        "SELECT p.id, p.document_id, p.number, ts_headline('russian', p.text, q, %s) "
+        "FROM museum_documentpage p, websearch_to_tsquery('russian', %s) q "
+        "WHERE to_tsvector('russian', p.text) @@ q "
+        "ORDER BY ts_rank(to_tsvector('russian', p.text), q) DESC LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [options, query, limit])
+        return cursor.fetchall()
+
+
+def _search_fallback(connection, query, limit, context=80):
+    rows = []
+    pages = DocumentPage.objects.filter(text__icontains=query).values_list(
+        'id', 'document_id', 'number', 'text')[:limit]
+    for pk, document_id, number, text in pages:
+        start = max(0, text.lower().find(query.lower()))
+        fragment = text[max(0, start - context):start + len(query) + context]
+        offset = max(0, fragment.lower().find(query.lower()))
+        snippet = (fragment[:offset] + MARK_START + fragment[offset:offset + len(query)]
+                   + MARK_END + fragment[offset + len(query):])
+        rows.append((pk, document_id, number, f'…{snippet}…'))
+    return rows
+
+
+def _render_snippet(snippet):
+    """Экранирует текст страницы и выделяет совпадения"""
+    html = escape(snippet).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+    return mark_safe(html)
+
+
+def search_documents(query, public=True, limit=100, pages_per_document=3):
+    """
+    Документы, в тексте которых встречается запрос, со сниппетами страниц:
+    [{'document': Document, 'pages': [{'number', 'snippet'}]}], по релевантности.
+    """
+    query = query.strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return []
+    # Кэшируются найденные страницы; видимость документов проверяется каждый раз
+    digest = hashlib.sha1(query.lower().encode()).hexdigest()
+    key = f'documents:search:{get_version()}:{limit}:{digest}'
+    rows = cache.get(key)
+    if rows is None:
+        connection = connections[router.db_for_read(DocumentPage)]
+        search = {'sqlite': _search_sqlite,
+                  'postgresql': _search_postgresql}.get(connection.vendor, _search_fallback)
+        rows = search(connection, query, limit)
+        cache.set(key, rows, SEARCH_TIMEOUT)
+
+    documents = Document.objects.filter(pk__in={row[1] for row in rows}).select_related('exhibit')
+    if public:
+        documents = documents.filter(exhibit__status='published')
+    documents = {document.pk: document for document in documents}
+
+    results = {}
+    for _, document_id, number, snippet in rows:
+        if document_id not in documents:
+            continue
+        result = results.setdefault(document_id, {'document': documents[document_id], 'pages': []})
+        if len(result['pages']) < pages_per_document:
+            result['pages'].append({'number': number, 'snippet': _render_snippet(snippet)})
+    return list(results.values())
@@ -0,0 +1,182 @@
+"""
+Поиск повторно загруженных фотографий по перцептивным хэшам.
+
+Фото считаются дубликатами, если pHash отличается не больше чем на
+PHASH_THRESHOLD бит и dHash - не больше DHASH_THRESHOLD (вторая проверка
+отсекает случайные совпадения pHash у однотонных снимков).
+Кандидаты ищутся в BK-дереве по pHash, которое строится один раз на процесс.
+Изменения фото пишутся в журнал в кэше (как у подсказок поиска, autocomplete.py),
+и каждый воркер точечно добавляет и убирает узлы вместо перестройки дерева.
+"""
+import threading
+
+from django.core.cache import cache
+
+from . import tenants
+from .db_routers import use_primary
+from .imagehash import BKTree, distance
+from .models import ExhibitPhoto
+
+PHASH_THRESHOLD = 10
+DHASH_THRESHOLD = 12
+VERSION_KEY = 'photo_hashes:version'
+CHANGE_KEY = 'photo_hashes:change:%d'
+CHANGE_TIMEOUT = 60 * 60
+MAX_REPLAY = 500       # изменений, после которых дешевле перестроить дерево
+FULL_REBUILD = 0       # запись журнала: перестроить дерево целиком
+FIELDS = ('pk', 'exhibit_id', 'phash', 'dhash')
+
+_lock = threading.Lock()
+
+
+# ==================== ИНДЕКС ====================
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def _bump_version():
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
+        return 2
+
+
+def _record(change):
+    """Запись в журнал: id фото или FULL_REBUILD. Возвращает ее версию."""
+    version = _bump_version()
+    cache.set(CHANGE_KEY % version, change, CHANGE_TIMEOUT)
+    return version
+
+
+def hashed_photos():
+    """Фото с посчитанными хэшами"""
+    return ExhibitPhoto.objects.exclude(phash__in=('', ExhibitPhoto.HASH_FAILED))
+
+
+def build_tree(rows):
+    """BK-дерево по строкам (pk, exhibit_id, phash, dhash)"""
+    tree = BKTree()
+    for row in rows:
+        tree.add(row[2], row)
+    return tree
+
+
+def _state():
+    state = tenants.local('duplicates')
+    state.setdefault('version', None)
+    state.setdefault('tree', None)
+    state.setdefault('rows', {})    # pk -> строка в дереве (для удаления)
+    return state
+
+
+@use_primary()
+def _build(state):
+    rows = {row[0]: row for row in hashed_photos().values_list(*FIELDS).iterator()}
+    state['tree'] = build_tree(rows.values())
+    state['rows'] = rows
+
+
+@use_primary()
+def _apply(state, photo_ids):
+    """Перечитывает фото из базы и заменяет их узлы в дереве"""
+    fresh = {row[0]: row for row in hashed_photos().filter(pk__in=photo_ids).values_list(*FIELDS)}
+    for pk in photo_ids:
+        old = state['rows'].pop(pk, None)
+        if old is not None:
+            state['tree'].remove(old[2], old)
+        if pk in fresh:
+            state['tree'].add(fresh[pk][2], fresh[pk])
+            state['rows'][pk] = fresh[pk]
+
+
+def _replay(state, version):
+    """Применяет изменения из журнала после локальной версии; False - нужна перестройка"""
+    local_version = state['version']
+    if state['tree'] is None or local_version is None \
+            or not 0 < version - local_version <= MAX_REPLAY:
+        return False
+    keys = [CHANGE_KEY % number for number in range(local_version + 1, version + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) < len(keys) or FULL_REBUILD in changes.values():
+        return False
+    _apply(state, set(changes.values()))
+    return True
+
+
+def get_tree():
+    version = get_version()
+    state = _state()
+    if state['version'] != version or state['tree'] is None:
+        with _lock:
+            if state['version'] != version or state['tree'] is None:
+                if not _replay(state, version):
+                    _build(state)
+                state['version'] = version
+    return state['tree']
+
+
+def refresh_photo(photo_id):
+    """Точечное обновление дерева после сохранения/удаления фото"""
+    state = _state()
+    with _lock:
+        version = _record(photo_id)
+        # Без чужих изменений между версиями - сразу применяем свое,
+        # иначе журнал проиграется при следующем обращении
+        if state['tree'] is not None and state['version'] == version - 1:
+            _apply(state, {photo_id})
+            state['version'] = version
+
+
+def invalidate():
+    """Полная перестройка дерева во всех воркерах (после массового пересчета хэшей)"""
+    _record(FULL_REBUILD)
+
+
+# ==================== ПОИСК ====================
+def is_match(first_dhash, second_dhash):
+    return not first_dhash or not second_dhash or \
+        distance(first_dhash, second_dhash) <= DHASH_THRESHOLD
+
+
+def similar_photos(photo, tree=None):
+    """Похожие фото из архива: [(расстояние pHash, ExhibitPhoto)], ближайшие первыми"""
+    if photo.phash in ('', ExhibitPhoto.HASH_FAILED):
+        return []
+    tree = tree or get_tree()
+    matches = [
+        (d, row[0]) for d, row in tree.search(photo.phash, PHASH_THRESHOLD)
+        if row[0] != photo.pk and is_match(photo.dhash, row[3])
+    ]
+    photos = ExhibitPhoto.objects.select_related('exhibit').in_bulk([pk for _, pk in matches])
+    return [(d, photos[pk]) for d, pk in matches if pk in photos]
+
+
+def find_clusters(rows, threshold=PHASH_THRESHOLD):
+    """
+    Группы похожих фото во всем архиве: список множеств pk (по 2 и более).
+    Каждое фото ищет соседей в дереве, пары объединяются через union-find.
+    """
+    rows = list(rows)
+    tree = build_tree(rows)
+    parent = {row[0]: row[0] for row in rows}
+
+    def find(pk):
+        while parent[pk] != pk:
+            parent[pk] = parent[parent[pk]]
+            pk = parent[pk]
+        return pk
+
+    for pk, _, phash, dhash in rows:
+        for _, other in tree.search(phash, threshold):
+            if other[0] != pk and is_match(dhash, other[3]):
+                parent[find(other[0])] = find(pk)
+
+    clusters = {}
+    for pk in parent:
+        clusters.setdefault(find(pk), set()).add(pk)
+    return [members for members in clusters.values() if len(members) > 1]
@@ -0,0 +1,264 @@
+"""
+Фасетный поиск по коллекции.
+
+Счетчики фасетов считаются по инвертированному индексу (значение -> множество id),
+который строится одним запросом и живет в памяти процесса. Версия индекса хранится
+в общем кэше и увеличивается при сохранении/удалении экспоната, поэтому все
+воркеры перестраивают индекс после изменений. Готовые счетчики кэшируются
+для каждой комбинации фильтров.
+
+Сами результаты фильтруются в SQL (apply_filters) - индекс нужен только для счетчиков.
+"""
+import hashlib
+import re
+import threading
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from . import dating, tenants
+from .db_routers import use_primary
+from .models import Exhibit, Category
+
+# Порядок фасетов на странице
+FACETS = [
+    ('category', 'Категория'),
+    ('tag', 'Теги'),
+    ('material', 'Материал'),
+    ('author', 'Автор'),
+    ('decade', 'Десятилетие'),
+    ('status', 'Статус'),
+]
+
+PUBLIC_STATUSES = ('published',)
+STAFF_STATUSES = tuple(code for code, _ in Exhibit.STATUS_CHOICES)
+
+VERSION_KEY = 'facets:version'
+COUNTS_TIMEOUT = 60 * 10
+MAX_VALUES = 20  # значений одного фасета на странице (выбранные показываются всегда)
+
+_lock = threading.Lock()
+
+
+# ==================== ВЕРСИЯ ИНДЕКСА ====================
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def invalidate():
+    """Сбрасывает индекс и кэш счетчиков во всех воркерах"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
+
+
+# ==================== ИНДЕКС ====================
+def split_tags(value):
+    """Строка тегов через запятую -> список тегов"""
+    if not value:
+        return []
+    return [tag.strip() for tag in value.split(',') if tag.strip()]
+
+
+def _build_index(statuses):
+    postings = {name: {} for name, _ in FACETS}
+    all_ids = set()
+    rows = Exhibit.objects.filter(status__in=statuses).values_list(
+        'id', 'category_id', 'tags', 'material', 'author', 'year_from', 'year_to', 'status'
+    )
+    for pk, category_id, tags, material, author, year_from, year_to, status in rows:
+        all_ids.add(pk)
+        values = {
+            'category': [category_id] if category_id else [],
+            'tag': split_tags(tags),
+            'material': [material] if material else [],
+            'author': [author] if author else [],
+            # Десятилетия создания: "1938-1941" - и 1930-е, и 1940-е
+            'decade': dating.decades(year_from, year_to) if year_from is not None else [],
+            'status': [status],
+        }
+        for name, facet_values in values.items():
+            for value in facet_values:
+                postings[name].setdefault(value, set()).add(pk)
+    return {'all': all_ids, 'postings': postings}
+
+
+def get_index(statuses, version=None):
+    """Индекс для набора статусов; перестраивается при смене версии"""
+    if version is None:
+        version = get_version()
+    key = (version, statuses)
+    local = tenants.local('facets')
+    index = local.get(key)
+    if index is None:
+        with _lock:
+            index = local.get(key)
+            if index is None:
+                # Индекс живет до следующей версии: строится по основной базе
+                with use_primary():
+                    index = _build_index(statuses)
+                # Старые версии больше не нужны
+                for stale in [k for k in local if k[0] != version]:
+                    del local[stale]
+                local[key] = index
+    return index
+
+
+# ==================== ВЫБРАННЫЕ ФИЛЬТРЫ ====================
+def parse_selection(params, staff=False):
+    """Выбранные значения фасетов из GET-параметров: {фасет: [значения]}"""
+    selection = {}
+    for name, _ in FACETS:
+        if name == 'status' and not staff:
+            continue
+        values = [value.strip() for value in params.getlist(name) if value.strip()]
+        if name in ('category', 'decade'):
+            values = [int(value) for value in values if value.isdigit()]
+        elif name == 'status':
+            values = [value for value in values if value in STAFF_STATUSES]
+        if values:
+            selection[name] = sorted(set(values))
+    if staff and 'status' not in selection:
+        selection['status'] = list(PUBLIC_STATUSES)
+    return selection
+
+
+def _tag_regex(tag):
+    return r'(^|,)\s*' + re.escape(tag) + r'\s*(,|$)'
+
+
+def apply_filters(queryset, selection):
+    """Применяет выбранные фасеты к queryset: ИЛИ внутри фасета, И между фасетами"""
+    lookups = {
+        'category': lambda value: Q(category_id=value),
+        'tag': lambda value: Q(tags__regex=_tag_regex(value)),
+        'material': lambda value: Q(material=value),
+        'author': lambda value: Q(author=value),
+        'decade': lambda value: Q(year_from__lte=value + 9, year_to__gte=value),
+        'status': lambda value: Q(status=value),
+    }
+    for name, values in selection.items():
+        condition = Q()
+        for value in values:
+            condition |= lookups[name](value)
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+# ==================== СЧЕТЧИКИ ====================
+def _matching(index, selection, skip=None):
+    """id, удовлетворяющие всем выбранным фасетам, кроме skip"""
+    result = index['all']
+    for name, values in selection.items():
+        if name == skip:
+            continue
+        postings = index['postings'][name]
+        matched = set()
+        for value in values:
+            matched |= postings.get(value, set())
+        result = result & matched
+    return result
+
+
+def _compute_counts(index, selection, facet_names, restrict=None):
+    counts = {}
+    for name in facet_names:
+        base = _matching(index, selection, skip=name)
+        if restrict is not None:
+            base = base & restrict
+        counts[name] = {
+            value: len(ids & base)
+            for value, ids in index['postings'][name].items()
+        }
+    return counts
+
+
+def facet_counts(selection, staff=False, query='', found=None):
+    """
+    Счетчики всех фасетов для текущей комбинации фильтров.
+    Для фасета F учитываются все фильтры, кроме самого F, чтобы было видно,
+    сколько экспонатов добавит выбор другого значения.
+    query - текстовый поиск (часть ключа кэша), found - queryset найденных
+    им экспонатов; их id читаются только при промахе кэша.
+    """
+    statuses = STAFF_STATUSES if staff else PUBLIC_STATUSES
+    facet_names = [name for name, _ in FACETS if staff or name != 'status']
+    version = get_version()
+    signature = repr((sorted(selection.items()), staff, query))
+    key = 'facets:counts:%s:%s' % (version, hashlib.sha1(signature.encode()).hexdigest())
+    counts = cache.get(key)
+    if counts is None:
+        index = get_index(statuses, version)
+        with use_primary():
+            restrict = set(found.values_list('id', flat=True)) if found is not None else None
+        counts = _compute_counts(index, selection, facet_names, restrict)
+        cache.set(key, counts, COUNTS_TIMEOUT)
+    return counts
+
+
+def build_facets(params, selection, counts):
+    """
+    Готовит фасеты для шаблона: значения с количеством, признаком выбора
+    и ссылкой, которая включает/выключает значение.
+    """
+    labels = {
+        'status': dict(Exhibit.STATUS_CHOICES),
+    }
+    category_ids = list(counts.get('category', {}))
+    categories = {
+        pk: (name, icon)
+        for pk, name, icon in Category.objects.filter(pk__in=category_ids)
+        .values_list('pk', 'name', 'icon')
+    }
+
+    facets = {}
+    for name, title in FACETS:
+        if name not in counts:
+            continue
+        selected = set(selection.get(name, []))
+        values = [
+            (value, count) for value, count in counts[name].items()
+            if count or value in selected
+        ]
+        values.sort(key=lambda item: (-item[1], str(item[0])))
+        shown = values[:MAX_VALUES] + [
+            item for item in values[MAX_VALUES:] if item[0] in selected
+        ]
+
+        items = []
+        for value, count in shown:
+            item = {
+                'value': value,
+                'count': count,
+                'selected': value in selected,
+                'querystring': _toggle(params, name, value, value in selected),
+            }
+            if name == 'category':
+                item['id'] = value
+                item['name'], item['icon'] = categories.get(value, ('—', ''))
+                item['exhibit_count'] = count
+                item['label'] = item['name']
+            elif name == 'decade':
+                item['label'] = f'{value}-е'
+            else:
+                item['label'] = labels.get(name, {}).get(value, value)
+            items.append(item)
+        facets[name] = {'name': name, 'title': title, 'values': items,
+                        'selected': bool(selected)}
+    return facets
+
+
+def _toggle(params, name, value, selected):
+    """Строка запроса с добавленным/удаленным значением фасета (без номера страницы)"""
+    query = params.copy()
+    query.pop('page', None)
+    values = [item for item in query.getlist(name) if item != str(value)]
+    if not selected:
+        values.append(str(value))
+    query.setlist(name, values)
+    return query.urlencode()
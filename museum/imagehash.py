@@ -0,0 +1,168 @@
+"""
+Перцептивные хэши изображений и BK-дерево для поиска похожих.
+
+Все хэши 64-битные и хранятся как 16 шестнадцатеричных символов:
+  aHash - яркость 8x8 относительно среднего (быстрый, грубый);
+  dHash - перепады яркости между соседними пикселями 9x8;
+  pHash - знаки низкочастотных коэффициентов DCT 32x32 (устойчив к
+          масштабу, сжатию JPEG и небольшой цветокоррекции).
+Похожесть - расстояние Хэмминга: число различающихся бит.
+"""
+import io
+
+import numpy as np
+from PIL import Image, ImageOps
+
+HASH_SIZE = 8
+PHASH_SIZE = 32
+
+
+def _prepare(image):
+    """Изображение в оттенках серого с учетом поворота из EXIF"""
+    # Для JPEG декодер сразу отдает уменьшенную картинку - большие сканы читаются быстро
+    image.draft('L', (PHASH_SIZE * 4, PHASH_SIZE * 4))
+    return ImageOps.exif_transpose(image).convert('L')
+
+
+def _pixels(image, size):
+    """Уменьшенная копия как массив яркостей (size = (ширина, высота))"""
+    if image.mode != 'L':
+        image = image.convert('L')
+    return np.asarray(image.resize(size, Image.Resampling.LANCZOS), dtype=np.float64)
+
+
+def _to_hex(bits):
+    return np.packbits(bits.flatten()).tobytes().hex()
+
+
+def _dct_matrix(size):
+    """Матрица DCT-II: DCT двумерного массива - M @ X @ M.T"""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT = _dct_matrix(PHASH_SIZE)
+
+
+def average_hash(image):
+    pixels = _pixels(image, (HASH_SIZE, HASH_SIZE))
+    return _to_hex(pixels > pixels.mean())
+
+
+def difference_hash(image):
+    pixels = _pixels(image, (HASH_SIZE + 1, HASH_SIZE))
+    return _to_hex(pixels[:, 1:] > pixels[:, :-1])
+
+
+def perceptual_hash(image):
+    pixels = _pixels(image, (PHASH_SIZE, PHASH_SIZE))
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    # Постоянная составляющая (яркость) не участвует в сравнении
+    median = np.median(low.flatten()[1:])
+    return _to_hex(low > median)
+
+
+def compute_hashes(file):
+    """{'ahash', 'dhash', 'phash'} для файла или пути к изображению"""
+    with Image.open(file) as image:
+        gray = _prepare(image)
+    return {
+        'ahash': average_hash(gray),
+        'dhash': difference_hash(gray),
+        'phash': perceptual_hash(gray),
+    }
+
+
+def hash_task(task):
+    """
+    Задача для пула процессов: (pk, путь или байты) -> (pk, хэши или None).
+    Модуль не зависит от Django, поэтому дочерним процессам не нужна настройка.
+    """
+    pk, source = task
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    try:
+        return pk, compute_hashes(source)
+    except (OSError, ValueError, SyntaxError):
+        return pk, None
+
+
+def distance(first, second):
+    """Расстояние Хэмминга между двумя хэшами (hex-строки или int)"""
+    if isinstance(first, str):
+        first = int(first, 16)
+    if isinstance(second, str):
+        second = int(second, 16)
+    return (first ^ second).bit_count()
+
+
+# ==================== BK-ДЕРЕВО ====================
+class BKTree:
+    """
+    Дерево Буркхарда-Келлера по метрике Хэмминга.
+    Поиск в радиусе r обходит только поддеревья с ребрами в [d-r, d+r],
+    поэтому на малых радиусах просматривается небольшая часть архива.
+    Узел: [хэш (int), [значения], {расстояние: дочерний узел}].
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, hash_value, item):
+        if isinstance(hash_value, str):
+            hash_value = int(hash_value, 16)
+        self.size += 1
+        if self.root is None:
+            self.root = [hash_value, [item], {}]
+            return
+        node = self.root
+        while True:
+            d = (node[0] ^ hash_value).bit_count()
+            if d == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [hash_value, [item], {}]
+                return
+            node = child
+
+    def remove(self, hash_value, item):
+        """
+        Удаляет значение из узла с этим хэшем. Сам узел остается (на нем держатся
+        дочерние), пустой узел при поиске ничего не дает.
+        """
+        if isinstance(hash_value, str):
+            hash_value = int(hash_value, 16)
+        node = self.root
+        while node is not None:
+            d = (node[0] ^ hash_value).bit_count()
+            if d == 0:
+                if item in node[1]:
+                    node[1].remove(item)
+                    self.size -= 1
+                    return True
+                return False
+            node = node[2].get(d)
+        return False
+
+    def search(self, hash_value, radius):
+        """[(расстояние, значение)] в пределах radius, по возрастанию расстояния"""
+        if isinstance(hash_value, str):
+            hash_value = int(hash_value, 16)
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            d = (node[0] ^ hash_value).bit_count()
+            if d <= radius:
+                found.extend((d, item) for item in node[1])
+            for edge, child in node[2].items():
+                if d - radius <= edge <= d + radius:
+                    stack.append(child)
+        found.sort(key=lambda pair: pair[0])
+        return found
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from museum import assets
+
+
+class Command(BaseCommand):
+    help = (
+        "Сборка статики: скачивает Bootstrap и Font Awesome в static/vendor, "
+        "сжимает собственные CSS/JS, выполняет collectstatic и создает .gz/.br"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-vendor', action='store_true',
+                            help="Не скачивать библиотеки (нет доступа к CDN)")
+        parser.add_argument('--force', action='store_true',
+                            help="Скачать библиотеки заново")
+
+    def handle(self, *args, **options):
+        if not options['skip_vendor']:
+            try:
+                downloaded = assets.vendor(force=options['force'])
+            except (OSError, ValueError) as error:
+                raise CommandError(f"Не удалось скачать библиотеки: {error}")
+            self.stdout.write(f"Скачано файлов: {len(downloaded)}")
+
+        for target in assets.build_bundles():
+            self.stdout.write(f"Собран {target}")
+
+        call_command('collectstatic', interactive=False, verbosity=options['verbosity'])
+        if not assets.has_brotli():
+            self.stderr.write(self.style.WARNING(
+                "Пакет Brotli не установлен (pip install -r requirements.txt): "
+                "создаются только .gz, браузеры получат статику хуже сжатой"))
+        count = assets.precompress(settings.STATIC_ROOT)
+        self.stdout.write(self.style.SUCCESS(f"Сжатых копий: {count}"))
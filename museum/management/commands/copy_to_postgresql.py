@@ -0,0 +1,92 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, transaction
+
+from school_museum.database import register_database, sqlite_config
+
+SOURCE_ALIAS = 'sqlite_source'
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит данные музея из файла SQLite в базу PostgreSQL (default) "
+        "через COPY. Схема в PostgreSQL должна быть создана командой migrate."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=str(settings.BASE_DIR / 'db.sqlite3'),
+                            help="Путь к исходному файлу SQLite")
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Сколько строк читать из SQLite за раз")
+
+    def handle(self, *args, **options):
+        target = connections['default']
+        if target.vendor != 'postgresql':
+            raise CommandError("База default должна быть PostgreSQL (MUSEUM_DB_ENGINE=postgresql)")
+
+        register_database(SOURCE_ALIAS, sqlite_config(options['source']))
+        source = connections[SOURCE_ALIAS]
+        source_tables = set(source.introspection.table_names())
+
+        models = [
+            model for model in apps.get_models(include_auto_created=True)
+            if model._meta.managed and not model._meta.proxy
+            and model._meta.db_table in source_tables
+        ]
+        tables = [model._meta.db_table for model in models]
+
+        # Внешние ключи в PostgreSQL у Django отложенные (DEFERRABLE INITIALLY DEFERRED),
+        # поэтому внутри одной транзакции порядок таблиц не важен
+        with transaction.atomic(using='default'):
+            with target.cursor() as cursor:
+                quoted = ', '.join(target.ops.quote_name(table) for table in tables)
+                cursor.execute(f'TRUNCATE {quoted} CASCADE')
+
+            for model in models:
+                copied = self._copy_table(model, source, target, options['batch_size'])
+                self.stdout.write(f"{model._meta.db_table}: {copied}")
+
+            with target.cursor() as cursor:
+                for sql in target.ops.sequence_reset_sql(no_style(), models):
+                    cursor.execute(sql)
+
+        self._verify(models, source, target)
+        source.close()
+
+    def _copy_table(self, model, source, target, batch_size):
+        columns = [field.column for field in model._meta.local_concrete_fields]
+        source_columns = ', '.join(source.ops.quote_name(column) for column in columns)
+        target_columns = ', '.join(target.ops.quote_name(column) for column in columns)
+        table = model._meta.db_table
+        copied = 0
+
+        with source.cursor() as reader, target.cursor() as writer:
+            reader.execute(f'SELECT {source_columns} FROM {source.ops.quote_name(table)}')
+            # writer.cursor - курсор psycopg, у него есть COPY
+            copy_sql = f'COPY {target.ops.quote_name(table)} ({target_columns}) FROM STDIN'
+            with writer.cursor.copy(copy_sql) as copy:
+                while True:
+                    rows = reader.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        copy.write_row(row)
+                    copied += len(rows)
+        return copied
+
+    def _verify(self, models, source, target):
+        mismatched = []
+        for model in models:
+            table = model._meta.db_table
+            counts = []
+            for connection in (source, target):
+                with connection.cursor() as cursor:
+                    cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+                    counts.append(cursor.fetchone()[0])
+            if counts[0] != counts[1]:
+                mismatched.append(f"{table}: {counts[0]} -> {counts[1]}")
+        if mismatched:
+            raise CommandError("Количество строк не совпало:\n" + '\n'.join(mismatched))
+        self.stdout.write(self.style.SUCCESS("Перенос завершен, количество строк совпадает"))
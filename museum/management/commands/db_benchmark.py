@@ -0,0 +1,92 @@
+import random
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Count, Q
+
+from museum.models import Exhibit, Category
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест базы: параллельные чтения (как на публичных страницах) "
+        "и записи (как из админки). Запустите с разными MUSEUM_DB_* и сравните результат. "
+        "Записи откатываются и данные не меняют."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=10.0, help="секунд")
+        parser.add_argument('--write-hold', type=float, default=0.005,
+                            help="сколько секунд держать транзакцию записи")
+
+    def handle(self, *args, **options):
+        ids = list(Exhibit.objects.values_list('id', flat=True)[:1000])
+        if not ids:
+            self.stderr.write("В базе нет экспонатов - нечего читать")
+            return
+
+        deadline = time.monotonic() + options['duration']
+        results = {'read': [], 'write': []}
+        errors = {'read': 0, 'write': 0}
+        lock = threading.Lock()
+
+        def read_once():
+            exhibit = Exhibit.objects.filter(pk=random.choice(ids)).first()
+            list(Exhibit.objects.filter(status='published').order_by('-created_at')[:12])
+            Category.objects.annotate(
+                exhibit_count=Count('exhibit', filter=Q(exhibit__status='published'))
+            ).count()
+            return exhibit
+
+        def write_once():
+            with transaction.atomic():
+                Exhibit.objects.filter(pk=random.choice(ids)).update(is_featured=True)
+                time.sleep(options['write_hold'])
+                transaction.set_rollback(True)
+
+        def worker(kind, action):
+            timings = []
+            failed = 0
+            try:
+                while time.monotonic() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        action()
+                    except OperationalError:
+                        failed += 1
+                        continue
+                    timings.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+            with lock:
+                results[kind].extend(timings)
+                errors[kind] += failed
+
+        threads = [threading.Thread(target=worker, args=('read', read_once))
+                   for _ in range(options['readers'])]
+        threads += [threading.Thread(target=worker, args=('write', write_once))
+                    for _ in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.stdout.write(f"База: {connection.vendor} ({connection.settings_dict['NAME']}), "
+                          f"{options['readers']} читателей, {options['writers']} писателей, "
+                          f"{options['duration']:.0f} с")
+        for kind, timings in results.items():
+            if not timings:
+                self.stdout.write(f"{kind}: нет успешных операций, ошибок {errors[kind]}")
+                continue
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+            self.stdout.write(
+                f"{kind}: {len(timings) / options['duration']:.0f} оп/с, "
+                f"медиана {statistics.median(timings) * 1000:.1f} мс, "
+                f"p95 {p95 * 1000:.1f} мс, ошибок {errors[kind]}"
+            )
@@ -0,0 +1,43 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from museum import documents
+from museum.models import Document
+
+
+class Command(BaseCommand):
+    help = (
+        "Извлекает текст из документов экспонатов для поиска "
+        "(по умолчанию - ожидающие и завершившиеся ошибкой)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help="Извлечь заново текст всех документов")
+        parser.add_argument('--workers', type=int, default=settings.MUSEUM_EXTRACTION_WORKERS,
+                            help="Число параллельных потоков")
+
+    def handle(self, *args, **options):
+        queryset = Document.objects.all()
+        if not options['all']:
+            queryset = queryset.filter(extraction_status__in=['pending', 'failed'])
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+        if not ids:
+            self.stdout.write("Нет документов для обработки")
+            return
+
+        statuses = {}
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            futures = {pool.submit(documents.extract_by_id, pk): pk for pk in ids}
+            for future in as_completed(futures):
+                status = future.result()
+                statuses[status] = statuses.get(status, 0) + 1
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"Документ {futures[future]}: {status}")
+
+        labels = dict(Document.EXTRACTION_STATUSES)
+        summary = ', '.join(f"{labels.get(status, status)}: {count}"
+                            for status, count in statuses.items())
+        self.stdout.write(self.style.SUCCESS(f"Обработано документов: {len(ids)} ({summary})"))
@@ -0,0 +1,93 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from museum import duplicates
+from museum.imagehash import hash_task
+from museum.models import ExhibitPhoto
+
+HASH_FIELDS = ['ahash', 'dhash', 'phash']
+SAVE_BATCH = 500
+TASKS_PER_WORKER = 4        # задач в очереди на процесс: файлы не читаются все сразу
+
+
+class Command(BaseCommand):
+    help = (
+        "Считает перцептивные хэши фотографий (в нескольких процессах) "
+        "и выводит группы похожих фото во всем архиве"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rehash', action='store_true',
+                            help="Пересчитать хэши всех фото, а не только новых")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Число процессов для расчета хэшей")
+        parser.add_argument('--threshold', type=int, default=duplicates.PHASH_THRESHOLD,
+                            help="Максимальное расстояние pHash в битах")
+
+    def handle(self, *args, **options):
+        hashed = self._hash_photos(options['rehash'], options['workers'])
+        self.stdout.write(f"Посчитано хэшей: {hashed}")
+
+        rows = list(duplicates.hashed_photos().values_list(*duplicates.FIELDS))
+        clusters = duplicates.find_clusters(rows, threshold=options['threshold'])
+        photos = ExhibitPhoto.objects.select_related('exhibit').in_bulk(
+            [pk for members in clusters for pk in members])
+
+        for number, members in enumerate(sorted(clusters, key=len, reverse=True), start=1):
+            self.stdout.write(f"\nГруппа {number} ({len(members)} фото):")
+            for pk in sorted(members):
+                photo = photos[pk]
+                self.stdout.write(f"  #{pk} [{photo.exhibit.inventory_number}] "
+                                  f"{photo.exhibit.title} - {photo.photo.name}")
+        self.stdout.write(self.style.SUCCESS(
+            f"\nГрупп похожих фото: {len(clusters)} (проверено фото: {len(rows)})"))
+
+    def _tasks(self, queryset):
+        for photo in queryset.iterator():
+            try:
+                yield photo.pk, photo.photo.path
+            except NotImplementedError:
+                # Хранилище без локальных путей: передаем содержимое
+                with photo.photo.open('rb') as file:
+                    yield photo.pk, file.read()
+
+    def _hashed(self, pool, tasks, limit):
+        """Результаты hash_task по мере готовности; в работе не больше limit задач"""
+        tasks = iter(tasks)
+        pending = {pool.submit(hash_task, task) for task in islice(tasks, limit)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+            pending.update(pool.submit(hash_task, task) for task in islice(tasks, len(done)))
+
+    def _hash_photos(self, rehash, workers):
+        queryset = ExhibitPhoto.objects.exclude(photo='').only('pk', 'photo')
+        if not rehash:
+            queryset = queryset.filter(phash='')
+        # Дочерние процессы не должны наследовать открытые соединения с базой
+        connections.close_all()
+
+        batch, count = [], 0
+        workers = max(1, workers)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for pk, hashes in self._hashed(pool, self._tasks(queryset),
+                                           workers * TASKS_PER_WORKER):
+                if hashes is None:
+                    self.stderr.write(f"Не удалось прочитать фото #{pk}")
+                    # Отметка, чтобы не читать файл повторно при каждом запуске
+                    hashes = {'ahash': '', 'dhash': '', 'phash': ExhibitPhoto.HASH_FAILED}
+                batch.append(ExhibitPhoto(pk=pk, **hashes))
+                if len(batch) >= SAVE_BATCH:
+                    ExhibitPhoto.objects.bulk_update(batch, HASH_FIELDS)
+                    count += len(batch)
+                    batch = []
+        ExhibitPhoto.objects.bulk_update(batch, HASH_FIELDS)
+        count += len(batch)
+        if count:
+            duplicates.invalidate()
+        return count
@@ -0,0 +1,53 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from museum import dating, facets
+from museum.models import Exhibit
+
+SAVE_BATCH = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Разбирает датировку экспонатов (creation_date) в диапазон лет year_from/year_to - "
+        "для экспонатов, сохраненных до появления полей или после изменения разбора"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Ничего не сохранять, только показать результат")
+        parser.add_argument('--unparsed', type=int, default=20,
+                            help="Сколько самых частых нераспознанных записей показать")
+
+    def handle(self, *args, **options):
+        changed, batch = 0, []
+        parsed, unparsed = 0, Counter()
+        rows = Exhibit.objects.only('pk', 'creation_date', 'year_from', 'year_to').iterator()
+        for exhibit in rows:
+            year_from, year_to = dating.parse(exhibit.creation_date)
+            if year_from is not None:
+                parsed += 1
+            elif exhibit.creation_date.strip():
+                unparsed[exhibit.creation_date.strip()] += 1
+            if (year_from, year_to) == (exhibit.year_from, exhibit.year_to):
+                continue
+            exhibit.year_from, exhibit.year_to = year_from, year_to
+            batch.append(exhibit)
+            changed += 1
+            if len(batch) >= SAVE_BATCH and not options['dry_run']:
+                Exhibit.objects.bulk_update(batch, ['year_from', 'year_to'])
+                batch = []
+        if batch and not options['dry_run']:
+            Exhibit.objects.bulk_update(batch, ['year_from', 'year_to'])
+        if changed and not options['dry_run']:
+            # bulk_update не вызывает сигналов - сбрасываем счетчики хронологии сами
+            facets.invalidate()
+
+        if unparsed and options['unparsed']:
+            self.stdout.write("Нераспознанные датировки:")
+            for value, count in unparsed.most_common(options['unparsed']):
+                self.stdout.write(f"  {count:>5}  {value}")
+        action = "будет изменено" if options['dry_run'] else "изменено"
+        self.stdout.write(self.style.SUCCESS(
+            f"Распознано: {parsed}, не распознано: {sum(unparsed.values())}, {action}: {changed}"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from museum import reports
+
+
+class Command(BaseCommand):
+    help = "Полный пересчет снимков статистики коллекции (стоимость, количество)"
+
+    def handle(self, *args, **options):
+        count = reports.rebuild_all()
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано групп: {count}"))
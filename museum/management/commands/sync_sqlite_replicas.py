@@ -0,0 +1,49 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from museum.db_routers import replica_aliases, sync_marker
+
+
+class Command(BaseCommand):
+    help = (
+        "Копирует основную базу SQLite в файлы реплик (MUSEUM_DB_REPLICAS) "
+        "через backup API. Нужна для локальной проверки чтения с реплик."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Повторять каждые N секунд (0 - один раз)")
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError("Команда только для SQLite; в PostgreSQL используйте потоковую репликацию")
+        aliases = replica_aliases()
+        if not aliases:
+            raise CommandError("Реплики не настроены (MUSEUM_DB_REPLICAS)")
+
+        while True:
+            for alias in aliases:
+                self._copy(str(primary.settings_dict['NAME']),
+                           str(connections[alias].settings_dict['NAME']))
+                self.stdout.write(f"{alias}: синхронизирована")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def _copy(self, source_path, target_path):
+        started_at = time.time()
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(target_path)
+        try:
+            with target:
+                source.backup(target)
+        finally:
+            source.close()
+            target.close()
+        # По этой отметке роутер оценивает отставание реплики
+        with open(sync_marker(target_path), 'w') as marker:
+            marker.write(str(started_at))
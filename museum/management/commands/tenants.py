@@ -0,0 +1,114 @@
+import argparse
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+
+from museum import tenants
+from school_museum.database import tenant_config
+
+
+class Command(BaseCommand):
+    help = (
+        "Запускает команду управления для каждого музея параллельно, например: "
+        "tenants migrate --noinput; tenants --only school5 find_duplicate_photos. "
+        "Без команды - список музеев. После успешного migrate музей "
+        "отмечается готовым и открывается на сайте"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', default='',
+                            help="Только эти музеи (через запятую)")
+        parser.add_argument('--jobs', type=int, default=min(4, os.cpu_count() or 1),
+                            help="Сколько музеев обрабатывать одновременно")
+        parser.add_argument('--create', action='append', default=[], metavar='SLUG',
+                            help="Создать каталог и базу нового музея и применить миграции")
+        parser.add_argument('command_args', nargs=argparse.REMAINDER,
+                            help="Команда и ее аргументы")
+
+    def handle(self, *args, **options):
+        for slug in options['create']:
+            if not tenants.SLUG_RE.match(slug):
+                raise CommandError(f"Недопустимое имя музея: {slug}")
+        for slug in options['create']:
+            self._create_database(slug)
+            (tenants.tenant_dir(slug) / 'media').mkdir(parents=True, exist_ok=True)
+
+        selected = tenants.all_tenants()
+        if options['only']:
+            only = {slug.strip() for slug in options['only'].split(',') if slug.strip()}
+            unknown = only - set(selected)
+            if unknown:
+                raise CommandError(f"Неизвестные музеи: {', '.join(sorted(unknown))}")
+            selected = [slug for slug in selected if slug in only]
+
+        if options['create']:
+            self._run_all(options['create'], ['migrate', '--noinput'], options['jobs'])
+        command = options['command_args']
+        if not command:
+            if not options['create']:
+                for slug in selected:
+                    self.stdout.write(slug)
+                self.stdout.write(f"Музеев: {len(selected)}")
+            return
+        self._run_all(selected, command, options['jobs'])
+
+    def _create_database(self, slug):
+        """База PostgreSQL нового музея (файл SQLite создаст migrate)"""
+        if connection.vendor != 'postgresql':
+            return
+        name = tenant_config(connection.settings_dict, settings.MUSEUM_TENANTS_ROOT, slug)['NAME']
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", [name])
+                if cursor.fetchone() is None:
+                    # CREATE DATABASE не работает в транзакции - соединение в autocommit
+                    cursor.execute(f"CREATE DATABASE {connection.ops.quote_name(name)}")
+        except DatabaseError as error:
+            raise CommandError(
+                f"Не удалось создать базу {name} музея {slug}: {error}\n"
+                f"Дайте пользователю {connection.settings_dict['USER']} право CREATEDB "
+                f"или создайте базу вручную (CREATE DATABASE \"{name}\" OWNER "
+                f"\"{connection.settings_dict['USER']}\") и повторите --create {slug}"
+            ) from error
+        self.stdout.write(f"[{slug}] база {name}")
+
+    def _run(self, slug, command, interactive):
+        """Команда в отдельном процессе: в нем база 'default' и MEDIA_ROOT - этого музея"""
+        environment = {**os.environ, 'MUSEUM_TENANT': slug}
+        arguments = [sys.executable, str(settings.BASE_DIR / 'manage.py'), *command]
+        if interactive:
+            code, output = subprocess.run(arguments, env=environment).returncode, ''
+        else:
+            result = subprocess.run(arguments, env=environment, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT, text=True)
+            code, output = result.returncode, result.stdout
+        if not code and command[0] == 'migrate' and '--plan' not in command:
+            # База есть и миграции применены - сайт начнет открывать музей
+            tenants.mark_ready(slug)
+        return code, output
+
+    def _run_all(self, selected, command, jobs):
+        # Один музей - вывод и ввод напрямую (например, createsuperuser)
+        interactive = len(selected) == 1
+        failed = []
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            futures = {executor.submit(self._run, slug, command, interactive): slug
+                       for slug in selected}
+            for future in as_completed(futures):
+                slug = futures[future]
+                code, output = future.result()
+                for line in output.splitlines():
+                    self.stdout.write(f"[{slug}] {line}")
+                if code:
+                    failed.append(slug)
+                    self.stderr.write(f"[{slug}] завершилась с кодом {code}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{' '.join(command)}: музеев {len(selected) - len(failed)} из {len(selected)}"))
+        if failed:
+            raise CommandError(f"Ошибки в музеях: {', '.join(sorted(failed))}")
@@ -0,0 +1,56 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('museum', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exhibit',
+            name='barcode',
+            field=models.CharField(blank=True, db_index=True, max_length=50, verbose_name='Штрих-код'),
+        ),
+        migrations.CreateModel(
+            name='StocktakeSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200, verbose_name='Название')),
+                ('storage_location', models.CharField(blank=True, help_text='Оставьте пустым, чтобы проверять все места хранения', max_length=200, verbose_name='Место хранения')),
+                ('status', models.CharField(choices=[('open', 'Идет'), ('closed', 'Завершена')], default='open', max_length=20, verbose_name='Статус')),
+                ('started_at', models.DateTimeField(auto_now_add=True, verbose_name='Начата')),
+                ('closed_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершена')),
+                ('started_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Кем начата')),
+            ],
+            options={
+                'verbose_name': 'Инвентаризация',
+                'verbose_name_plural': 'Инвентаризации',
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StocktakeScan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=100, verbose_name='Считанный код')),
+                ('location', models.CharField(blank=True, max_length=200, verbose_name='Где найден')),
+                ('scanned_at', models.DateTimeField(auto_now_add=True, verbose_name='Когда')),
+                ('exhibit', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stocktake_scans', to='museum.exhibit', verbose_name='Экспонат')),
+                ('scanned_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Кем')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scans', to='museum.stocktakesession')),
+            ],
+            options={
+                'verbose_name': 'Сканирование',
+                'verbose_name_plural': 'Сканирования',
+                'ordering': ['-scanned_at'],
+                'indexes': [models.Index(fields=['session', 'exhibit'], name='museum_stoc_session_6b2294_idx')],
+            },
+        ),
+    ]
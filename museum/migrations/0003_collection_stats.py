@@ -0,0 +1,32 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('museum', '0002_stocktaking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('total', 'Вся коллекция'), ('category', 'Категория'), ('status', 'Статус'), ('storage_location', 'Место хранения'), ('acquisition_year', 'Год поступления'), ('condition', 'Состояние сохранности'), ('material', 'Материал')], max_length=30, verbose_name='Измерение')),
+                ('key', models.CharField(blank=True, max_length=300, verbose_name='Значение')),
+                ('label', models.CharField(blank=True, max_length=300, verbose_name='Подпись')),
+                ('exhibit_count', models.PositiveIntegerField(default=0, verbose_name='Экспонатов')),
+                ('estimated_total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Оценочная стоимость')),
+                ('insurance_total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Страховая стоимость')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Статистика коллекции',
+                'verbose_name_plural': 'Статистика коллекции',
+                'ordering': ['dimension', 'key'],
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'key'), name='unique_collection_stat')],
+            },
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Полнотекстовый индекс по страницам документов. В SQLite - внешняя таблица FTS5
+# (текст хранится только в museum_documentpage, индекс держат триггеры),
+# в PostgreSQL - GIN-индекс по tsvector.
+SQLITE_FTS = [
+    """CREATE VIRTUAL TABLE museum_documentpage_fts USING fts5(
+        text, content='museum_documentpage', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER museum_documentpage_ai AFTER INSERT ON museum_documentpage BEGIN
+        INSERT INTO museum_documentpage_fts(rowid, text) VALUES (new.id, new.text);
+    END""",
+    """CREATE TRIGGER museum_documentpage_ad AFTER DELETE ON museum_documentpage BEGIN
+        INSERT INTO museum_documentpage_fts(museum_documentpage_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END""",
+    """CREATE TRIGGER museum_documentpage_au AFTER UPDATE ON museum_documentpage BEGIN
+        INSERT INTO museum_documentpage_fts(museum_documentpage_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO museum_documentpage_fts(rowid, text) VALUES (new.id, new.text);
+    END""",
+]
+SQLITE_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS museum_documentpage_au",
+    "DROP TRIGGER IF EXISTS museum_documentpage_ad",
+    "DROP TRIGGER IF EXISTS museum_documentpage_ai",
+    "DROP TABLE IF EXISTS museum_documentpage_fts",
+]
+POSTGRESQL_FTS = [
+    "CREATE INDEX museum_documentpage_fts ON museum_documentpage "
+    "USING GIN (to_tsvector('russian', text))",
+]
+POSTGRESQL_FTS_DROP = ["DROP INDEX IF EXISTS museum_documentpage_fts"]
+
+
+def _run(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def create_fulltext_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_FTS, 'postgresql': POSTGRESQL_FTS})
+
+
+def drop_fulltext_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_FTS_DROP, 'postgresql': POSTGRESQL_FTS_DROP})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('museum', '0003_collection_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='extracted_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Текст извлечен'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='extraction_error',
+            field=models.CharField(blank=True, max_length=500, verbose_name='Ошибка извлечения'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='extraction_status',
+            field=models.CharField(choices=[('pending', 'Ожидает'), ('done', 'Текст извлечен'), ('empty', 'Текст не найден'), ('unsupported', 'Формат не поддерживается'), ('failed', 'Ошибка')], db_index=True, default='pending', max_length=20, verbose_name='Извлечение текста'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='page_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Страниц с текстом'),
+        ),
+        migrations.CreateModel(
+            name='DocumentPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(verbose_name='Страница')),
+                ('text', models.TextField(verbose_name='Текст')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='museum.document', verbose_name='Документ')),
+            ],
+            options={
+                'verbose_name': 'Страница документа',
+                'verbose_name_plural': 'Страницы документов',
+                'ordering': ['document', 'number'],
+                'constraints': [models.UniqueConstraint(fields=('document', 'number'), name='unique_document_page')],
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('museum', '0004_document_pages'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exhibitphoto',
+            name='ahash',
+            field=models.CharField(blank=True, editable=False, max_length=16, verbose_name='aHash'),
+        ),
+        migrations.AddField(
+            model_name='exhibitphoto',
+            name='dhash',
+            field=models.CharField(blank=True, editable=False, max_length=16, verbose_name='dHash'),
+        ),
+        migrations.AddField(
+            model_name='exhibitphoto',
+            name='phash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=16, verbose_name='pHash'),
+        ),
+    ]
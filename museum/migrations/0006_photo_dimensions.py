@@ -0,0 +1,46 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:40
+
+from django.core.files.images import get_image_dimensions
+from django.db import migrations, models
+
+
+def fill_dimensions(apps, schema_editor):
+    """Размеры уже загруженных фото (читается только заголовок файла)"""
+    ExhibitPhoto = apps.get_model('museum', 'ExhibitPhoto')
+    batch = []
+    for photo in ExhibitPhoto.objects.exclude(photo='').only('pk', 'photo').iterator():
+        try:
+            with photo.photo.open('rb') as file:
+                width, height = get_image_dimensions(file)
+        except (OSError, ValueError):
+            continue
+        if width and height:
+            photo.width, photo.height = width, height
+            batch.append(photo)
+    ExhibitPhoto.objects.bulk_update(batch, ['width', 'height'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('museum', '0005_photo_hashes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exhibitphoto',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота, px'),
+        ),
+        migrations.AddField(
+            model_name='exhibitphoto',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина, px'),
+        ),
+        migrations.AlterField(
+            model_name='exhibitphoto',
+            name='photo',
+            field=models.ImageField(height_field='height', upload_to='exhibit_photos/%Y/%m/%d/', verbose_name='Фотография', width_field='width'),
+        ),
+        migrations.RunPython(fill_dimensions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('museum', '0006_photo_dimensions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exhibit',
+            name='view_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Просмотров'),
+        ),
+        migrations.AddIndex(
+            model_name='exhibit',
+            index=models.Index(fields=['status', '-view_count'], name='exhibit_status_views_idx'),
+        ),
+    ]
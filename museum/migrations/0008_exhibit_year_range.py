@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('museum', '0007_exhibit_view_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exhibit',
+            name='year_from',
+            field=models.SmallIntegerField(blank=True, editable=False, null=True, verbose_name='Год создания, с'),
+        ),
+        migrations.AddField(
+            model_name='exhibit',
+            name='year_to',
+            field=models.SmallIntegerField(blank=True, editable=False, null=True, verbose_name='Год создания, по'),
+        ),
+        migrations.AddIndex(
+            model_name='exhibit',
+            index=models.Index(fields=['year_from', 'year_to'], name='exhibit_years_idx'),
+        ),
+    ]
@@ -1,8 +1,11 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils import timezone
 import os
 
+from . import dating
+
 # ==================== КАТЕГОРИИ ====================
 class Category(models.Model):
     """Категории экспонатов (например: Документы, Фотографии, Награды)"""
@@ -55,7 +58,7 @@ class Exhibit(models.Model):
                                        verbose_name="Инвентарный номер")
     catalog_number = models.CharField(max_length=100, blank=True,
                                      verbose_name="Каталожный номер")
-    barcode = models.CharField(max_length=50, blank=True,
+    barcode = models.CharField(max_length=50, blank=True, db_index=True,
                               verbose_name="Штрих-код")
     
     # ===== КЛАССИФИКАЦИЯ =====
@@ -71,6 +74,11 @@ class Exhibit(models.Model):
                                          verbose_name="Источник поступления")
     creation_date = models.CharField(max_length=100, blank=True,
                                     verbose_name="Дата создания (оригинала)")
+    # Диапазон лет, разобранный из creation_date при сохранении (museum/dating.py)
+    year_from = models.SmallIntegerField(null=True, blank=True, editable=False,
+                                         verbose_name="Год создания, с")
+    year_to = models.SmallIntegerField(null=True, blank=True, editable=False,
+                                       verbose_name="Год создания, по")
     author = models.CharField(max_length=200, blank=True,
                              verbose_name="Автор/Изготовитель")
     historical_context = models.TextField(blank=True,
@@ -101,6 +109,9 @@ class Exhibit(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES,
                              default='draft', verbose_name="Статус")
     is_featured = models.BooleanField(default=False, verbose_name="Показать на главной")
+    # Обновляется пачками из museum/popularity.py, не через save()
+    view_count = models.PositiveIntegerField(default=0, editable=False,
+                                             verbose_name="Просмотров")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL,
@@ -114,6 +125,12 @@ class Exhibit(models.Model):
         verbose_name = "Экспонат"
         verbose_name_plural = "Экспонаты"
         ordering = ['-created_at']
+        indexes = [
+            # Сортировка "самые просматриваемые" среди опубликованных
+            models.Index(fields=['status', '-view_count'], name='exhibit_status_views_idx'),
+            # Пересечение периодов: year_from <= конец AND year_to >= начало
+            models.Index(fields=['year_from', 'year_to'], name='exhibit_years_idx'),
+        ]
         permissions = [
             ("can_publish", "Может публиковать экспонаты"),
             ("can_archive", "Может отправлять в архив"),
@@ -125,14 +142,35 @@ class Exhibit(models.Model):
     def get_absolute_url(self):
         return reverse('exhibit_detail', kwargs={'pk': self.pk})
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Значения, прочитанные из базы: сигналы сравнивают с ними без нового SELECT
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    def save(self, *args, **kwargs):
+        self.year_from, self.year_to = dating.parse(self.creation_date)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'creation_date' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'year_from', 'year_to'}
+        super().save(*args, **kwargs)
+    
+    def get_dating_display(self):
+        """Разобранная датировка для показа: 1941 или 1940–1949"""
+        return dating.format_range(self.year_from, self.year_to)
+    
     def get_primary_photo(self):
         """Получает главное фото экспоната"""
-        primary = self.photos.filter(is_primary=True).first()
-        if primary:
-            return primary
-        # Если нет главного, берем первое
+        # Сортировка фото ставит главное первым, иначе берется самое раннее - один запрос
         return self.photos.first()
     
+    def get_tag_list(self):
+        """Список тегов (в базе хранятся строкой через запятую)"""
+        if not self.tags:
+            return []
+        return [tag.strip() for tag in self.tags.split(',') if tag.strip()]
+    
     def get_photo_count(self):
         """Количество фотографий экспоната"""
         return self.photos.count()
@@ -148,7 +186,12 @@ class ExhibitPhoto(models.Model):
     exhibit = models.ForeignKey(Exhibit, on_delete=models.CASCADE,
                                related_name='photos')
     photo = models.ImageField(upload_to='exhibit_photos/%Y/%m/%d/',
+                             width_field='width', height_field='height',
                              verbose_name="Фотография")
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False,
+                                        verbose_name="Ширина, px")
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False,
+                                         verbose_name="Высота, px")
     title = models.CharField(max_length=200, blank=True,
                             verbose_name="Название фотографии")
     description = models.TextField(blank=True, verbose_name="Описание")
@@ -157,6 +200,16 @@ class ExhibitPhoto(models.Model):
     uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL,
                                    null=True, verbose_name="Кем загружено")
     
+    # Перцептивные хэши для поиска повторных загрузок (museum/imagehash.py)
+    ahash = models.CharField(max_length=16, blank=True, editable=False, verbose_name="aHash")
+    dhash = models.CharField(max_length=16, blank=True, editable=False, verbose_name="dHash")
+    phash = models.CharField(max_length=16, blank=True, editable=False, db_index=True,
+                             verbose_name="pHash")
+    
+    # Значение phash, если файл не удалось прочитать: повторно хэши не считаются,
+    # пока файл не заменят (или команда find_duplicate_photos --rehash)
+    HASH_FAILED = '-'
+    
     class Meta:
         verbose_name = "Фотография экспоната"
         verbose_name_plural = "Фотографии экспонатов"
@@ -169,7 +222,58 @@ class ExhibitPhoto(models.Model):
         # Если это фото установлено как главное, снимаем флаг с других фото этого экспоната
         if self.is_primary:
             ExhibitPhoto.objects.filter(exhibit=self.exhibit, is_primary=True).update(is_primary=False)
+        # Хэши считаются для нового или замененного файла
+        if self.photo and (not self.phash or not self.photo._committed):
+            self.update_hashes()
         super().save(*args, **kwargs)
+    
+    def update_hashes(self):
+        """Пересчитывает перцептивные хэши фото (HASH_FAILED, если файл не читается)"""
+        from .imagehash import compute_hashes
+        
+        try:
+            self.photo.open('rb')
+            hashes = compute_hashes(self.photo)
+        except (OSError, ValueError, SyntaxError):
+            hashes = {'ahash': '', 'dhash': '', 'phash': self.HASH_FAILED}
+        finally:
+            if self.photo._committed:
+                self.photo.close()
+            else:
+                # Загружаемый файл еще будет прочитан хранилищем при сохранении
+                self.photo.seek(0)
+        for name, value in hashes.items():
+            setattr(self, name, value)
+    
+    # Большие сканы показываются тайлами (museum/deepzoom.py)
+    def is_zoomable(self):
+        from .deepzoom import is_zoomable, version
+        # Шаблон спрашивает несколько раз на фото - ответ запоминается для версии файла
+        current = version(self)
+        if getattr(self, '_zoomable', (None, None))[0] != current:
+            self._zoomable = (current, is_zoomable(self))
+        return self._zoomable[1]
+    
+    def get_preview_url(self, size):
+        """Уменьшенная копия для больших сканов, оригинал - для обычных фото"""
+        from .deepzoom import version
+        if not self.is_zoomable():
+            return self.photo.url
+        return reverse('museum:photo_preview',
+                       kwargs={'pk': self.pk, 'photo_version': version(self), 'size': size})
+    
+    def get_thumbnail_url(self):
+        return self.get_preview_url(160)
+    
+    def get_card_url(self):
+        return self.get_preview_url(480)
+    
+    def get_display_url(self):
+        return self.get_preview_url(1200)
+    
+    def get_dzi_url(self):
+        from .deepzoom import version
+        return reverse('museum:photo_dzi', kwargs={'pk': self.pk, 'photo_version': version(self)})
 
 
 # ==================== ДОКУМЕНТЫ К ЭКСПОНАТУ ====================
@@ -196,6 +300,22 @@ class Document(models.Model):
     uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL,
                                    null=True, verbose_name="Кем загружен")
     
+    # Извлечение текста (museum/documents.py)
+    EXTRACTION_STATUSES = [
+        ('pending', 'Ожидает'),
+        ('done', 'Текст извлечен'),
+        ('empty', 'Текст не найден'),
+        ('unsupported', 'Формат не поддерживается'),
+        ('failed', 'Ошибка'),
+    ]
+    extraction_status = models.CharField(max_length=20, choices=EXTRACTION_STATUSES,
+                                         default='pending', db_index=True,
+                                         verbose_name="Извлечение текста")
+    page_count = models.PositiveIntegerField(default=0, verbose_name="Страниц с текстом")
+    extracted_at = models.DateTimeField(null=True, blank=True, verbose_name="Текст извлечен")
+    extraction_error = models.CharField(max_length=500, blank=True,
+                                        verbose_name="Ошибка извлечения")
+    
     class Meta:
         verbose_name = "Документ"
         verbose_name_plural = "Документы"
@@ -209,6 +329,29 @@ class Document(models.Model):
         return os.path.splitext(self.document.name)[1].lower()
 
 
+class DocumentPage(models.Model):
+    """
+    Текст одной страницы документа (для текстовых файлов - фрагмента).
+    Полнотекстовый индекс по нему создается миграцией: FTS5 в SQLite, GIN в PostgreSQL.
+    """
+    document = models.ForeignKey(Document, on_delete=models.CASCADE,
+                                 related_name='pages', verbose_name="Документ")
+    number = models.PositiveIntegerField(verbose_name="Страница")
+    text = models.TextField(verbose_name="Текст")
+    
+    class Meta:
+        verbose_name = "Страница документа"
+        verbose_name_plural = "Страницы документов"
+        ordering = ['document', 'number']
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'number'],
+                                    name='unique_document_page'),
+        ]
+    
+    def __str__(self):
+        return f"{self.document} - стр. {self.number}"
+
+
 # ==================== ИСТОРИЯ ИЗМЕНЕНИЙ ====================
 class ExhibitHistory(models.Model):
     """История изменений экспоната (кто, когда и что изменил)"""
@@ -240,4 +383,108 @@ class ExhibitHistory(models.Model):
         ordering = ['-changed_at']
     
     def __str__(self):
-        return f"{self.get_action_display()} - {self.exhibit.title}"
\ No newline at end of file
+        return f"{self.get_action_display()} - {self.exhibit.title}"
+
+
+# ==================== ИНВЕНТАРИЗАЦИЯ ====================
+class StocktakeSession(models.Model):
+    """Сессия инвентаризации: сверка фактического наличия экспонатов"""
+    STATUS_CHOICES = [
+        ('open', 'Идет'),
+        ('closed', 'Завершена'),
+    ]
+    
+    title = models.CharField(max_length=200, verbose_name="Название")
+    storage_location = models.CharField(max_length=200, blank=True,
+                                       verbose_name="Место хранения",
+                                       help_text="Оставьте пустым, чтобы проверять все места хранения")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES,
+                             default='open', verbose_name="Статус")
+    started_at = models.DateTimeField(auto_now_add=True, verbose_name="Начата")
+    closed_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершена")
+    started_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True,
+                                  verbose_name="Кем начата")
+    
+    class Meta:
+        verbose_name = "Инвентаризация"
+        verbose_name_plural = "Инвентаризации"
+        ordering = ['-started_at']
+    
+    def __str__(self):
+        return f"{self.title} ({self.started_at:%d.%m.%Y})"
+    
+    def get_absolute_url(self):
+        return reverse('museum:stocktake_report', kwargs={'pk': self.pk})
+    
+    def close(self):
+        """Завершить инвентаризацию"""
+        self.status = 'closed'
+        self.closed_at = timezone.now()
+        self.save(update_fields=['status', 'closed_at'])
+
+
+class StocktakeScan(models.Model):
+    """Одно сканирование штрих-кода или инвентарного номера"""
+    session = models.ForeignKey(StocktakeSession, on_delete=models.CASCADE,
+                               related_name='scans')
+    code = models.CharField(max_length=100, verbose_name="Считанный код")
+    exhibit = models.ForeignKey(Exhibit, on_delete=models.SET_NULL, null=True,
+                               blank=True, related_name='stocktake_scans',
+                               verbose_name="Экспонат")
+    location = models.CharField(max_length=200, blank=True,
+                               verbose_name="Где найден")
+    scanned_at = models.DateTimeField(auto_now_add=True, verbose_name="Когда")
+    scanned_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True,
+                                  verbose_name="Кем")
+    
+    class Meta:
+        verbose_name = "Сканирование"
+        verbose_name_plural = "Сканирования"
+        ordering = ['-scanned_at']
+        indexes = [
+            models.Index(fields=['session', 'exhibit']),
+        ]
+    
+    def __str__(self):
+        return self.code
+
+
+# ==================== СТАТИСТИКА КОЛЛЕКЦИИ ====================
+class CollectionStat(models.Model):
+    """
+    Снимок агрегатов по коллекции: количество и суммарная стоимость
+    в разрезе одного измерения (категория, статус, место хранения и т.д.).
+    Обновляется точечно при сохранении экспонатов.
+    """
+    DIMENSION_CHOICES = [
+        ('total', 'Вся коллекция'),
+        ('category', 'Категория'),
+        ('status', 'Статус'),
+        ('storage_location', 'Место хранения'),
+        ('acquisition_year', 'Год поступления'),
+        ('condition', 'Состояние сохранности'),
+        ('material', 'Материал'),
+    ]
+    
+    dimension = models.CharField(max_length=30, choices=DIMENSION_CHOICES,
+                                verbose_name="Измерение")
+    key = models.CharField(max_length=300, blank=True, verbose_name="Значение")
+    label = models.CharField(max_length=300, blank=True, verbose_name="Подпись")
+    exhibit_count = models.PositiveIntegerField(default=0, verbose_name="Экспонатов")
+    estimated_total = models.DecimalField(max_digits=14, decimal_places=2, default=0,
+                                         verbose_name="Оценочная стоимость")
+    insurance_total = models.DecimalField(max_digits=14, decimal_places=2, default=0,
+                                         verbose_name="Страховая стоимость")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+    
+    class Meta:
+        verbose_name = "Статистика коллекции"
+        verbose_name_plural = "Статистика коллекции"
+        ordering = ['dimension', 'key']
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key'],
+                                    name='unique_collection_stat'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_dimension_display()}: {self.label or self.key}"
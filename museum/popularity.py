@@ -0,0 +1,177 @@
+"""
+Счетчики просмотров экспонатов и блок "Самые просматриваемые".
+
+Запись в базу на каждый просмотр выстраивала бы запросы в очередь на
+блокировке SQLite, поэтому просмотры копятся в памяти процесса и сбрасываются
+одним UPDATE на пачку экспонатов (view_count = view_count + дельта) раз
+в FLUSH_INTERVAL секунд (фоновый поток процесса - даже если новых просмотров
+нет), при накоплении FLUSH_SIZE экспонатов и при штатной остановке процесса.
+Если процесс убит (SIGKILL, нехватка памяти), теряется не больше
+FLUSH_INTERVAL секунд просмотров. Сброс прибавляет дельты, поэтому воркеры не мешают друг другу;
+буфер общий для всех музеев процесса, каждая дельта уходит в базу своего музея.
+
+Не считаются: роботы, предзагрузка браузером, сотрудники и повторный
+просмотр того же посетителя в течение DEDUP_WINDOW (метка в общем кэше).
+"""
+import atexit
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import DatabaseError, close_old_connections
+from django.db.models import Case, F, Value, When
+
+from . import tenants
+from .models import Exhibit
+
+logger = logging.getLogger(__name__)
+
+DEDUP_WINDOW = 60 * 30           # сек, повторные просмотры одного посетителя не считаются
+FLUSH_INTERVAL = 30              # сек между сбросами в базу
+FLUSH_SIZE = 200                 # экспонатов в буфере, после которых сброс не ждет
+UPDATE_BATCH = 500               # экспонатов в одном UPDATE
+POPULAR_LIMIT = 6
+POPULAR_TIMEOUT = 60 * 10
+POPULAR_KEY = 'popularity:top'
+
+BOT_PATTERN = re.compile(
+    r'bot|crawl|spider|slurp|yandex|mediapartners|facebookexternalhit|preview|'
+    r'curl|wget|python-|httpx|okhttp|java/|go-http|headless|lighthouse|monitor',
+    re.IGNORECASE,
+)
+
+_pending = Counter()
+_lock = threading.Lock()
+_last_flush = time.monotonic()
+_flusher_pid = None              # процесс, в котором запущен фоновый сброс
+
+
+# ==================== УЧЕТ ПРОСМОТРОВ ====================
+def is_bot(request):
+    agent = request.META.get('HTTP_USER_AGENT', '')
+    return not agent or bool(BOT_PATTERN.search(agent))
+
+
+def is_prefetch(request):
+    purpose = request.headers.get('Sec-Purpose') or request.headers.get('Purpose') or ''
+    return 'prefetch' in purpose or 'prerender' in purpose
+
+
+def visitor_id(request):
+    """Сессия посетителя, а без нее - адрес и браузер (сессия ради счетчика не создается)"""
+    session_key = request.session.session_key if hasattr(request, 'session') else None
+    if session_key:
+        return session_key
+    source = f"{request.META.get('REMOTE_ADDR', '')}|{request.META.get('HTTP_USER_AGENT', '')}"
+    return hashlib.sha1(source.encode()).hexdigest()
+
+
+def record_view(request, exhibit):
+    """Учитывает просмотр страницы экспоната. Возвращает True, если просмотр засчитан."""
+    if request.method != 'GET' or is_bot(request) or is_prefetch(request):
+        return False
+    if request.user.is_staff:
+        return False
+    # Первый просмотр за окно добавляет метку; повторный add не проходит
+    if not cache.add(f'popularity:seen:{exhibit.pk}:{visitor_id(request)}', 1, DEDUP_WINDOW):
+        return False
+    with _lock:
+        _pending[(tenants.current(), exhibit.pk)] += 1
+        due = len(_pending) >= FLUSH_SIZE or time.monotonic() - _last_flush >= FLUSH_INTERVAL
+    _start_flusher()
+    if due:
+        flush()
+    return True
+
+
+# ==================== СБРОС В БАЗУ ====================
+def _save(counts):
+    """UPDATE по пачкам для одного музея; возвращает несохраненный остаток"""
+    items = sorted(counts.items())
+    for start in range(0, len(items), UPDATE_BATCH):
+        batch = items[start:start + UPDATE_BATCH]
+        delta = Case(*[When(pk=pk, then=Value(count)) for pk, count in batch], default=Value(0))
+        try:
+            Exhibit.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+                view_count=F('view_count') + delta
+            )
+        except DatabaseError:
+            logger.warning("Не удалось сохранить просмотры, повтор при следующем сбросе",
+                           exc_info=True)
+            return dict(items[start:])
+    return {}
+
+
+def flush():
+    """Записывает накопленные просмотры в базу (каждого музея). Возвращает число экспонатов."""
+    global _last_flush
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+
+    by_tenant = {}
+    for (tenant, pk), count in pending.items():
+        by_tenant.setdefault(tenant, {})[pk] = count
+    saved = 0
+    for tenant, counts in by_tenant.items():
+        with tenants.activate(tenant):
+            failed = _save(counts)
+        saved += len(counts) - len(failed)
+        if failed:
+            # База занята или недоступна - вернем дельты в буфер до следующего сброса
+            with _lock:
+                for pk, count in failed.items():
+                    _pending[(tenant, pk)] += count
+    return saved
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        if not _pending:
+            continue
+        close_old_connections()
+        try:
+            flush()
+        except Exception:
+            logger.exception("Ошибка фонового сброса просмотров")
+
+
+def _start_flusher():
+    """Запускает фоновый сброс в этом процессе (после fork поток нужно запустить заново)"""
+    global _flusher_pid
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_periodically, name='popularity-flush', daemon=True).start()
+
+
+atexit.register(flush)
+
+
+# ==================== ПОПУЛЯРНЫЕ ЭКСПОНАТЫ ====================
+def popular_ids(limit=POPULAR_LIMIT):
+    """id самых просматриваемых опубликованных экспонатов (кэшируются на POPULAR_TIMEOUT)"""
+    ids = cache.get(POPULAR_KEY)
+    if ids is None:
+        ids = list(
+            Exhibit.objects.filter(status='published', view_count__gt=0)
+            .order_by('-view_count', '-created_at')
+            .values_list('pk', flat=True)[:POPULAR_LIMIT]
+        )
+        cache.set(POPULAR_KEY, ids, POPULAR_TIMEOUT)
+    return ids[:limit]
+
+
+def popular_exhibits(limit=POPULAR_LIMIT):
+    """Самые просматриваемые экспонаты по порядку (снятые с публикации пропускаются)"""
+    ids = popular_ids(limit)
+    exhibits = Exhibit.objects.filter(status='published').select_related('category').in_bulk(ids)
+    return [exhibits[pk] for pk in ids if pk in exhibits]
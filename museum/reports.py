@@ -0,0 +1,379 @@
+"""
+Отчеты по стоимости и составу коллекции.
+
+Агрегаты считаются в базе (GROUP BY, на PostgreSQL - GROUP BY ROLLUP)
+и хранятся в CollectionStat. При сохранении экспоната пересчитываются
+только затронутые группы, поэтому панель отчетов читает готовые строки
+и не зависит от размера коллекции.
+"""
+import csv
+import functools
+import operator
+import tempfile
+from decimal import Decimal
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections, router, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import ExtractYear
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.shortcuts import render
+from django.utils import timezone
+
+from .db_routers import use_primary
+from .models import Exhibit, Category, CollectionStat
+
+# Состояние сохранности - свободный текст, в отчете оно сводится к нескольким
+# оценкам, чтобы число строк не росло вместе с коллекцией. Оценка ищется
+# по основе слова без первой буквы - так не важен регистр ни в одной базе.
+# Порядок важен: "неудовлетворительное" проверяется раньше "удовлетворительного".
+CONDITION_GRADES = [
+    ('poor', 'Плохое, нужна реставрация', ('еудовлетвор', 'лох', 'варийн', 'еставрац', 'азруш')),
+    ('fair', 'Удовлетворительное', ('довлетвор',)),
+    ('good', 'Хорошее', ('орош',)),
+    ('excellent', 'Отличное', ('тличн',)),
+]
+CONDITION_OTHER = ('other', 'Другое (см. описание)')
+
+
+def condition_grade(text):
+    """Оценка состояния по тексту (то же, что _condition_expression в базе)"""
+    if not text:
+        return ''
+    for code, _, stems in CONDITION_GRADES:
+        if any(stem in text for stem in stems):
+            return code
+    return CONDITION_OTHER[0]
+
+
+def _condition_expression():
+    return Case(
+        When(Q(condition=''), then=Value('')),
+        *[When(functools.reduce(operator.or_, [Q(condition__contains=stem) for stem in stems]),
+               then=Value(code))
+          for code, _, stems in CONDITION_GRADES],
+        default=Value(CONDITION_OTHER[0]),
+    )
+
+
+def _condition_sql():
+    whens = ' '.join(
+        'WHEN ' + ' OR '.join(f"condition LIKE '%%{stem}%%'" for stem in stems) + f" THEN '{code}'"
+        for code, _, stems in CONDITION_GRADES
+    )
+    return f"CASE WHEN condition = '' THEN '' {whens} ELSE '{CONDITION_OTHER[0]}' END"
+
+
+# Измерение -> выражение группировки в ORM
+DIMENSIONS = {
+    'category': F('category_id'),
+    'status': F('status'),
+    'storage_location': F('storage_location'),
+    'acquisition_year': ExtractYear('acquisition_date'),
+    'condition': _condition_expression(),
+    'material': F('material'),
+}
+
+# Те же измерения в SQL (для ROLLUP на PostgreSQL)
+DIMENSION_SQL = {
+    'category': 'category_id',
+    'status': 'status',
+    'storage_location': 'storage_location',
+    'acquisition_year': 'CAST(EXTRACT(YEAR FROM acquisition_date) AS integer)',
+    'condition': _condition_sql(),
+    'material': 'material',
+}
+
+KEY_LENGTH = CollectionStat._meta.get_field('key').max_length
+
+
+def _aggregates():
+    return {
+        'exhibit_count': Count('id'),
+        'estimated_total': Sum('estimated_value'),
+        'insurance_total': Sum('insurance_value'),
+    }
+
+
+def _key(value):
+    return '' if value is None else str(value)[:KEY_LENGTH]
+
+
+def _labels(dimension, keys):
+    """Человекочитаемые подписи для значений измерения"""
+    if dimension == 'category':
+        ids = [int(key) for key in keys if key]
+        names = dict(Category.objects.filter(pk__in=ids).values_list('pk', 'name'))
+        return {key: names.get(int(key), key) if key else 'Без категории' for key in keys}
+    if dimension == 'status':
+        choices = dict(Exhibit.STATUS_CHOICES)
+        return {key: choices.get(key, key) for key in keys}
+    if dimension == 'condition':
+        grades = {code: label for code, label, _ in CONDITION_GRADES}
+        grades[CONDITION_OTHER[0]] = CONDITION_OTHER[1]
+        return {key: grades.get(key, key) if key else '— не указано —' for key in keys}
+    return {key: key or '— не указано —' for key in keys}
+
+
+def _stat(dimension, key, values, label=''):
+    return CollectionStat(
+        dimension=dimension,
+        key=key,
+        label=label[:KEY_LENGTH],
+        exhibit_count=values['exhibit_count'] or 0,
+        estimated_total=values['estimated_total'] or Decimal('0'),
+        insurance_total=values['insurance_total'] or Decimal('0'),
+    )
+
+
+# ==================== ПОЛНЫЙ ПЕРЕСЧЕТ ====================
+def _grouped(dimension, queryset=None):
+    """[(ключ, агрегаты)] для измерения"""
+    queryset = Exhibit.objects.all() if queryset is None else queryset
+    rows = (queryset.order_by()
+            .annotate(group_key=DIMENSIONS[dimension])
+            .values('group_key')
+            .annotate(**_aggregates()))
+    return _merge((_key(row.pop('group_key')), row) for row in rows)
+
+
+def _merge(groups):
+    """Складывает группы, которые дали одинаковый ключ (обрезанные длинные значения)"""
+    merged = {}
+    for key, values in groups:
+        if key in merged:
+            for name, value in values.items():
+                merged[key][name] = (merged[key][name] or 0) + (value or 0)
+        else:
+            merged[key] = dict(values)
+    return list(merged.items())
+
+
+def _grouped_rollup(dimension):
+    """То же через GROUP BY ROLLUP: группы и итог одним запросом (PostgreSQL)"""
+    column = DIMENSION_SQL[dimension]
+    sql = (
+        f"SELECT {column}, GROUPING({column}), COUNT(*), "
+        f"SUM(estimated_value), SUM(insurance_value) "
+        f"FROM {Exhibit._meta.db_table} GROUP BY ROLLUP ({column})"
+    )
+    groups, total = [], None
+    with connections[router.db_for_read(Exhibit)].cursor() as cursor:
+        cursor.execute(sql)
+        for value, is_total, count, estimated, insurance in cursor.fetchall():
+            values = {'exhibit_count': count, 'estimated_total': estimated,
+                      'insurance_total': insurance}
+            if is_total:
+                total = values
+            else:
+                groups.append((_key(value), values))
+    return _merge(groups), total
+
+
+@use_primary()
+def rebuild_all():
+    """Полный пересчет всех снимков (команда refresh_collection_stats)"""
+    stats = []
+    total = None
+    use_rollup = connections[router.db_for_read(Exhibit)].vendor == 'postgresql'
+    for dimension in DIMENSIONS:
+        if use_rollup:
+            groups, total = _grouped_rollup(dimension)
+        else:
+            groups = _grouped(dimension)
+        labels = _labels(dimension, [key for key, _ in groups])
+        stats.extend(_stat(dimension, key, values, labels[key]) for key, values in groups)
+
+    if total is None:
+        total = Exhibit.objects.aggregate(**_aggregates())
+    stats.append(_stat('total', '', total, 'Вся коллекция'))
+
+    with transaction.atomic(using=router.db_for_write(CollectionStat)):
+        CollectionStat.objects.all().delete()
+        CollectionStat.objects.bulk_create(stats)
+    return len(stats)
+
+
+# ==================== ТОЧЕЧНОЕ ОБНОВЛЕНИЕ ====================
+def dimension_keys(values):
+    """Ключи групп, в которые попадает экспонат (по словарю значений полей)"""
+    acquired = values.get('acquisition_date')
+    return {
+        'category': _key(values.get('category_id')),
+        'status': _key(values.get('status')),
+        'storage_location': _key(values.get('storage_location')),
+        'acquisition_year': _key(acquired.year if acquired else None),
+        'condition': condition_grade(values.get('condition')),
+        'material': _key(values.get('material')),
+    }
+
+
+SOURCE_FIELDS = ('category_id', 'status', 'storage_location', 'acquisition_date',
+                 'condition', 'material')
+
+
+def _group_filter(dimension, keys):
+    """Условие отбора экспонатов, попадающих в группы keys"""
+    numeric = dimension in ('category', 'acquisition_year')
+    condition = Q()
+    values = [int(key) if numeric else key for key in keys if key]
+    if values:
+        condition |= Q(filter_key__in=values)
+    for key in keys:
+        # Длинные значения (состояние сохранности) хранятся в ключе обрезанными
+        if not numeric and len(key) == KEY_LENGTH:
+            condition |= Q(filter_key__startswith=key)
+    if '' in keys:
+        condition |= Q(filter_key__isnull=True)
+        if not numeric:
+            condition |= Q(filter_key='')
+    return condition
+
+
+@use_primary()
+def refresh_groups(affected):
+    """
+    Пересчитывает только указанные группы: {измерение: {ключи}}.
+    Каждое измерение - один GROUP BY по отфильтрованным строкам.
+    """
+    fields = ('label', 'exhibit_count', 'estimated_total', 'insurance_total')
+    with transaction.atomic(using=router.db_for_write(CollectionStat)):
+        for dimension, keys in affected.items():
+            if not keys:
+                continue
+            queryset = (Exhibit.objects.alias(filter_key=DIMENSIONS[dimension])
+                        .filter(_group_filter(dimension, keys)))
+            groups = dict(_grouped(dimension, queryset))
+            labels = _labels(dimension, list(keys))
+            for key in keys:
+                if key in groups:
+                    stat = _stat(dimension, key, groups[key], labels[key])
+                    CollectionStat.objects.update_or_create(
+                        dimension=dimension, key=key,
+                        defaults={field: getattr(stat, field) for field in fields},
+                    )
+                else:
+                    CollectionStat.objects.filter(dimension=dimension, key=key).delete()
+
+        total = _stat('total', '', Exhibit.objects.aggregate(**_aggregates()), 'Вся коллекция')
+        CollectionStat.objects.update_or_create(
+            dimension='total', key='',
+            defaults={field: getattr(total, field) for field in fields},
+        )
+
+
+def refresh_deleted_category(category_id):
+    """
+    Удаление категории обнуляет ее экспонатам category_id одним UPDATE без
+    сигналов - пересчитываем группу категории (строка удалится) и "Без категории"
+    """
+    refresh_groups({'category': {_key(category_id), ''}})
+
+
+def refresh_category_label(category):
+    CollectionStat.objects.filter(dimension='category', key=str(category.pk)) \
+        .update(label=category.name[:KEY_LENGTH])
+
+
+# ==================== ВЫГРУЗКА ====================
+class _Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+SUMMARY_HEADER = ['Измерение', 'Значение', 'Экспонатов', 'Оценочная стоимость',
+                  'Страховая стоимость']
+ITEMS_HEADER = ['Инвентарный номер', 'Название', 'Категория', 'Статус',
+                'Место хранения', 'Год поступления', 'Материал',
+                'Оценочная стоимость', 'Страховая стоимость']
+
+
+def _summary_rows():
+    dimensions = dict(CollectionStat.DIMENSION_CHOICES)
+    for stat in CollectionStat.objects.all().iterator():
+        yield [dimensions.get(stat.dimension, stat.dimension), stat.label or stat.key,
+               stat.exhibit_count, stat.estimated_total, stat.insurance_total]
+
+
+def _item_rows():
+    statuses = dict(Exhibit.STATUS_CHOICES)
+    rows = Exhibit.objects.order_by('inventory_number').values_list(
+        'inventory_number', 'title', 'category__name', 'status', 'storage_location',
+        'acquisition_date', 'material', 'estimated_value', 'insurance_value',
+    )
+    for (number, title, category, status, location, acquired, material,
+         estimated, insurance) in rows.iterator(chunk_size=2000):
+        yield [number, title, category or '', statuses.get(status, status), location,
+               acquired.year if acquired else '', material,
+               estimated if estimated is not None else '',
+               insurance if insurance is not None else '']
+
+
+REPORTS = {
+    'summary': (SUMMARY_HEADER, _summary_rows),
+    'items': (ITEMS_HEADER, _item_rows),
+}
+
+
+def _stream_csv(header, rows):
+    writer = csv.writer(_Echo(), delimiter=';')
+    yield '\ufeff'  # BOM, чтобы Excel правильно открыл UTF-8
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _xlsx_file(header, rows):
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise Http404("Выгрузка в XLSX недоступна: не установлен openpyxl")
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Отчет')
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+# ==================== ПРЕДСТАВЛЕНИЯ ====================
+@staff_member_required
+def dashboard(request):
+    """Панель отчетов: читает только готовые снимки"""
+    stats = {}
+    for stat in CollectionStat.objects.all():
+        stats.setdefault(stat.dimension, []).append(stat)
+    total = stats.pop('total', [None])[0]
+    sections = [
+        {'dimension': code, 'title': title,
+         'stats': sorted(stats.get(code, []), key=lambda s: -s.insurance_total)}
+        for code, title in CollectionStat.DIMENSION_CHOICES if code != 'total'
+    ]
+    return render(request, 'museum/reports_dashboard.html', {
+        'total': total,
+        'sections': sections,
+    })
+
+
+@staff_member_required
+def export(request, report, fmt):
+    """Выгрузка отчета в CSV (потоково) или XLSX"""
+    if report not in REPORTS or fmt not in ('csv', 'xlsx'):
+        raise Http404("Неизвестный отчет")
+    header, rows = REPORTS[report]
+    filename = f"museum-{report}-{timezone.localdate():%Y-%m-%d}.{fmt}"
+
+    if fmt == 'xlsx':
+        return FileResponse(_xlsx_file(header, rows()), as_attachment=True,
+                            filename=filename)
+
+    response = StreamingHttpResponse(_stream_csv(header, rows()),
+                                     content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
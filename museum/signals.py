@@ -0,0 +1,140 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DEFERRED
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import autocomplete, documents, duplicates, facets, reports
+from .models import Exhibit, Category, ExhibitPhoto, Document
+from .templatetags import museum_extras
+
+
+@receiver(post_save, sender=Exhibit)
+@receiver(post_delete, sender=Exhibit)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_facets(sender, **kwargs):
+    """Любое изменение экспоната или категории сбрасывает фасетный индекс"""
+    facets.invalidate()
+
+
+@receiver(post_save, sender=Exhibit)
+@receiver(post_delete, sender=Exhibit)
+def refresh_autocomplete(sender, instance, using, **kwargs):
+    """Точечно обновляет подсказки поиска после фиксации транзакции"""
+    pk = instance.pk
+    transaction.on_commit(lambda: autocomplete.refresh_exhibit(pk), using=using)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_autocomplete(sender, using, **kwargs):
+    """Названия категорий входят в подсказки - перестраиваем индекс целиком"""
+    transaction.on_commit(autocomplete.invalidate, using=using)
+
+
+@receiver(pre_save, sender=Exhibit)
+def remember_stat_groups(sender, instance, update_fields=None, **kwargs):
+    """
+    Запоминаем группы статистики до изменения, чтобы пересчитать и их.
+    Прежние значения берутся из прочитанных из базы (Exhibit.from_db):
+    SELECT нужен, только если экспонат загружен без этих полей.
+    """
+    instance._stat_groups = {}
+    if instance._state.adding or not instance.pk:
+        return
+    if update_fields is not None:
+        changed = {Exhibit._meta.get_field(name).attname for name in update_fields}
+        if not changed & set(reports.SOURCE_FIELDS):
+            # Группы не меняются - достаточно пересчитать текущие (post_save)
+            return
+    loaded = getattr(instance, '_loaded_values', {})
+    old = {field: loaded.get(field, DEFERRED) for field in reports.SOURCE_FIELDS}
+    if DEFERRED in old.values():
+        old = Exhibit.objects.filter(pk=instance.pk).values(*reports.SOURCE_FIELDS).first()
+    instance._stat_groups = reports.dimension_keys(old) if old else {}
+
+
+def _schedule_stats(using, *key_sets):
+    affected = {}
+    for keys in key_sets:
+        for dimension, key in keys.items():
+            affected.setdefault(dimension, set()).add(key)
+    transaction.on_commit(lambda: reports.refresh_groups(affected), using=using)
+
+
+@receiver(post_save, sender=Exhibit)
+def refresh_stats_on_save(sender, instance, using, **kwargs):
+    """Пересчет только тех групп, в которых экспонат был или оказался"""
+    values = {field: getattr(instance, field) for field in reports.SOURCE_FIELDS}
+    _schedule_stats(using, getattr(instance, '_stat_groups', {}), reports.dimension_keys(values))
+    # Следующее сохранение того же объекта сравнивается уже с этими значениями
+    instance._loaded_values = {**getattr(instance, '_loaded_values', {}), **values}
+
+
+@receiver(post_delete, sender=Exhibit)
+def refresh_stats_on_delete(sender, instance, using, **kwargs):
+    _schedule_stats(using, reports.dimension_keys(
+        {field: getattr(instance, field) for field in reports.SOURCE_FIELDS}
+    ))
+
+
+@receiver(post_save, sender=Category)
+def refresh_stats_category_label(sender, instance, using, **kwargs):
+    """Подпись группы категории - после фиксации: откат не должен менять снимки"""
+    transaction.on_commit(lambda: reports.refresh_category_label(instance), using=using)
+
+
+@receiver(post_delete, sender=Category)
+def refresh_stats_on_category_delete(sender, instance, using, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: reports.refresh_deleted_category(pk), using=using)
+
+
+@receiver(post_save, sender=ExhibitPhoto)
+@receiver(post_delete, sender=ExhibitPhoto)
+def touch_exhibit_on_photo_change(sender, instance, **kwargs):
+    """Фото входит в карточку: обновляем updated_at, чтобы сменился ключ кэша"""
+    Exhibit.objects.filter(pk=instance.exhibit_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=ExhibitPhoto)
+@receiver(post_delete, sender=ExhibitPhoto)
+def refresh_photo_hashes(sender, instance, using, **kwargs):
+    """Точечно обновляет индекс похожих фото после фиксации транзакции"""
+    pk = instance.pk
+    transaction.on_commit(lambda: duplicates.refresh_photo(pk), using=using)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_exhibit_cards(sender, using, **kwargs):
+    """Название и иконка категории есть во всех ее карточках - сбрасываем все"""
+    transaction.on_commit(museum_extras.bump_card_version, using=using)
+
+
+@receiver(pre_save, sender=Document)
+def remember_document_file(sender, instance, **kwargs):
+    """Запоминаем прежний файл, чтобы не извлекать текст повторно без причины"""
+    old = None
+    if instance.pk:
+        old = Document.objects.filter(pk=instance.pk).values_list('document', flat=True).first()
+    instance._file_changed = old != instance.document.name
+
+
+@receiver(post_delete, sender=Document)
+def invalidate_document_search(sender, using, **kwargs):
+    """Страницы удаленного документа не должны находиться из кэша поиска"""
+    transaction.on_commit(documents.invalidate, using=using)
+
+
+@receiver(post_save, sender=Document)
+def extract_document_text(sender, instance, using, **kwargs):
+    """Новый или замененный файл - в очередь фонового извлечения текста"""
+    if not getattr(instance, '_file_changed', False):
+        return
+    Document.objects.filter(pk=instance.pk).update(extraction_status='pending')
+    if settings.MUSEUM_EXTRACT_ON_UPLOAD:
+        pk = instance.pk
+        transaction.on_commit(lambda: documents.schedule(pk), using=using)
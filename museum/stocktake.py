@@ -0,0 +1,244 @@
+"""
+Инвентаризация: приём пакетов сканирований и сверка наличия.
+
+Поиск экспонатов идет по индексам barcode и inventory_number - один запрос
+на пакет кодов. Сверочный отчет считается в базе (GROUP BY + EXISTS),
+без перебора экспонатов в Python.
+"""
+import json
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models import Count, Exists, F, OuterRef, Q
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.views.decorators.http import require_POST
+
+from .models import Exhibit, StocktakeSession, StocktakeScan
+
+MAX_BATCH_SIZE = 1000
+CODE_MAX_LENGTH = StocktakeScan._meta.get_field('code').max_length
+LOCATION_MAX_LENGTH = StocktakeScan._meta.get_field('location').max_length
+
+
+# ==================== ПОИСК ПО КОДУ ====================
+def lookup_codes(codes):
+    """
+    Находит экспонаты по штрих-кодам и инвентарным номерам одним запросом.
+    Возвращает {код: {'id', 'title', 'inventory_number', 'storage_location'}}.
+    """
+    codes = set(codes)
+    if not codes:
+        return {}
+    rows = Exhibit.objects.filter(
+        Q(barcode__in=codes) | Q(inventory_number__in=codes)
+    ).values('id', 'title', 'barcode', 'inventory_number', 'storage_location')
+
+    found = {}
+    for row in rows:
+        barcode = row.pop('barcode')
+        # Штрих-код приоритетнее инвентарного номера, если они совпали у разных экспонатов
+        if row['inventory_number'] in codes:
+            found.setdefault(row['inventory_number'], row)
+        if barcode in codes:
+            found[barcode] = row
+    return found
+
+
+def record_scans(session, codes, location='', user=None):
+    """Сохраняет пакет сканирований одним INSERT и возвращает результат для сканера"""
+    found = lookup_codes(codes)
+    StocktakeScan.objects.bulk_create([
+        StocktakeScan(
+            session=session,
+            code=code,
+            exhibit_id=found[code]['id'] if code in found else None,
+            location=location,
+            scanned_by=user,
+        )
+        for code in codes
+    ])
+
+    results = []
+    for code in codes:
+        exhibit = found.get(code)
+        results.append({
+            'code': code,
+            'exhibit': exhibit,
+            'misplaced': bool(exhibit and location
+                              and exhibit['storage_location'] != location),
+        })
+    return {
+        'accepted': len(codes),
+        'unknown': [code for code in codes if code not in found],
+        'results': results,
+    }
+
+
+# ==================== СВЕРКА ====================
+def expected_exhibits(session):
+    """Экспонаты, которые должны быть найдены в ходе инвентаризации"""
+    exhibits = Exhibit.objects.all()
+    if session.storage_location:
+        exhibits = exhibits.filter(storage_location=session.storage_location)
+    return exhibits
+
+
+def reconciliation(session):
+    """
+    Сверка по местам хранения: сколько ожидалось, найдено, не найдено
+    и найдено не на своем месте. Все считается одним GROUP BY-запросом.
+    """
+    session_scans = StocktakeScan.objects.filter(session=session, exhibit_id=OuterRef('pk'))
+    found = Exists(session_scans)
+    misplaced = Exists(
+        session_scans.exclude(location='').exclude(location=OuterRef('storage_location'))
+    )
+
+    rows = (
+        expected_exhibits(session)
+        .order_by()
+        .values('storage_location')
+        .annotate(
+            expected=Count('id'),
+            found=Count('id', filter=found),
+            misplaced=Count('id', filter=misplaced),
+        )
+        .order_by('storage_location')
+    )
+    report = []
+    for row in rows:
+        row['missing'] = row['expected'] - row['found']
+        report.append(row)
+
+    if session.storage_location:
+        # Экспонаты других мест хранения, найденные здесь: не ожидались, но на чужом месте
+        foreign = (
+            Exhibit.objects.exclude(storage_location=session.storage_location)
+            .filter(found)
+            .order_by()
+            .values('storage_location')
+            .annotate(misplaced=Count('id'))
+            .order_by('storage_location')
+        )
+        for row in foreign:
+            report.append({**row, 'expected': 0, 'found': 0, 'missing': 0})
+    return report
+
+
+def missing_exhibits(session, limit=500):
+    """Экспонаты, которые не были отсканированы"""
+    scanned = StocktakeScan.objects.filter(session=session, exhibit_id=OuterRef('pk'))
+    return (expected_exhibits(session)
+            .filter(~Exists(scanned))
+            .order_by('storage_location', 'inventory_number')
+            .values('id', 'inventory_number', 'title', 'storage_location')[:limit])
+
+
+def misplaced_exhibits(session, limit=500):
+    """
+    Экспонаты, отсканированные не там, где числятся, - в том числе из других
+    мест хранения, если инвентаризация идет по одному месту
+    """
+    return (session.scans.filter(exhibit__isnull=False)
+            .exclude(location='')
+            .exclude(location=F('exhibit__storage_location'))
+            .order_by('exhibit__storage_location', 'exhibit__inventory_number', 'location')
+            .values('location', 'exhibit_id',
+                    inventory_number=F('exhibit__inventory_number'),
+                    title=F('exhibit__title'),
+                    storage_location=F('exhibit__storage_location'))
+            .distinct()[:limit])
+
+
+def unknown_codes(session):
+    """Коды, для которых не нашлось экспоната, с числом сканирований"""
+    return (session.scans.filter(exhibit__isnull=True)
+            .order_by()
+            .values('code')
+            .annotate(count=Count('id'))
+            .order_by('code'))
+
+
+# ==================== ПРЕДСТАВЛЕНИЯ ====================
+def _bad_request(message):
+    return JsonResponse({'error': message}, status=400, json_dumps_params={'ensure_ascii': False})
+
+
+def _parse_batch(body):
+    """Коды и место из тела запроса; ValueError с текстом для ответа 400"""
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise ValueError('Некорректный JSON')
+    if not isinstance(payload, dict):
+        raise ValueError('Ожидается объект {"codes": [...], "location": "..."}')
+    raw_codes = payload.get('codes', [])
+    # Строка вместо списка разобралась бы посимвольно
+    if not isinstance(raw_codes, list) or not all(
+            isinstance(code, (str, int)) and not isinstance(code, bool) for code in raw_codes):
+        raise ValueError('"codes" должен быть списком кодов')
+    if len(raw_codes) > MAX_BATCH_SIZE:
+        raise ValueError(f'Не более {MAX_BATCH_SIZE} кодов за запрос')
+    location = payload.get('location') or ''
+    if not isinstance(location, str):
+        raise ValueError('"location" должен быть строкой')
+
+    codes = [str(code).strip() for code in raw_codes if str(code).strip()]
+    too_long = [code for code in codes if len(code) > CODE_MAX_LENGTH]
+    if too_long:
+        raise ValueError(f'Коды длиннее {CODE_MAX_LENGTH} символов: '
+                         f'{", ".join(code[:20] + "..." for code in too_long[:5])}')
+    location = location.strip()
+    if len(location) > LOCATION_MAX_LENGTH:
+        raise ValueError(f'Место хранения длиннее {LOCATION_MAX_LENGTH} символов')
+    return codes, location
+
+
+@staff_member_required
+def scan_page(request, pk):
+    """Страница для ручного сканера (сканер работает как клавиатура)"""
+    session = get_object_or_404(StocktakeSession, pk=pk)
+    return render(request, 'museum/stocktake_scan.html', {
+        'session': session,
+        'max_batch_size': MAX_BATCH_SIZE,
+    })
+
+
+@staff_member_required
+@require_POST
+def scan(request, pk):
+    """
+    Прием пакета сканирований.
+    Тело запроса - JSON {"codes": [...], "location": "..."}.
+    """
+    session = get_object_or_404(StocktakeSession, pk=pk)
+    if session.status != 'open':
+        return JsonResponse({'error': 'Инвентаризация уже завершена'}, status=409,
+                            json_dumps_params={'ensure_ascii': False})
+
+    try:
+        codes, location = _parse_batch(request.body)
+    except ValueError as error:
+        return _bad_request(str(error))
+
+    result = record_scans(session, codes, location or session.storage_location, request.user)
+    return JsonResponse(result, json_dumps_params={'ensure_ascii': False})
+
+
+@staff_member_required
+def report(request, pk):
+    """Сверочный отчет по инвентаризации"""
+    session = get_object_or_404(StocktakeSession, pk=pk)
+    rows = reconciliation(session)
+    totals = {
+        key: sum(row[key] for row in rows)
+        for key in ('expected', 'found', 'missing', 'misplaced')
+    }
+    return render(request, 'museum/stocktake_report.html', {
+        'session': session,
+        'rows': rows,
+        'totals': totals,
+        'missing': missing_exhibits(session),
+        'misplaced': misplaced_exhibits(session),
+        'unknown': unknown_codes(session),
+    })
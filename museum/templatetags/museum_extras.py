@@ -1,4 +1,7 @@
 from django import template
+from django.core.cache import cache
+
+from ..assets import asset_html
 
 register = template.Library()
 
@@ -12,15 +15,6 @@ def split(value, delimiter=','):
         return []
     return [item.strip() for item in value.split(delimiter) if item.strip()]
 
-@register.filter(name='truncatechars')
-def truncatechars(value, max_length):
-    """
-    Обрезает строку до указанной длины
-    """
-    if len(value) <= max_length:
-        return value
-    return value[:max_length] + '...'
-
 @register.filter(name='get_item')
 def get_item(dictionary, key):
     """
@@ -40,4 +34,44 @@ def get_exhibit_stats():
     return {
         'total': total,
         'featured': featured
-    }
\ No newline at end of file
+    }
+
+CARD_VERSION_KEY = 'exhibit_card:version'
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def bump_card_version():
+    """Сбрасывает кэш всех карточек (например, после изменения категории)"""
+    try:
+        cache.incr(CARD_VERSION_KEY)
+    except ValueError:
+        cache.set(CARD_VERSION_KEY, 2, None)
+
+
+@register.inclusion_tag('museum/includes/exhibit_card.html', takes_context=True)
+def exhibit_card(context, exhibit, tags=None):
+    """
+    Карточка экспоната для списков.
+    Кэшируется по (exhibit.pk, updated_at, версия карточек); версия читается
+    из кэша один раз на отрисовку страницы. Теги передаются готовым списком
+    (по умолчанию - exhibit.get_tag_list()).
+    Использование: {% exhibit_card exhibit %} или {% exhibit_card exhibit tags=tag_list %}
+    """
+    render_context = context.render_context
+    if CARD_VERSION_KEY not in render_context:
+        render_context[CARD_VERSION_KEY] = cache.get_or_set(CARD_VERSION_KEY, 1, None)
+    return {
+        'exhibit': exhibit,
+        'tags': exhibit.get_tag_list() if tags is None else tags,
+        'card_version': render_context[CARD_VERSION_KEY],
+        'card_timeout': CARD_CACHE_TIMEOUT,
+    }
+
+
+@register.simple_tag
+def asset_tag(name):
+    """
+    Подключение CSS/JS: собранный локальный файл или CDN, пока сборки нет.
+    Использование: {% asset_tag 'bootstrap.css' %}
+    """
+    return asset_html(name)
@@ -0,0 +1,243 @@
+"""
+Несколько музеев (арендаторов) в одном развертывании.
+
+У каждого музея свой каталог MUSEUM_TENANTS_ROOT/<slug>/ с базой (db.sqlite3,
+для PostgreSQL - отдельная база <имя>_<slug>) и медиафайлами (media/).
+Музей создает команда "tenants --create <slug>": база, миграции и метка
+READY_MARKER в каталоге. Сайт открывает только музеи с меткой - каталог без
+базы или с недоделанными миграциями дает 404, а не ошибки сервера.
+Успешный "tenants migrate" тоже ставит метку (так отмечаются уже созданные музеи).
+Один пул воркеров обслуживает все музеи:
+  - TenantMiddleware определяет музей по домену: <slug>.MUSEUM_TENANT_DOMAIN
+    или домены из MUSEUM_TENANTS_FILE (JSON: {"slug": {"name": ..., "hosts": [...]}});
+    список готовых музеев перечитывается раз в REGISTRY_TIMEOUT секунд;
+  - TenantRouter (museum/db_routers.py) отправляет запросы в базу музея,
+    соединение регистрируется при первом обращении;
+  - TenantFileSystemStorage хранит файлы в media/ музея;
+  - make_key добавляет музей к ключам кэша;
+  - индексы в памяти процесса (фасеты, подсказки, похожие фото) хранятся
+    отдельно для каждого музея, давно не нужные вытесняются (local()).
+
+Команды управления работают с одним музеем, если задана переменная
+MUSEUM_TENANT: тогда база 'default' и MEDIA_ROOT - этого музея (см. settings).
+Команда tenants запускает любую команду для всех музеев параллельно.
+Без MUSEUM_TENANT_DOMAIN и MUSEUM_TENANTS_FILE сайт работает как один музей.
+
+Медиафайлы в продакшене раздает веб-сервер из MUSEUM_TENANTS_ROOT/<slug>/media/.
+"""
+import contextvars
+import functools
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, HttpResponseNotFound
+from django.views.static import serve
+
+SLUG_RE = re.compile(r'^[a-z0-9][a-z0-9_-]{0,62}$')
+ALIAS_PREFIX = 'tenant_'
+READY_MARKER = '.ready'          # файл в каталоге музея: база создана, миграции применены
+REGISTRY_TIMEOUT = 30            # сек, через сколько воркер заметит новый музей
+
+_current = contextvars.ContextVar('museum_tenant', default='')
+_register_lock = threading.Lock()
+_ready = {'tenants': frozenset(), 'checked': None}
+_ready_lock = threading.Lock()
+_local_states = OrderedDict()
+_local_lock = threading.Lock()
+
+
+# ==================== РЕЕСТР МУЗЕЕВ ====================
+def is_enabled():
+    """Сайт обслуживает несколько музеев (процесс не закреплен за одним)"""
+    return not settings.MUSEUM_TENANT and bool(
+        settings.MUSEUM_TENANT_DOMAIN or settings.MUSEUM_TENANTS_FILE)
+
+
+def tenant_dir(slug):
+    return Path(settings.MUSEUM_TENANTS_ROOT) / slug
+
+
+@functools.cache
+def _configured():
+    """Музеи из MUSEUM_TENANTS_FILE: {slug: {'name', 'hosts'}}"""
+    if not settings.MUSEUM_TENANTS_FILE:
+        return {}
+    with open(settings.MUSEUM_TENANTS_FILE, encoding='utf-8') as file:
+        tenants = json.load(file)
+    invalid = [slug for slug in tenants if not SLUG_RE.match(slug)]
+    if invalid:
+        raise ValueError(f"Недопустимые имена музеев: {', '.join(invalid)}")
+    return tenants
+
+
+@functools.cache
+def _hosts():
+    return {host.lower(): slug
+            for slug, config in _configured().items() for host in config.get('hosts', ())}
+
+
+def all_tenants():
+    """Все музеи: из файла настроек и каталоги в MUSEUM_TENANTS_ROOT"""
+    root = Path(settings.MUSEUM_TENANTS_ROOT)
+    found = set(_configured())
+    if root.is_dir():
+        found.update(path.name for path in root.iterdir()
+                     if path.is_dir() and SLUG_RE.match(path.name))
+    return sorted(found)
+
+
+def mark_ready(slug):
+    """Музей готов к работе: вызывается после успешных миграций его базы"""
+    (tenant_dir(slug) / READY_MARKER).touch()
+    with _ready_lock:
+        _ready['checked'] = None
+
+
+def ready_tenants():
+    """Музеи с базой (с меткой READY_MARKER); список кэшируется на REGISTRY_TIMEOUT"""
+    now = time.monotonic()
+    with _ready_lock:
+        if _ready['checked'] is None or now - _ready['checked'] >= REGISTRY_TIMEOUT:
+            _ready['tenants'] = frozenset(
+                slug for slug in all_tenants() if (tenant_dir(slug) / READY_MARKER).exists())
+            _ready['checked'] = now
+        return _ready['tenants']
+
+
+def tenant_for_host(host):
+    """Музей по домену; '' - основной сайт, None - неизвестный или не готовый музей"""
+    host = host.split(':')[0].lower().rstrip('.')
+    slug = _hosts().get(host)
+    if slug is None:
+        domain = settings.MUSEUM_TENANT_DOMAIN.lower()
+        if not domain or not host.endswith(f'.{domain}'):
+            return ''
+        slug = host[:-len(domain) - 1]
+    return slug if slug in ready_tenants() else None
+
+
+# ==================== ТЕКУЩИЙ МУЗЕЙ ====================
+def current():
+    """Музей текущего запроса или процесса ('' - основной)"""
+    return _current.get() or settings.MUSEUM_TENANT
+
+
+@contextmanager
+def activate(slug):
+    """Выполнить блок от имени музея (фоновые задачи, сброс буферов)"""
+    token = _current.set(slug or '')
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def _is_own(slug):
+    """Музей, чьи база и MEDIA_ROOT заданы в настройках процесса"""
+    return not slug or slug == settings.MUSEUM_TENANT
+
+
+def database(slug=None):
+    """Псевдоним базы музея (None - база 'default'); регистрируется при первом обращении"""
+    from django.db import connections
+    from school_museum.database import register_database, tenant_config
+
+    slug = current() if slug is None else slug
+    if _is_own(slug):
+        return None
+    alias = f'{ALIAS_PREFIX}{slug}'
+    if alias not in connections.settings:
+        with _register_lock:
+            if alias not in connections.settings:
+                config = tenant_config(connections.settings['default'],
+                                       settings.MUSEUM_TENANTS_ROOT, slug)
+                # Соединения сотен музеев не держатся между запросами
+                config['CONN_MAX_AGE'] = settings.MUSEUM_TENANT_CONN_MAX_AGE
+                register_database(alias, config)
+    return alias
+
+
+def media_root(slug=None):
+    slug = current() if slug is None else slug
+    if _is_own(slug):
+        return Path(settings.MEDIA_ROOT)
+    return tenant_dir(slug) / 'media'
+
+
+def local(namespace):
+    """
+    Словарь процесса для данных текущего музея (индексы в памяти).
+    Хранятся MUSEUM_TENANT_LOCAL_LIMIT последних музеев, остальные
+    перестроятся при следующем обращении.
+    """
+    key = (namespace, current())
+    with _local_lock:
+        state = _local_states.get(key)
+        if state is None:
+            state = _local_states[key] = {}
+            while len(_local_states) > settings.MUSEUM_TENANT_LOCAL_LIMIT:
+                _local_states.popitem(last=False)
+        else:
+            _local_states.move_to_end(key)
+    return state
+
+
+# ==================== КЭШ И ФАЙЛЫ ====================
+def make_key(key, key_prefix, version):
+    """KEY_FUNCTION кэша: ключи разных музеев не пересекаются"""
+    slug = current()
+    if slug:
+        return f'{key_prefix}:{slug}:{version}:{key}'
+    return f'{key_prefix}:{version}:{key}'
+
+
+class TenantFileSystemStorage(FileSystemStorage):
+    """Медиафайлы в каталоге текущего музея (URL одинаковые - домены разные)"""
+
+    @property
+    def base_location(self):
+        return str(media_root())
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+
+def serve_media(request, path):
+    """Медиафайлы музея при DEBUG (в продакшене их раздает веб-сервер)"""
+    return serve(request, path, document_root=media_root())
+
+
+# ==================== MIDDLEWARE ====================
+def _in_tenant(slug, content):
+    """Потоковый ответ читается после выхода из middleware - музей нужен и там"""
+    with activate(slug):
+        yield from content
+
+
+class TenantMiddleware:
+    """Определяет музей по домену запроса"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_enabled():
+            return self.get_response(request)
+        slug = tenant_for_host(request.get_host())
+        if slug is None:
+            return HttpResponseNotFound("Музей не найден")
+        request.tenant = slug
+        with activate(slug):
+            response = self.get_response(request)
+        if slug and response.streaming and not isinstance(response, FileResponse):
+            response.streaming_content = _in_tenant(slug, response.streaming_content)
+        return response
@@ -1,3 +1,557 @@
-from django.test import TestCase
+import json
+import tempfile
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import (api, autocomplete, dating, facets, popularity, reports, stocktake, tenants,
+               throttling, timeline)
+from .db_routers import TenantRouter
+from .models import Category, CollectionStat, Exhibit, StocktakeSession
+
+
+def create_exhibit(number, **fields):
+    """Опубликованный экспонат с инвентарным номером T-<number>"""
+    values = {'title': f'Экспонат {number}', 'description': '-',
+              'inventory_number': f'T-{number}', 'status': 'published'}
+    return Exhibit.objects.create(**{**values, **fields})
+
+
+# ==================== ДАТИРОВКА ====================
+class DatingParseTests(SimpleTestCase):
+    """Разбор свободной датировки: строка -> (год начала, год конца)"""
+
+    CASES = [
+        # Годы
+        ('1941', (1941, 1941)),
+        ('1941 г.', (1941, 1941)),
+        ('12.05.1941', (1941, 1941)),
+        ('май 1941 года', (1941, 1941)),
+        ('1941-1945', (1941, 1945)),
+        ('с 1941 по 1945 гг.', (1941, 1945)),
+        ('1941/42', (1941, 1942)),
+        ('около 1941', (1936, 1946)),
+        ('ок. 1941 г.', (1936, 1946)),
+        # Десятилетия
+        ('1940-е', (1940, 1949)),
+        ('40-е годы', (1940, 1949)),
+        ('1950-х годов', (1950, 1959)),
+        ('начало 1940-х', (1940, 1942)),
+        ('вторая половина 1950-х', (1955, 1959)),
+        ('кон. 1980-х', (1987, 1989)),
+        ('нач. 1990-х гг.', (1990, 1992)),
+        ('сер. 1960-х', (1963, 1966)),
+        ('конец 1930-х - начало 1940-х', (1937, 1942)),
+        # Диапазоны десятилетий и век у двузначных десятилетий
+        ('30-40-е годы XX века', (1930, 1949)),
+        ('1930-1940-е', (1930, 1949)),
+        ('1930-е - 1940-е', (1930, 1949)),
+        ('60-е гг. XIX в.', (1860, 1869)),
+        # Века
+        ('XX век', (1900, 1999)),
+        ('20 в.', (1900, 1999)),
+        ('XVIII-XIX вв.', (1700, 1899)),
+        ('начало XX века', (1900, 1932)),
+        ('нач. XX в.', (1900, 1932)),
+        ('сер. XIX в.', (1833, 1866)),
+        ('первая половина XX века', (1900, 1949)),
+        ('II половина XX века', (1950, 1999)),
+        ('I пол. XX в.', (1900, 1949)),
+        ('2-я половина XIX в.', (1850, 1899)),
+        # Не распознается
+        ('', (None, None)),
+        ('до 1917', (None, None)),
+        ('неизвестно', (None, None)),
+    ]
+
+    def test_parse(self):
+        for text, expected in self.CASES:
+            with self.subTest(text=text):
+                self.assertEqual(dating.parse(text), expected)
+
+    def test_decades(self):
+        self.assertEqual(dating.decades(1938, 1941), [1930, 1940])
+        self.assertEqual(dating.decades(1941, 1941), [1940])
+
+
+class DecadeCountsTests(TestCase):
+    """Счетчики хронологии: экспонат учитывается во всех задетых десятилетиях"""
+
+    def setUp(self):
+        cache.clear()
+        for number, creation_date in enumerate(['1938-1941', '1940-е', '1945', '', 'XIX век']):
+            create_exhibit(number, creation_date=creation_date)
+
+    def test_counts(self):
+        result = timeline.decade_counts()
+        self.assertEqual(result['undated'], 1)
+        self.assertEqual(result['decades'][1930], 1)
+        self.assertEqual(result['decades'][1940], 3)
+        self.assertEqual(result['decades'][1800], 1)
+        self.assertEqual(result['decades'][1890], 1)
+        self.assertNotIn(1900, result['decades'])
+
+
+# ==================== API ====================
+class ApiTests(TestCase):
+    """JSON API: курсорная пагинация, пакетная выборка, условные запросы"""
+
+    def setUp(self):
+        cache.clear()
+        self.exhibits = [create_exhibit(number) for number in range(5)]
+        create_exhibit(5, status='draft')
+        self.url = reverse('museum:api_list', kwargs={'resource': 'exhibits'})
+
+    def test_cursor_pagination(self):
+        ids, params, pages = [], {'limit': 2}, 0
+        while True:
+            data = self.client.get(self.url, params).json()
+            ids.extend(row['id'] for row in data['results'])
+            pages += 1
+            if data['next'] is None:
+                break
+            params['after'] = data['next']
+        # Черновик в API не попадает
+        self.assertEqual(ids, [exhibit.pk for exhibit in self.exhibits])
+        self.assertEqual(pages, 3)
+
+    def test_bad_cursor(self):
+        response = self.client.get(self.url, {'after': '!!!'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_by_ids(self):
+        first, second = self.exhibits[0].pk, self.exhibits[1].pk
+        data = self.client.get(self.url, {'ids': f'{second},{first},999999'}).json()
+        self.assertEqual(sorted(row['id'] for row in data['results']), [first, second])
+        self.assertEqual(data['missing'], [999999])
+
+    def test_batch_by_inventory_number(self):
+        data = self.client.get(self.url, {'inventory_number': 'T-1,T-5,нет',
+                                          'fields': 'title'}).json()
+        self.assertEqual(data['results'], [{'id': self.exhibits[1].pk, 'title': 'Экспонат 1'}])
+        # T-5 - черновик: для API его нет
+        self.assertEqual(data['missing'], ['T-5', 'нет'])
+
+    def test_batch_limit(self):
+        ids = ','.join(str(pk) for pk in range(1, api.MAX_BATCH_SIZE + 2))
+        self.assertEqual(self.client.get(self.url, {'ids': ids}).status_code, 400)
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('max-age=60', response['Cache-Control'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+
+# ==================== ФАСЕТЫ ====================
+class FacetTests(TestCase):
+    """Выбор фасетов, фильтрация в SQL и счетчики по индексу"""
+
+    def setUp(self):
+        cache.clear()
+        # Индексы в памяти с прошлых тестов: версии после cache.clear() повторяются
+        tenants._local_states.clear()
+        self.awards = Category.objects.create(name='Награды')
+        self.papers = Category.objects.create(name='Документы')
+        self.medal = create_exhibit(0, category=self.awards, tags='война, медаль',
+                                    material='металл', author='Иванов', creation_date='1943')
+        self.badge = create_exhibit(1, category=self.awards, tags='медаль', material='бронза',
+                                    creation_date='1950-е')
+        self.letter = create_exhibit(2, category=self.papers, tags='письмо, война',
+                                     material='бумага', author='Иванов', creation_date='1942')
+        create_exhibit(3, category=self.papers, tags='война', status='draft')
+
+    def _filtered(self, selection):
+        queryset = Exhibit.objects.filter(status__in=facets.PUBLIC_STATUSES)
+        return set(facets.apply_filters(queryset, selection).values_list('pk', flat=True))
+
+    def test_parse_selection(self):
+        params = QueryDict('category=2&category=x&tag=+медаль+&decade=1940&status=draft&tag=')
+        self.assertEqual(facets.parse_selection(params),
+                         {'category': [2], 'tag': ['медаль'], 'decade': [1940]})
+        staff = facets.parse_selection(QueryDict('status=draft&status=bogus'), staff=True)
+        self.assertEqual(staff, {'status': ['draft']})
+        self.assertEqual(facets.parse_selection(QueryDict(''), staff=True),
+                         {'status': list(facets.PUBLIC_STATUSES)})
+
+    def test_apply_filters(self):
+        # ИЛИ внутри фасета, И между фасетами
+        self.assertEqual(self._filtered({'tag': ['медаль']}), {self.medal.pk, self.badge.pk})
+        self.assertEqual(self._filtered({'tag': ['медаль', 'письмо']}),
+                         {self.medal.pk, self.badge.pk, self.letter.pk})
+        self.assertEqual(self._filtered({'tag': ['война'], 'author': ['Иванов'],
+                                         'category': [self.awards.pk]}), {self.medal.pk})
+        self.assertEqual(self._filtered({'decade': [1950]}), {self.badge.pk})
+        # Тег сравнивается целиком, а не подстрокой
+        self.assertEqual(self._filtered({'tag': ['меда']}), set())
+
+    def test_counts(self):
+        counts = facets.facet_counts({'category': [self.awards.pk]})
+        # Выбор фасета не сужает его собственные счетчики
+        self.assertEqual(counts['category'], {self.awards.pk: 2, self.papers.pk: 1})
+        self.assertEqual(counts['tag'], {'война': 1, 'медаль': 2, 'письмо': 0})
+        self.assertEqual(counts['decade'][1940], 1)
+        self.assertNotIn('status', counts)
+
+    def test_counts_with_found(self):
+        found = Exhibit.objects.filter(status='published', author='Иванов')
+        counts = facets.facet_counts({}, query='Иванов', found=found)
+        self.assertEqual(counts['category'], {self.awards.pk: 1, self.papers.pk: 1})
+        self.assertEqual(counts['material'], {'металл': 1, 'бронза': 0, 'бумага': 1})
+        # Без поиска - по всем опубликованным
+        self.assertEqual(facets.facet_counts({})['tag']['медаль'], 2)
+
+
+# ==================== ПОДСКАЗКИ ПОИСКА ====================
+class PrefixIndexTests(SimpleTestCase):
+    """Префиксный индекс подсказок: поиск, ранжирование, удаление"""
+
+    def setUp(self):
+        self.index = autocomplete.PrefixIndex()
+        names = {1: 'Награды'}
+        rows = [
+            {'id': 1, 'title': 'Медаль за отвагу', 'inventory_number': 'МЕД-1',
+             'author': 'Монетный двор', 'tags': 'медаль, война', 'category_id': 1},
+            {'id': 2, 'title': 'Медаль за оборону Москвы', 'inventory_number': 'МЕД-2',
+             'author': '', 'tags': 'медаль', 'category_id': 1},
+        ]
+        for row in rows:
+            self.index.add(row, names)
+
+    def _labels(self, prefix, limit=10):
+        return [label for _, label in self.index.search(prefix, limit)]
+
+    def test_search(self):
+        # Точное совпадение ключа - первым, затем экспонаты, номера, категории, авторы, теги
+        self.assertEqual(self._labels('медаль'), [
+            'медаль', 'Медаль за оборону Москвы', 'Медаль за отвагу',
+        ])
+        self.assertEqual(self._labels('мед'), [
+            'Медаль за оборону Москвы', 'Медаль за отвагу',
+            'МЕД-1 - Медаль за отвагу', 'МЕД-2 - Медаль за оборону Москвы', 'медаль',
+        ])
+        self.assertEqual(self._labels('мед', limit=1), ['Медаль за оборону Москвы'])
+        # Слова из середины названия и имени автора, регистр и ё не важны
+        self.assertEqual(self._labels('ОТВ'), ['Медаль за отвагу'])
+        self.assertEqual(self._labels('двор'), ['Монетный двор'])
+        self.assertEqual(self._labels('нагр'), ['Награды'])
+        self.assertEqual(self._labels(''), [])
+
+    def test_remove(self):
+        self.index.remove(1)
+        self.assertEqual(self._labels('отв'), [])
+        self.assertEqual(self._labels('двор'), [])
+        # Общие ключи остаются, пока их дает другой экспонат
+        self.assertEqual(self._labels('медаль'), ['медаль', 'Медаль за оборону Москвы'])
+        self.index.remove(2)
+        self.assertEqual(self.index.keys, [])
+        self.assertEqual(self.index.suggestions, {})
+
+
+class AutocompleteReplayTests(TestCase):
+    """Воркер догоняет чужие изменения по журналу, не перестраивая индекс"""
+
+    def setUp(self):
+        cache.clear()
+        tenants._local_states.clear()
+        self.kept = create_exhibit(0, title='Компас')
+        self.hidden = create_exhibit(1, title='Котелок')
+
+    def _labels(self, query):
+        return [item['label'] for item in autocomplete.suggest(query)]
+
+    def test_replay(self):
+        self.assertEqual(self._labels('ко'), ['Компас', 'Котелок'])
+        # Изменения другого воркера: в базе и в журнале, но не в этом индексе
+        added = create_exhibit(2, title='Котомка')
+        Exhibit.objects.filter(pk=self.hidden.pk).update(status='draft')
+        autocomplete._record(added.pk)
+        autocomplete._record(self.hidden.pk)
+        with mock.patch.object(autocomplete, '_build', side_effect=AssertionError):
+            self.assertEqual(self._labels('ко'), ['Компас', 'Котомка'])
+
+    def test_incomplete_log_rebuilds(self):
+        self.assertEqual(self._labels('ко'), ['Компас', 'Котелок'])
+        added = create_exhibit(2, title='Котомка')
+        version = autocomplete._record(added.pk)
+        cache.delete(autocomplete.CHANGE_KEY % version)
+        with mock.patch.object(autocomplete, '_build', wraps=autocomplete._build) as build:
+            self.assertEqual(self._labels('ко'), ['Компас', 'Котелок', 'Котомка'])
+        build.assert_called_once()
+
+
+# ==================== ИНВЕНТАРИЗАЦИЯ ====================
+class ScanBatchTests(SimpleTestCase):
+    """Разбор пакета сканирований: ошибки - ValueError с текстом для ответа 400"""
+
+    def _parse(self, payload):
+        return stocktake._parse_batch(json.dumps(payload) if not isinstance(payload, str)
+                                      else payload)
+
+    def test_valid(self):
+        codes, location = self._parse({'codes': [' А-1 ', 42, '', '  '], 'location': ' Шкаф 1 '})
+        self.assertEqual(codes, ['А-1', '42'])
+        self.assertEqual(location, 'Шкаф 1')
+        self.assertEqual(self._parse({'codes': []}), ([], ''))
+
+    def test_invalid(self):
+        long_code = 'x' * (stocktake.CODE_MAX_LENGTH + 1)
+        for payload in ['{не json', [], {'codes': 'А-1'}, {'codes': [True]},
+                        {'codes': [{'code': 1}]}, {'codes': ['А-1'], 'location': 5},
+                        {'codes': ['1'] * (stocktake.MAX_BATCH_SIZE + 1)},
+                        {'codes': [long_code]},
+                        {'codes': [], 'location': 'x' * (stocktake.LOCATION_MAX_LENGTH + 1)}]:
+            with self.subTest(payload=str(payload)[:40]):
+                with self.assertRaises(ValueError):
+                    self._parse(payload)
+
+
+class ReconciliationTests(TestCase):
+    """Сверка по месту хранения: не найденные и найденные не на своем месте"""
+
+    def setUp(self):
+        self.found = create_exhibit(0, storage_location='Шкаф 1', barcode='0001')
+        self.lost = create_exhibit(1, storage_location='Шкаф 1')
+        self.stray = create_exhibit(2, storage_location='Шкаф 2')
+        self.session = StocktakeSession.objects.create(title='Проверка',
+                                                       storage_location='Шкаф 1')
+        self.result = stocktake.record_scans(self.session, ['0001', 'T-2', 'нет'], 'Шкаф 1')
+
+    def test_record_scans(self):
+        self.assertEqual(self.result['accepted'], 3)
+        self.assertEqual(self.result['unknown'], ['нет'])
+        self.assertEqual([item['misplaced'] for item in self.result['results']],
+                         [False, True, False])
+
+    def test_reconciliation(self):
+        self.assertEqual(stocktake.reconciliation(self.session), [
+            {'storage_location': 'Шкаф 1', 'expected': 2, 'found': 1, 'misplaced': 0,
+             'missing': 1},
+            # Экспонат другого места хранения, найденный здесь
+            {'storage_location': 'Шкаф 2', 'expected': 0, 'found': 0, 'misplaced': 1,
+             'missing': 0},
+        ])
+        self.assertEqual([row['id'] for row in stocktake.missing_exhibits(self.session)],
+                         [self.lost.pk])
+        self.assertEqual([row['exhibit_id'] for row in stocktake.misplaced_exhibits(self.session)],
+                         [self.stray.pk])
+        self.assertEqual(list(stocktake.unknown_codes(self.session)), [{'code': 'нет', 'count': 1}])
+
+
+# ==================== СТАТИСТИКА КОЛЛЕКЦИИ ====================
+class CollectionStatTests(TestCase):
+    """Точечный пересчет снимков дает то же, что полный"""
+
+    def setUp(self):
+        self.awards = Category.objects.create(name='Награды')
+        self.papers = Category.objects.create(name='Документы')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.medal = create_exhibit(0, category=self.awards, storage_location='Шкаф 1',
+                                        condition='хорошее', estimated_value=Decimal('100'),
+                                        acquisition_date=date(2001, 5, 1))
+            self.badge = create_exhibit(1, category=self.awards, storage_location='Шкаф 2',
+                                        condition='трещина на эмали', material='бронза',
+                                        insurance_value=Decimal('30'))
+            create_exhibit(2, category=self.papers, status='draft', material='бумага')
+        reports.rebuild_all()
+
+    def _snapshot(self):
+        return sorted(CollectionStat.objects.values_list(
+            'dimension', 'key', 'label', 'exhibit_count', 'estimated_total', 'insurance_total'))
+
+    def _assert_matches_rebuild(self):
+        refreshed = self._snapshot()
+        reports.rebuild_all()
+        self.assertEqual(refreshed, self._snapshot())
+
+    def test_edit(self):
+        medal = Exhibit.objects.get(pk=self.medal.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            medal.category = self.papers
+            medal.storage_location = 'Шкаф 3'
+            medal.condition = 'утрачена застежка'
+            medal.estimated_value = Decimal('70')
+            medal.acquisition_date = date(1999, 1, 1)
+            medal.save()
+            # Повторное сохранение того же объекта сравнивается с новыми значениями
+            medal.status = 'archived'
+            medal.save()
+        self._assert_matches_rebuild()
+
+    def test_create_and_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_exhibit(3, material='бронза', estimated_value=Decimal('5'))
+            Exhibit.objects.get(pk=self.badge.pk).delete()
+        self._assert_matches_rebuild()
+
+    def test_category_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.awards.delete()
+        self._assert_matches_rebuild()
+
+    def test_save_does_not_reread(self):
+        medal = Exhibit.objects.get(pk=self.medal.pk)
+        medal.storage_location = 'Шкаф 3'
+        with self.captureOnCommitCallbacks(), CaptureQueriesContext(connection) as queries:
+            medal.save()
+        self.assertEqual([query['sql'] for query in queries
+                          if query['sql'].startswith('SELECT')], [])
+
+    def test_category_label_after_commit(self):
+        try:
+            with transaction.atomic():
+                self.awards.name = 'Ордена'
+                self.awards.save()
+                raise ValueError
+        except ValueError:
+            pass
+        label = CollectionStat.objects.get(dimension='category', key=str(self.awards.pk)).label
+        self.assertEqual(label, 'Награды')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.awards.save()
+        label = CollectionStat.objects.get(dimension='category', key=str(self.awards.pk)).label
+        self.assertEqual(label, 'Ордена')
+
+
+# ==================== ОГРАНИЧЕНИЕ ЗАПРОСОВ ====================
+class TokenBucketTests(SimpleTestCase):
+    """Корзина GCRA: жетоны, затем долг не больше корзины, затем отказ"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_take(self):
+        now = 1000.0
+        levels = [throttling.take('test:bucket', 2, 60, now=now)[0] for _ in range(5)]
+        self.assertEqual(levels, [throttling.ALLOWED, throttling.ALLOWED, throttling.DEGRADED,
+                                  throttling.DEGRADED, throttling.REJECTED])
+        level, wait = throttling.take('test:bucket', 2, 60, now=now)
+        self.assertEqual((level, wait), (throttling.REJECTED, 1))
+        # Отказ не расходует жетоны: через 10 с корзина снова полная
+        self.assertEqual(throttling.take('test:bucket', 2, 60, now=now + 10)[0],
+                         throttling.ALLOWED)
+
+
+@override_settings(MUSEUM_THROTTLE_ENABLED=True, MUSEUM_THROTTLE_RATES={
+    'search': {'ip': (1, 1), 'session': (1, 1)},
+    'deep_page': {'ip': (1, 1), 'session': (1, 1)},
+})
+class ThrottleMiddlewareTests(TestCase):
+    """Перегруженному посетителю - готовая страница, но только анонимному"""
+
+    def setUp(self):
+        cache.clear()
+        tenants._local_states.clear()
+        create_exhibit(0, title='Компас')
+        self.url = reverse('museum:exhibit_list')
+
+    def _throttle(self, client):
+        return client.get(self.url, {'q': 'Компас'}).get('X-Throttle')
+
+    def test_anonymous_gets_cached_page(self):
+        client = self.client
+        self.assertIsNone(self._throttle(client))
+        self.assertEqual(self._throttle(client), 'cached')
+        self.assertEqual(self._throttle(client), 'rejected')
+
+    def test_logged_in_never_gets_cached_page(self):
+        # Готовая страница уже в кэше - от анонимного посетителя с другого адреса
+        self.assertIsNone(self._throttle(self.client))
+        user = User.objects.create_user('visitor', password='-')
+        self.client.force_login(user)
+        self.client.defaults['REMOTE_ADDR'] = '10.0.0.2'
+        self.assertIsNone(self._throttle(self.client))
+        response = self.client.get(self.url, {'q': 'Компас'})
+        self.assertEqual(response['X-Throttle'], 'degraded')
+        self.assertContains(response, 'visitor')
+
+
+# ==================== МУЗЕИ-АРЕНДАТОРЫ ====================
+class TenantIsolationTests(SimpleTestCase):
+    """Данные музеев не пересекаются: кэш, файлы, базы, счетчики просмотров"""
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = Path(root.name)
+        for slug in ('alpha', 'beta', 'draft'):
+            (self.root / slug / 'media').mkdir(parents=True)
+        overridden = override_settings(MUSEUM_TENANTS_ROOT=self.root, MUSEUM_TENANT='',
+                                       MUSEUM_TENANT_DOMAIN='museum.test', MUSEUM_TENANTS_FILE='')
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        self.addCleanup(tenants._ready.update, checked=None)
+        # Музей draft - каталог без базы (миграции не применялись)
+        tenants.mark_ready('alpha')
+        tenants.mark_ready('beta')
+
+    def test_cache_keys(self):
+        keys = set()
+        for slug in ('', 'alpha', 'beta'):
+            with tenants.activate(slug):
+                keys.add(tenants.make_key('popularity:top', '', 1))
+        self.assertEqual(len(keys), 3)
+
+    def test_media_paths(self):
+        storage = tenants.TenantFileSystemStorage()
+        with tenants.activate('alpha'):
+            alpha = Path(storage.path('exhibits/photo.jpg'))
+        with tenants.activate('beta'):
+            beta = Path(storage.path('exhibits/photo.jpg'))
+        self.assertEqual(alpha, self.root / 'alpha' / 'media' / 'exhibits' / 'photo.jpg')
+        self.assertEqual(beta, self.root / 'beta' / 'media' / 'exhibits' / 'photo.jpg')
+
+    def test_routing(self):
+        router = TenantRouter()
+        self.assertIsNone(router.db_for_read(Exhibit))
+        for slug in ('alpha', 'beta'):
+            alias = f'{tenants.ALIAS_PREFIX}{slug}'
+            self.addCleanup(connections.settings.pop, alias, None)
+            self.addCleanup(settings.DATABASES.pop, alias, None)
+            with tenants.activate(slug):
+                self.assertEqual(router.db_for_read(Exhibit), alias)
+                self.assertEqual(router.db_for_write(Exhibit), alias)
+            self.assertEqual(Path(connections.settings[alias]['NAME']),
+                             self.root / slug / 'db.sqlite3')
+
+    def test_host(self):
+        self.assertEqual(tenants.tenant_for_host('alpha.museum.test:8000'), 'alpha')
+        self.assertEqual(tenants.tenant_for_host('museum.org'), '')
+        self.assertIsNone(tenants.tenant_for_host('draft.museum.test'))
+        self.assertIsNone(tenants.tenant_for_host('missing.museum.test'))
+
+    def test_host_registry_cached(self):
+        tenants.tenant_for_host('alpha.museum.test')
+        with mock.patch.object(tenants, 'all_tenants') as scan:
+            self.assertEqual(tenants.tenant_for_host('beta.museum.test'), 'beta')
+            scan.assert_not_called()
+        # Новый музей появляется после миграций без ожидания REGISTRY_TIMEOUT
+        tenants.mark_ready('draft')
+        self.assertEqual(tenants.tenant_for_host('draft.museum.test'), 'draft')
+
+    def test_popularity_flush(self):
+        saved = []
+
+        def save(counts):
+            saved.append((tenants.current(), counts))
+            return {}
+
+        with popularity._lock:
+            popularity._pending.clear()
+            popularity._pending.update({('alpha', 1): 2, ('beta', 1): 5, ('alpha', 2): 1})
+        with mock.patch.object(popularity, '_save', side_effect=save):
+            self.assertEqual(popularity.flush(), 3)
+        self.assertEqual(sorted(saved), [('alpha', {1: 2, 2: 1}), ('beta', {1: 5})])
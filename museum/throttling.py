@@ -0,0 +1,276 @@
+"""
+Ограничение частоты дорогих запросов и сброс нагрузки.
+
+Поиск (LIKE по нескольким полям, счетчики фасетов по найденному, совпадения
+в документах) и дальние страницы списков - самые тяжелые запросы сайта.
+ThrottleMiddleware берет на них жетоны из корзин в общем кэше - отдельно для
+адреса посетителя и для его сессии. Корзина адреса больше: за одним адресом
+школы может сидеть целый класс. Корзины общие для всех музеев - воркеры тоже.
+
+Корзина устроена по алгоритму GCRA: в кэше одно число - момент, когда корзина
+снова будет полной, - поэтому проверка стоит одно чтение и одну запись.
+Запись не атомарна: при гонке воркеров пара запросов пройдет сверх лимита,
+для сброса нагрузки это не важно.
+
+Когда жетоны кончились, запрос не отклоняется сразу:
+  - если в кэше есть недавний ответ на тот же адрес страницы - отдается он
+    (только анонимным: страница вошедшего посетителя отличается);
+  - иначе страница строится упрощенной (request.throttled): без счетчиков
+    по найденному, популярных тегов, поиска по документам и блока популярного,
+    а дальняя страница списка заменяется первой;
+  - только когда посетитель превысил лимит еще на размер корзины - 429.
+Сотрудники не ограничиваются. Сколько запросов сброшено - stats() и
+reports/throttle.json (для сотрудников).
+"""
+import hashlib
+import math
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+from . import tenants
+
+BUDGETS = ('search', 'deep_page')
+OUTCOMES = ('allowed', 'cached', 'degraded', 'rejected')
+# Списки с пагинацией: их дальние страницы расходуют бюджет deep_page
+LISTING_VIEWS = {'exhibit_list', 'category_detail', 'featured_exhibits', 'search_results',
+                 'timeline'}
+STATS_HOURS = 24
+STATS_TIMEOUT = 60 * 60 * (STATS_HOURS + 1)
+
+ALLOWED, DEGRADED, REJECTED = 0, 1, 2
+
+
+# ==================== КОРЗИНЫ ЖЕТОНОВ ====================
+def take(key, burst, per_minute, now=None):
+    """
+    Берет жетон из корзины key: burst жетонов, пополнение per_minute в минуту.
+    Возвращает (уровень, секунды): ALLOWED - жетон был; DEGRADED - взят в долг
+    (долг не больше burst), секунды - на сколько запрос опередил пополнение;
+    REJECTED - не взят, секунды - через сколько запрос снова примут.
+    """
+    now = time.time() if now is None else now
+    interval = 60 / per_minute
+    # Момент, когда корзина снова полная; в прошлом - она полная уже сейчас
+    full_at = max(cache.get(key) or now, now)
+    wait = full_at + interval - now - burst * interval
+    if wait > burst * interval:
+        return REJECTED, wait - burst * interval
+    cache.set(key, full_at + interval, math.ceil(full_at + interval - now) + 1)
+    return (DEGRADED, wait) if wait > 0 else (ALLOWED, 0)
+
+
+def client_ip(request):
+    """Адрес посетителя; за прокси - из заголовка MUSEUM_THROTTLE_IP_HEADER"""
+    if settings.MUSEUM_THROTTLE_IP_HEADER:
+        forwarded = request.META.get(settings.MUSEUM_THROTTLE_IP_HEADER, '')
+        if forwarded:
+            # X-Forwarded-For: клиент, прокси1, ... - берется последний добавленный
+            return forwarded.split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _identities(request):
+    yield 'ip', client_ip(request)
+    # Сессия ради ограничения не создается: без нее работает корзина адреса
+    session_key = request.session.session_key if hasattr(request, 'session') else None
+    if session_key:
+        yield 'session', session_key
+
+
+def _page(request):
+    try:
+        return int(request.GET.get('page') or 1)
+    except ValueError:
+        return 1
+
+
+def budgets(request):
+    """Бюджеты, которые расходует запрос: поиск и/или дальняя страница списка"""
+    match = request.resolver_match
+    if match is None or match.namespace != 'museum' or request.method not in ('GET', 'HEAD'):
+        return []
+    found = []
+    if match.url_name == 'search_results' or (match.url_name == 'exhibit_list'
+                                              and request.GET.get('q')):
+        found.append('search')
+    if match.url_name in LISTING_VIEWS and _page(request) > settings.MUSEUM_THROTTLE_DEEP_PAGE:
+        found.append('deep_page')
+    return found
+
+
+def check(request, budget):
+    """Худший уровень по корзинам адреса и сессии и сколько ждать до жетона"""
+    level, wait = ALLOWED, 0
+    rates = settings.MUSEUM_THROTTLE_RATES[budget]
+    # Корзины общие для всех музеев: без музея в ключе
+    with tenants.activate(''):
+        for kind, identity in _identities(request):
+            burst, per_minute = rates[kind]
+            digest = hashlib.sha1(identity.encode()).hexdigest()
+            result = take(f'throttle:{budget}:{kind}:{digest}', burst, per_minute)
+            level, wait = max((level, wait), result)
+    return level, wait
+
+
+# ==================== УПРОЩЕННЫЕ СТРАНИЦЫ ====================
+def is_degraded(request):
+    """Страница строится без необязательных тяжелых блоков"""
+    return bool(getattr(request, 'throttled', None))
+
+
+def page_number(request):
+    """Номер страницы для пагинатора: при перегрузке дальняя страница заменяется первой"""
+    if 'deep_page' in getattr(request, 'throttled', ()):
+        return 1
+    return request.GET.get('page')
+
+
+def _page_key(request):
+    # Ответы музеев разные: ключ с музеем (make_key)
+    return f'throttle:page:{hashlib.sha1(request.get_full_path().encode()).hexdigest()}'
+
+
+def _is_shareable(request, response):
+    """Ответ одинаков для всех анонимных посетителей и его можно отдать другим"""
+    # Сообщения и токен CSRF в странице - личные данные посетителя
+    personal = (getattr(get_messages(request), 'used', False)
+                or request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+                or 'cookie' in response.get('Vary', '').lower())
+    return (request.method == 'GET' and response.status_code == 200
+            and not response.streaming and not response.has_header('X-Throttle')
+            and not request.user.is_authenticated and not personal)
+
+
+def _remember(request, response):
+    cache.set(_page_key(request), (response['Content-Type'], response.content),
+              settings.MUSEUM_THROTTLE_PAGE_CACHE)
+
+
+def _cached_response(request):
+    cached = cache.get(_page_key(request))
+    if cached is None:
+        return None
+    content_type, content = cached
+    response = HttpResponse(content, content_type=content_type)
+    response['X-Throttle'] = 'cached'
+    return response
+
+
+def _rejected(wait):
+    seconds = max(1, math.ceil(wait))
+    response = HttpResponse(f"Слишком много запросов. Повторите через {seconds} с.",
+                            status=429, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(seconds)
+    response['X-Throttle'] = 'rejected'
+    return response
+
+
+# ==================== СТАТИСТИКА ====================
+def _hour(now=None):
+    return int((time.time() if now is None else now) // 3600)
+
+
+def _count(budget, outcome):
+    key = f'throttle:stats:{_hour()}:{budget}:{outcome}'
+    with tenants.activate(''):
+        if not cache.add(key, 1, STATS_TIMEOUT):
+            try:
+                cache.incr(key)
+            except ValueError:
+                # Ключ истек между add и incr - один запрос не в счет
+                pass
+
+
+def stats(hours=STATS_HOURS):
+    """
+    Исходы запросов каждого бюджета за последние hours часов:
+    итоги, доля сброшенной нагрузки (cached + degraded + rejected) и почасово.
+    """
+    last = _hour()
+    hour_range = range(last - hours + 1, last + 1)
+    keys = {(hour, budget, outcome): f'throttle:stats:{hour}:{budget}:{outcome}'
+            for hour in hour_range for budget in BUDGETS for outcome in OUTCOMES}
+    with tenants.activate(''):
+        values = cache.get_many(keys.values())
+
+    result = {}
+    for budget in BUDGETS:
+        totals = dict.fromkeys(OUTCOMES, 0)
+        hourly = []
+        for hour in hour_range:
+            row = {outcome: values.get(keys[(hour, budget, outcome)], 0) for outcome in OUTCOMES}
+            if any(row.values()):
+                started = datetime.fromtimestamp(hour * 3600, tz=timezone.utc)
+                hourly.append({'hour': started.isoformat(), **row})
+            for outcome in OUTCOMES:
+                totals[outcome] += row[outcome]
+        total = sum(totals.values())
+        shed = total - totals['allowed']
+        result[budget] = {
+            **totals,
+            'total': total,
+            'shed_ratio': round(shed / total, 3) if total else 0,
+            'hourly': hourly,
+        }
+    return result
+
+
+@staff_member_required
+def stats_view(request):
+    """Статистика ограничения запросов (JSON)"""
+    return JsonResponse({
+        'enabled': settings.MUSEUM_THROTTLE_ENABLED,
+        'hours': STATS_HOURS,
+        'budgets': stats(),
+    })
+
+
+# ==================== MIDDLEWARE ====================
+class ThrottleMiddleware:
+    """Бюджеты дорогих запросов; после AuthenticationMiddleware (нужны сессия и пользователь)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.throttled = set()
+        request.throttle_budgets = []
+        response = self.get_response(request)
+        if request.throttle_budgets:
+            if request.throttled:
+                response['X-Throttle'] = 'degraded'
+            elif _is_shareable(request, response):
+                # Для перегруженных посетителей: отдать готовое вместо нового поиска
+                _remember(request, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.MUSEUM_THROTTLE_ENABLED or request.user.is_staff:
+            return None
+        names = budgets(request)
+        if not names:
+            return None
+        request.throttle_budgets = names
+
+        results = {name: check(request, name) for name in names}
+        level, wait = max(results.values())
+        if level == REJECTED:
+            outcome, response = 'rejected', _rejected(wait)
+        elif level == DEGRADED:
+            # Сохраняются только анонимные страницы - вошедшему строится своя
+            response = None if request.user.is_authenticated else _cached_response(request)
+            outcome = 'cached' if response is not None else 'degraded'
+            if response is None:
+                request.throttled = {name for name, (budget_level, _) in results.items()
+                                     if budget_level == DEGRADED}
+        else:
+            outcome, response = 'allowed', None
+        for name in names:
+            _count(name, outcome)
+        return response
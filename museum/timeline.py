@@ -0,0 +1,106 @@
+"""
+Хронология коллекции: экспонаты по десятилетиям создания.
+
+Датировка хранится диапазоном year_from/year_to (см. museum/dating.py), поэтому
+экспонат с датировкой "1938-1941" попадает и в 1930-е, и в 1940-е, а отбор
+по периоду - запрос на пересечение диапазонов по индексу (year_from, year_to).
+Счетчики по десятилетиям считаются одним GROUP BY по паре (десятилетие начала,
+десятилетие конца) - таких пар намного меньше, чем экспонатов, - и кэшируются
+под версией фасетного индекса: она меняется при любом сохранении экспоната.
+"""
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Count, F
+from django.shortcuts import render
+
+from . import dating, facets, throttling
+from .db_routers import use_primary
+from .models import Exhibit
+
+COUNTS_TIMEOUT = 60 * 10
+
+
+# ==================== ЗАПРОСЫ ====================
+def overlapping(queryset, start, end):
+    """Экспонаты, период создания которых пересекается с [start, end]"""
+    return queryset.filter(year_from__lte=end, year_to__gte=start)
+
+
+def decade_counts(statuses=facets.PUBLIC_STATUSES):
+    """{'decades': {десятилетие: число экспонатов}, 'undated': число недатированных}"""
+    key = f"timeline:decades:{facets.get_version()}:{','.join(statuses)}"
+    result = cache.get(key)
+    if result is None:
+        counts, undated = {}, 0
+        # Годы целые: деление в базе целочисленное. Недатированные - группа (None, None)
+        rows = (Exhibit.objects.filter(status__in=statuses)
+                .values_list(F('year_from') / 10, F('year_to') / 10)
+                .annotate(count=Count('id')).order_by())
+        # Кэшируется под версией: считается по основной базе
+        with use_primary():
+            rows = list(rows)
+        for first, last, count in rows:
+            if first is None:
+                undated += count
+                continue
+            for decade in dating.decades(first * 10, last * 10):
+                counts[decade] = counts.get(decade, 0) + count
+        result = {'decades': counts, 'undated': undated}
+        cache.set(key, result, COUNTS_TIMEOUT)
+    return result
+
+
+def _centuries(counts, selected):
+    """Десятилетия для шаблона, сгруппированные по векам"""
+    if not counts:
+        return []
+    top = max(counts.values())
+    centuries = {}
+    for decade in sorted(counts):
+        centuries.setdefault(decade // 100, []).append({
+            'decade': decade,
+            'count': counts[decade],
+            'percent': round(counts[decade] * 100 / top),
+            'selected': selected is not None and selected[0] <= decade and decade + 9 <= selected[1],
+        })
+    return [{'start': century * 100, 'decades': decades}
+            for century, decades in centuries.items()]
+
+
+def _year(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# ==================== ПРЕДСТАВЛЕНИЕ ====================
+def timeline(request):
+    """Экспонаты по десятилетиям; ?from=1940&to=1949 - экспонаты периода"""
+    statuses = facets.STAFF_STATUSES if request.user.is_staff else facets.PUBLIC_STATUSES
+    counts = decade_counts(statuses)
+
+    start, end = _year(request.GET.get('from')), _year(request.GET.get('to'))
+    if start is not None and end is None:
+        end = start
+    if end is not None and start is None:
+        start = end
+    selected = (min(start, end), max(start, end)) if start is not None else None
+
+    page_obj = None
+    if selected:
+        exhibits = overlapping(
+            Exhibit.objects.filter(status__in=statuses).select_related('category'), *selected
+        ).order_by('year_from', 'year_to', 'title')
+        page_obj = Paginator(exhibits, 12).get_page(throttling.page_number(request))
+
+    context = {
+        'centuries': _centuries(counts['decades'], selected),
+        'undated_count': counts['undated'],
+        'selected': selected,
+        'selected_label': dating.format_range(*selected) if selected else '',
+        'page_obj': page_obj,
+        'exhibits': page_obj.object_list if page_obj else [],
+        'querystring': f'from={selected[0]}&to={selected[1]}' if selected else '',
+    }
+    return render(request, 'museum/timeline.html', context)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, api, deepzoom, reports, stocktake, throttling, timeline
 
 app_name = 'museum'
 
@@ -15,4 +15,34 @@ urlpatterns = [
     
     # Страница всех категорий
     path('categories/', views.category_list, name='category_list'),
+    
+    # Хронология: экспонаты по десятилетиям создания
+    path('timeline/', timeline.timeline, name='timeline'),
+    
+    # Большие сканы: тайлы Deep Zoom и уменьшенные копии
+    path('photos/<int:pk>/<slug:photo_version>.dzi', deepzoom.photo_dzi, name='photo_dzi'),
+    path('photos/<int:pk>/<slug:photo_version>_files/<int:level>/<int:col>_<int:row>.jpg',
+         deepzoom.photo_tile, name='photo_tile'),
+    path('photos/<int:pk>/<slug:photo_version>/preview-<int:size>.jpg',
+         deepzoom.photo_preview, name='photo_preview'),
+    
+    # Расширенный поиск (экспонаты и текст документов)
+    path('search/', views.search_results, name='search_results'),
+    
+    # Подсказки для строки поиска
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
+    
+    # Инвентаризация (только для сотрудников)
+    path('stocktake/<int:pk>/', stocktake.report, name='stocktake_report'),
+    path('stocktake/<int:pk>/scan/', stocktake.scan_page, name='stocktake_scan_page'),
+    path('stocktake/<int:pk>/scan/batch/', stocktake.scan, name='stocktake_scan'),
+    
+    # Отчеты по коллекции (только для сотрудников)
+    path('reports/', reports.dashboard, name='reports_dashboard'),
+    path('reports/export/<slug:report>.<slug:fmt>', reports.export, name='reports_export'),
+    path('reports/throttle.json', throttling.stats_view, name='throttle_stats'),
+    
+    # JSON API (только чтение)
+    path('api/v1/<slug:resource>/', api.resource_list, name='api_list'),
+    path('api/v1/<slug:resource>/<int:pk>/', api.resource_detail, name='api_detail'),
 ]
\ No newline at end of file
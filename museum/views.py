@@ -2,18 +2,38 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.db.models import Q, Count
 from django.core.paginator import Paginator
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
 from .models import Exhibit, Category, ExhibitPhoto, Document
+from . import autocomplete as autocomplete_index, documents, facets, popularity, throttling
+
+# Варианты сортировки списка экспонатов: код -> (название, поля)
+SORT_OPTIONS = {
+    'new': ('Новые', ('-created_at',)),
+    'popular': ('Самые просматриваемые', ('-view_count', '-created_at')),
+}
 
 def home(request):
     """Перенаправление на список экспонатов"""
     return redirect('museum:exhibit_list')
 
 def exhibit_list(request):
-    """Список всех экспонатов с фильтрацией и поиском"""
-    exhibits = Exhibit.objects.filter(status='published').order_by('-created_at')
+    """Список всех экспонатов с фасетной фильтрацией и поиском"""
+    # Сотрудники могут фильтровать и по статусу (по умолчанию - опубликованные)
+    is_staff = request.user.is_staff
+    # Посетитель превысил бюджет дорогих запросов - только обязательное (museum/throttling.py)
+    degraded = throttling.is_degraded(request)
+    selection = facets.parse_selection(request.GET, staff=is_staff)
+    statuses = facets.STAFF_STATUSES if is_staff else facets.PUBLIC_STATUSES
+    sort = request.GET.get('sort')
+    if sort not in SORT_OPTIONS:
+        sort = 'new'
+    exhibits = (Exhibit.objects.filter(status__in=statuses)
+                .select_related('category').order_by(*SORT_OPTIONS[sort][1]))
     
     # Поиск
     query = request.GET.get('q')
+    found = None
     if query:
         exhibits = exhibits.filter(
             Q(title__icontains=query) |
@@ -22,16 +42,10 @@ def exhibit_list(request):
             Q(inventory_number__icontains=query) |
             Q(author__icontains=query)
         )
+        found = exhibits
     
-    # Фильтрация по категории
-    category_id = request.GET.get('category')
-    if category_id:
-        exhibits = exhibits.filter(category_id=category_id)
-    
-    # Фильтрация по тегу
-    tag = request.GET.get('tag')
-    if tag:
-        exhibits = exhibits.filter(tags__icontains=tag)
+    # Фильтрация по фасетам (категория, теги, материал, автор, десятилетие, статус)
+    exhibits = facets.apply_filters(exhibits, selection)
     
     # Фильтрация по избранному
     is_featured = request.GET.get('is_featured')
@@ -40,35 +54,67 @@ def exhibit_list(request):
     
     # Пагинация
     paginator = Paginator(exhibits, 12)  # 12 экспонатов на странице
-    page_number = request.GET.get('page')
+    page_number = throttling.page_number(request)
     page_obj = paginator.get_page(page_number)
     
-    # Получаем категории для фильтра с подсчетом экспонатов
-    categories = Category.objects.annotate(
-        exhibit_count=Count('exhibit', filter=Q(exhibit__status='published'))
-    )
+    # Счетчики фасетов по индексу (кэшируются для каждой комбинации фильтров);
+    # при перегрузке - значения из общих счетчиков без фильтров (они почти всегда
+    # уже в кэше), а числа не показываются: с поиском и фильтрами они неверны
+    if degraded:
+        counts = facets.facet_counts({}, staff=is_staff)
+    else:
+        counts = facets.facet_counts(selection, staff=is_staff, query=query or '',
+                                     found=found)
+    facet_list = facets.build_facets(request.GET, selection, counts)
+    categories = facet_list['category']['values']
     
-    # Популярные теги (первые 10)
-    all_tags = []
-    for exhibit in Exhibit.objects.filter(status='published'):
-        if exhibit.tags:
-            all_tags.extend([tag.strip() for tag in exhibit.tags.split(',') if tag.strip()])
-    popular_tags = sorted(set(all_tags))[:10]
+    # Популярные теги (10 самых частых)
+    popular_tags = [] if degraded else [item['value'] for item in facet_list['tag']['values'][:10]]
     
     # Подсчет статистики
-    total_exhibits = Exhibit.objects.filter(status='published').count()
+    public_index = facets.get_index(facets.PUBLIC_STATUSES)
+    total_exhibits = len(public_index['all'])
     featured_count = Exhibit.objects.filter(is_featured=True, status='published').count()
     
+    # Строка запроса без номера страницы - для ссылок пагинации
+    querystring = request.GET.copy()
+    querystring.pop('page', None)
+    # ... и без сортировки - для переключателя сортировки
+    sort_querystring = querystring.copy()
+    sort_querystring.pop('sort', None)
+    
+    # Совпадения в тексте документов (показываются на первой странице поиска)
+    document_results = []
+    if query and page_obj.number == 1 and not degraded:
+        document_results = documents.search_documents(query, public=not is_staff)
+    
+    # Блок популярных экспонатов - на первой странице без поиска и фильтров
+    popular_exhibits = []
+    if (not query and not is_featured and not degraded and page_obj.number == 1
+            and not set(selection) - {'status'}):
+        popular_exhibits = popularity.popular_exhibits()
+    
+    selected_tags = selection.get('tag', [])
     context = {
         'page_obj': page_obj,
         'exhibits': page_obj.object_list,
         'categories': categories,
+        'facets': [facet_list[name] for name in ('material', 'author', 'decade', 'status')
+                   if name in facet_list],
         'popular_tags': popular_tags,
         'search_query': query or '',
-        'selected_category': int(category_id) if category_id else None,
-        'selected_tag': tag or '',
+        'selected_category': selection.get('category', [None])[0],
+        'selected_tag': selected_tags[0] if len(selected_tags) == 1 else '',
+        'has_filters': bool(set(selection) - {'status'}),
+        'querystring': querystring.urlencode(),
+        'sort': sort,
+        'sort_options': [(code, label) for code, (label, _) in SORT_OPTIONS.items()],
+        'sort_querystring': sort_querystring.urlencode(),
+        'popular_exhibits': popular_exhibits,
         'total_exhibits': total_exhibits,      # ← ДОБАВЛЕНО
         'featured_count': featured_count,      # ← ДОБАВЛЕНО
+        'document_results': document_results,
+        'hide_counts': degraded,
     }
     
     return render(request, 'museum/exhibit_list.html', context)
@@ -81,6 +127,10 @@ def exhibit_detail(request, pk):
     if exhibit.status != 'published' and not request.user.is_authenticated:
         return redirect('museum:exhibit_list')
     
+    # Просмотр копится в памяти и попадает в базу пачкой (см. museum/popularity.py)
+    if exhibit.status == 'published':
+        popularity.record_view(request, exhibit)
+    
     # Получаем фотографии
     photos = exhibit.photos.all()
     
@@ -141,11 +191,12 @@ def category_detail(request, pk):
         exhibit_count=Count('exhibit', filter=Q(exhibit__status='published'))
     ).first()
     
-    exhibits = Exhibit.objects.filter(category=category, status='published')
+    exhibits = (Exhibit.objects.filter(category=category, status='published')
+                .select_related('category').order_by('-created_at'))
     
     # Пагинация
     paginator = Paginator(exhibits, 12)
-    page_number = request.GET.get('page')
+    page_number = throttling.page_number(request)
     page_obj = paginator.get_page(page_number)
     
     # Получаем другие категории для навигации
@@ -169,10 +220,10 @@ def featured_exhibits(request):
     exhibits = Exhibit.objects.filter(
         is_featured=True, 
         status='published'
-    ).order_by('-created_at')
+    ).select_related('category').order_by('-created_at')
     
     paginator = Paginator(exhibits, 12)
-    page_number = request.GET.get('page')
+    page_number = throttling.page_number(request)
     page_obj = paginator.get_page(page_number)
     
     context = {
@@ -191,7 +242,7 @@ def search_results(request):
     if not query:
         return redirect('museum:exhibit_list')
     
-    exhibits = Exhibit.objects.filter(status='published')
+    exhibits = Exhibit.objects.filter(status='published').select_related('category')
     
     # Расширенный поиск
     search_fields = [
@@ -208,16 +259,30 @@ def search_results(request):
     for field in search_fields:
         q_objects |= Q(**{field: query})
     
-    exhibits = exhibits.filter(q_objects).distinct().order_by('-created_at')
+    found = exhibits.filter(q_objects).distinct()
+    # Посетитель превысил бюджет дорогих запросов - только обязательное (museum/throttling.py)
+    degraded = throttling.is_degraded(request)
+    
+    # Фасеты, выбранные на странице поиска, сужают найденное
+    selection = facets.parse_selection(request.GET)
+    exhibits = facets.apply_filters(found, selection).order_by('-created_at')
     
     paginator = Paginator(exhibits, 12)
-    page_number = request.GET.get('page')
+    page_number = throttling.page_number(request)
     page_obj = paginator.get_page(page_number)
     
-    # Получаем категории для фильтра
-    categories = Category.objects.annotate(
-        exhibit_count=Count('exhibit', filter=Q(exhibit__status='published'))
-    )
+    # Категории для фильтра - значения фасета по найденному (со ссылками и выбором);
+    # при перегрузке найденное второй раз не перебирается - общие счетчики без чисел
+    if degraded:
+        counts = facets.facet_counts({})
+    else:
+        counts = facets.facet_counts(selection, query=('search', query), found=found)
+    categories = facets.build_facets(request.GET, selection, counts)['category']['values']
+    
+    # Поиск по тексту документов экспонатов
+    document_results = []
+    if page_obj.number == 1 and not degraded:
+        document_results = documents.search_documents(query, public=not request.user.is_staff)
     
     context = {
         'page_obj': page_obj,
@@ -225,6 +290,18 @@ def search_results(request):
         'categories': categories,
         'search_query': query,
         'is_search_page': True,
+        'document_results': document_results,
+        'hide_counts': degraded,
     }
     
-    return render(request, 'museum/exhibit_list.html', context)
\ No newline at end of file
+    return render(request, 'museum/exhibit_list.html', context)
+
+def autocomplete(request):
+    """Подсказки для строки поиска (JSON)"""
+    query = request.GET.get('q', '').strip()[:100]
+    suggestions = autocomplete_index.suggest(query) if query else []
+    
+    response = JsonResponse({'suggestions': suggestions},
+                            json_dumps_params={'ensure_ascii': False})
+    patch_cache_control(response, public=True, max_age=60)
+    return response
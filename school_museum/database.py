@@ -0,0 +1,152 @@
+"""
+Профили базы данных, выбираемые переменными окружения.
+
+MUSEUM_DB_ENGINE=sqlite (по умолчанию)
+    MUSEUM_DB_NAME          путь к файлу (по умолчанию BASE_DIR/db.sqlite3)
+    Соединения живут между запросами (CONN_MAX_AGE), при открытии включаются
+    WAL, synchronous=NORMAL, mmap и увеличенный кэш страниц, чтобы запись
+    из админки не блокировала читателей.
+
+MUSEUM_DB_REPLICAS
+    Реплики только для чтения через запятую: для SQLite - пути к файлам,
+    для PostgreSQL - хосты (имя базы и учетные данные как у основной).
+    Публичные страницы читают с реплик (см. museum/db_routers.py).
+
+MUSEUM_DB_ENGINE=postgresql
+    MUSEUM_DB_NAME, MUSEUM_DB_USER, MUSEUM_DB_PASSWORD, MUSEUM_DB_HOST, MUSEUM_DB_PORT
+    MUSEUM_DB_POOL_MIN, MUSEUM_DB_POOL_MAX   размер пула psycopg (по умолчанию 2 и 10)
+    Используется пул соединений psycopg_pool с проверкой соединения перед выдачей
+    (пакеты psycopg и psycopg-pool - в requirements.txt).
+
+MUSEUM_DB_TENANT_POOL_MAX
+    Размер пула базы одного музея при нескольких музеях (по умолчанию 2),
+    см. museum/tenants.py. Пул музея открывает соединения по требованию.
+"""
+import os
+from pathlib import Path
+
+# Значения, которые Django подставляет в DATABASES при запуске
+CONNECTION_DEFAULTS = {
+    'ATOMIC_REQUESTS': False,
+    'AUTOCOMMIT': True,
+    'CONN_MAX_AGE': 0,
+    'CONN_HEALTH_CHECKS': False,
+    'OPTIONS': {},
+    'TIME_ZONE': None,
+    'NAME': '',
+    'USER': '',
+    'PASSWORD': '',
+    'HOST': '',
+    'PORT': '',
+}
+TEST_DEFAULTS = {'CHARSET': None, 'COLLATION': None, 'MIGRATE': True, 'MIRROR': None, 'NAME': None}
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,       # в КиБ (отрицательное значение), т.е. ~64 МБ
+    'busy_timeout': 5000,       # мс
+    'temp_store': 'MEMORY',
+}
+
+
+def _env(name, default=''):
+    return os.environ.get(f'MUSEUM_DB_{name}', default)
+
+
+def sqlite_config(path, pragmas=None):
+    """Настройки SQLite с прагмами, выполняемыми при каждом новом соединении"""
+    pragmas = {**SQLITE_PRAGMAS, **(pragmas or {})}
+    init_command = ' '.join(f'PRAGMA {name}={value};' for name, value in pragmas.items())
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+        'CONN_MAX_AGE': int(_env('CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': init_command,
+            # Транзакции сразу берут блокировку записи - меньше "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': pragmas['busy_timeout'] / 1000,
+        },
+    }
+
+
+def postgresql_config():
+    """Настройки PostgreSQL с пулом соединений psycopg"""
+    from psycopg_pool import ConnectionPool
+
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': _env('NAME', 'school_museum'),
+        'USER': _env('USER', 'school_museum'),
+        'PASSWORD': _env('PASSWORD'),
+        'HOST': _env('HOST', 'localhost'),
+        'PORT': _env('PORT', '5432'),
+        # С пулом Django не держит соединение сам: оно возвращается в пул после запроса
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(_env('POOL_MIN', '2')),
+                'max_size': int(_env('POOL_MAX', '10')),
+                'timeout': 10,
+                'check': ConnectionPool.check_connection,
+            },
+        },
+    }
+
+
+def database_config(base_dir):
+    """Настройки базы 'default' для текущего окружения"""
+    engine = _env('ENGINE', 'sqlite')
+    if engine in ('postgresql', 'postgres'):
+        return postgresql_config()
+    return sqlite_config(_env('NAME') or base_dir / 'db.sqlite3')
+
+
+def replica_configs(primary):
+    """Настройки реплик: {'replica_1': {...}, ...}"""
+    replicas = {}
+    for number, location in enumerate(filter(None, (
+        item.strip() for item in _env('REPLICAS').split(',')
+    )), start=1):
+        if primary['ENGINE'].endswith('sqlite3'):
+            config = sqlite_config(location)
+        else:
+            config = {**primary, 'HOST': location, 'OPTIONS': {**primary['OPTIONS']}}
+        # В тестах реплика - это та же база
+        config['TEST'] = {'MIRROR': 'default'}
+        replicas[f'replica_{number}'] = config
+    return replicas
+
+
+def tenant_config(primary, root, slug):
+    """Настройки базы музея-арендатора: свой файл SQLite или своя база PostgreSQL"""
+    if primary['ENGINE'].endswith('sqlite3'):
+        return sqlite_config(Path(root) / slug / 'db.sqlite3')
+    config = {**primary, 'NAME': f"{primary['NAME']}_{slug}", 'OPTIONS': {**primary['OPTIONS']}}
+    if isinstance(config['OPTIONS'].get('pool'), dict):
+        config['OPTIONS']['pool'] = {**config['OPTIONS']['pool'], 'min_size': 0,
+                                     'max_size': int(_env('TENANT_POOL_MAX', '2'))}
+    return config
+
+
+def register_database(alias, config):
+    """
+    Добавляет базу во время работы (исходная SQLite при переносе, базы музеев).
+
+    У Django нет API для баз, добавленных после запуска: настройки дополняются
+    значениями по умолчанию здесь (как при чтении DATABASES) и записываются
+    в settings.DATABASES и в connections.settings - словарь, из которого
+    создаются соединения. Проверено на Django 5.2-6.0; при обновлении Django
+    (версия закреплена в requirements.txt) сверить с ConnectionHandler.
+    """
+    from django.conf import settings
+    from django.db import connections
+
+    configured = {**CONNECTION_DEFAULTS, **config}
+    configured['TEST'] = {**TEST_DEFAULTS, **config.get('TEST', {})}
+    settings.DATABASES[alias] = configured
+    connections.settings[alias] = configured
+    return alias
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .database import database_config, replica_configs, tenant_config
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -47,27 +50,39 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'museum.tenants.TenantMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'museum.db_routers.ReplicaPinningMiddleware',
+    'museum.throttling.ThrottleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'school_museum.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
          'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # В разработке шаблоны перечитываются с диска, в продакшене
+            # разобранные шаблоны хранятся в памяти процесса
+            'loaders': TEMPLATE_LOADERS if DEBUG else [
+                ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+            ],
         },
     },
 ]
@@ -77,13 +92,84 @@ WSGI_APPLICATION = 'school_museum.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
+# Профиль выбирается переменными окружения, см. school_museum/database.py:
+#   MUSEUM_DB_ENGINE=sqlite      - SQLite с WAL и постоянными соединениями (по умолчанию)
+#   MUSEUM_DB_ENGINE=postgresql  - PostgreSQL с пулом соединений psycopg
 
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+    'default': database_config(BASE_DIR),
+}
+DATABASES.update(replica_configs(DATABASES['default']))
+
+# Несколько музеев в одном развертывании (museum/tenants.py):
+#   MUSEUM_TENANT_DOMAIN=museum.example.org  - музей school5 открывается на school5.museum.example.org
+#   MUSEUM_TENANTS_FILE=/etc/museum/tenants.json - свои домены музеев
+#   MUSEUM_TENANT=school5 - процесс (команда управления) работает только с этим музеем
+MUSEUM_TENANTS_ROOT = Path(os.environ.get('MUSEUM_TENANTS_ROOT', BASE_DIR / 'tenants'))
+MUSEUM_TENANT_DOMAIN = os.environ.get('MUSEUM_TENANT_DOMAIN', '')
+MUSEUM_TENANTS_FILE = os.environ.get('MUSEUM_TENANTS_FILE', '')
+MUSEUM_TENANT = os.environ.get('MUSEUM_TENANT', '')
+MUSEUM_TENANT_CONN_MAX_AGE = 0      # сек; соединения с базами музеев закрываются после запроса
+MUSEUM_TENANT_LOCAL_LIMIT = 200     # музеев, чьи индексы держатся в памяти воркера
+
+if MUSEUM_TENANT:
+    # У музея нет реплик: и чтение, и запись - в его базу
+    DATABASES = {'default': tenant_config(DATABASES['default'], MUSEUM_TENANTS_ROOT, MUSEUM_TENANT)}
+
+# База музея по домену запроса; у основного сайта чтение публичных страниц -
+# с реплик, запись и админка - с основной базы
+DATABASE_ROUTERS = ['museum.db_routers.TenantRouter', 'museum.db_routers.ReplicaRouter']
+MUSEUM_REPLICA_MAX_LAG = 5          # сек; реплика с большим отставанием не используется
+MUSEUM_PRIMARY_PIN_SECONDS = 10     # сек после записи, когда посетитель читает с основной базы
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# По умолчанию - кэш в памяти процесса. Если воркеров несколько, укажите общий
+# кэш, чтобы сброс индексов (фасеты и т.п.) был виден всем воркерам:
+#   MUSEUM_CACHE_URL=redis://127.0.0.1:6379/1  или  MUSEUM_CACHE_URL=/var/tmp/museum_cache
+
+MUSEUM_CACHE_URL = os.environ.get('MUSEUM_CACHE_URL', '')
+
+if MUSEUM_CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': MUSEUM_CACHE_URL,
+        }
+    }
+elif MUSEUM_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': MUSEUM_CACHE_URL,
+        }
     }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'school-museum',
+        }
+    }
+
+
+# Ключи кэша разных музеев не пересекаются
+CACHES['default']['KEY_FUNCTION'] = 'museum.tenants.make_key'
+
+# Ограничение частоты дорогих запросов (museum/throttling.py): поиск и дальние
+# страницы списков. Для каждого бюджета - корзины адреса и сессии:
+# (запросов подряд, пополнение в минуту). Сверх корзины страница упрощается,
+# сверх двух корзин - ответ 429.
+MUSEUM_THROTTLE_ENABLED = os.environ.get('MUSEUM_THROTTLE_ENABLED', '1') == '1'
+MUSEUM_THROTTLE_RATES = {
+    'search': {'ip': (60, 60), 'session': (15, 20)},
+    'deep_page': {'ip': (60, 120), 'session': (20, 40)},
 }
+MUSEUM_THROTTLE_DEEP_PAGE = 5       # страницы списков дальше этой расходуют бюджет deep_page
+MUSEUM_THROTTLE_PAGE_CACHE = 120    # сек, сколько готовая страница отдается перегруженным
+# За nginx адрес посетителя в заголовке, например HTTP_X_FORWARDED_FOR
+MUSEUM_THROTTLE_IP_HEADER = os.environ.get('MUSEUM_THROTTLE_IP_HEADER', '')
 
 
 # Password validation
@@ -122,8 +208,29 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+# Сборка: python manage.py build_assets (библиотеки, сжатие, collectstatic, .gz/.br).
+# В продакшене имена файлов содержат хэш содержимого (см. museum/assets.py)
+STORAGES = {
+    # Медиафайлы текущего музея (без нескольких музеев - обычный MEDIA_ROOT)
+    'default': {'BACKEND': 'museum.tenants.TenantFileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+        else 'museum.assets.ManifestStorage',
+    },
+}
+# Раздавать STATIC_ROOT самим приложением (если перед ним нет nginx)
+MUSEUM_SERVE_STATIC = os.environ.get('MUSEUM_SERVE_STATIC', '1') == '1'
+
+# Извлечение текста из документов (museum/documents.py)
+MUSEUM_EXTRACT_ON_UPLOAD = True     # извлекать в фоне сразу после загрузки
+MUSEUM_EXTRACTION_WORKERS = 2       # потоков фонового извлечения
+# Локальный OCR для сканов, например 'museum.documents.tesseract_ocr' (нужен pytesseract)
+MUSEUM_OCR_BACKEND = os.environ.get('MUSEUM_OCR_BACKEND', '')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+if MUSEUM_TENANT:
+    MEDIA_ROOT = MUSEUM_TENANTS_ROOT / MUSEUM_TENANT / 'media'
 LANGUAGE_CODE = 'ru-ru'
 TIME_ZONE = 'Europe/Moscow'
 ALLOWED_HOSTS = ['*']
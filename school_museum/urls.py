@@ -1,7 +1,9 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
+
+from museum.assets import serve_static
+from museum.tenants import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -9,4 +11,12 @@ urlpatterns = [
 ]
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    # Медиафайлы текущего музея (у каждого музея свой каталог)
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), serve_media),
+    ]
+elif settings.MUSEUM_SERVE_STATIC:
+    # Собранная статика (build_assets) с долгим кэшированием и сжатыми копиями
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % settings.STATIC_URL.lstrip('/'), serve_static),
+    ]
@@ -0,0 +1,179 @@
+// Просмотр больших сканов по тайлам Deep Zoom (DZI).
+// Загружаются только тайлы, попадающие в окно, на уровне, соответствующем масштабу.
+// Разметка: <div class="deepzoom-viewer" data-dzi="...dzi" data-preview="...jpg"></div>
+
+(function() {
+    'use strict';
+
+    function DeepZoomViewer(container, dziUrl, previewUrl) {
+        this.container = container;
+        this.base = dziUrl.replace(/\.dzi$/, '_files/');
+        this.tiles = {};
+        this.failures = {};
+        this.pending = false;
+        container.innerHTML = '';
+
+        this.layer = document.createElement('div');
+        this.layer.className = 'deepzoom-layer';
+        container.appendChild(this.layer);
+
+        // Уменьшенная копия под тайлами, пока они загружаются
+        this.backdrop = document.createElement('img');
+        this.backdrop.className = 'deepzoom-backdrop';
+        if (previewUrl) this.backdrop.src = previewUrl;
+        this.layer.appendChild(this.backdrop);
+
+        var viewer = this;
+        fetch(dziUrl)
+            .then(function(response) { return response.text(); })
+            .then(function(text) {
+                var xml = new DOMParser().parseFromString(text, 'application/xml');
+                var image = xml.getElementsByTagName('Image')[0];
+                var size = xml.getElementsByTagName('Size')[0];
+                viewer.tileSize = parseInt(image.getAttribute('TileSize'), 10);
+                viewer.overlap = parseInt(image.getAttribute('Overlap'), 10);
+                viewer.format = image.getAttribute('Format');
+                viewer.width = parseInt(size.getAttribute('Width'), 10);
+                viewer.height = parseInt(size.getAttribute('Height'), 10);
+                viewer.maxLevel = Math.ceil(Math.log2(Math.max(viewer.width, viewer.height)));
+                viewer.bind();
+                viewer.reset();
+            });
+    }
+
+    DeepZoomViewer.prototype.reset = function() {
+        var rect = this.container.getBoundingClientRect();
+        this.scale = Math.min(rect.width / this.width, rect.height / this.height);
+        this.minScale = this.scale / 2;
+        this.x = (rect.width - this.width * this.scale) / 2;
+        this.y = (rect.height - this.height * this.scale) / 2;
+        this.schedule();
+    };
+
+    DeepZoomViewer.prototype.zoom = function(factor, cx, cy) {
+        var rect = this.container.getBoundingClientRect();
+        if (cx === undefined) { cx = rect.width / 2; cy = rect.height / 2; }
+        var scale = Math.min(Math.max(this.scale * factor, this.minScale), 2);
+        // Точка под курсором остается на месте
+        this.x = cx - (cx - this.x) * scale / this.scale;
+        this.y = cy - (cy - this.y) * scale / this.scale;
+        this.scale = scale;
+        this.schedule();
+    };
+
+    DeepZoomViewer.prototype.bind = function() {
+        var viewer = this;
+        var container = this.container;
+        var drag = null;
+
+        container.addEventListener('wheel', function(event) {
+            event.preventDefault();
+            var rect = container.getBoundingClientRect();
+            viewer.zoom(event.deltaY < 0 ? 1.25 : 0.8,
+                        event.clientX - rect.left, event.clientY - rect.top);
+        }, {passive: false});
+
+        container.addEventListener('dblclick', function(event) {
+            var rect = container.getBoundingClientRect();
+            viewer.zoom(2, event.clientX - rect.left, event.clientY - rect.top);
+        });
+
+        container.addEventListener('pointerdown', function(event) {
+            drag = {x: event.clientX, y: event.clientY};
+            container.setPointerCapture(event.pointerId);
+        });
+        container.addEventListener('pointermove', function(event) {
+            if (!drag) return;
+            viewer.x += event.clientX - drag.x;
+            viewer.y += event.clientY - drag.y;
+            drag = {x: event.clientX, y: event.clientY};
+            viewer.schedule();
+        });
+        container.addEventListener('pointerup', function() { drag = null; });
+        window.addEventListener('resize', function() { viewer.schedule(); });
+    };
+
+    DeepZoomViewer.prototype.schedule = function() {
+        if (this.pending) return;
+        this.pending = true;
+        var viewer = this;
+        requestAnimationFrame(function() {
+            viewer.pending = false;
+            viewer.render();
+        });
+    };
+
+    DeepZoomViewer.prototype.render = function() {
+        var rect = this.container.getBoundingClientRect();
+        var backdrop = this.backdrop.style;
+        backdrop.left = this.x + 'px';
+        backdrop.top = this.y + 'px';
+        backdrop.width = this.width * this.scale + 'px';
+        backdrop.height = this.height * this.scale + 'px';
+
+        // Уровень, на котором тайл не мельче экранного пикселя
+        var devicePixels = this.scale * (window.devicePixelRatio || 1);
+        var level = this.maxLevel + Math.ceil(Math.log2(devicePixels));
+        level = Math.min(Math.max(level, 0), this.maxLevel);
+        var levelScale = Math.pow(2, this.maxLevel - level);  // пикселей оригинала в пикселе уровня
+        var levelWidth = Math.ceil(this.width / levelScale);
+        var levelHeight = Math.ceil(this.height / levelScale);
+        var size = this.tileSize;
+        var factor = this.scale * levelScale;                  // экранных пикселей в пикселе уровня
+
+        // Видимая область в координатах уровня
+        var left = Math.max(0, -this.x / factor);
+        var top = Math.max(0, -this.y / factor);
+        var right = Math.min(levelWidth, (rect.width - this.x) / factor);
+        var bottom = Math.min(levelHeight, (rect.height - this.y) / factor);
+
+        var needed = {};
+        for (var row = Math.floor(top / size); row * size < bottom; row++) {
+            for (var col = Math.floor(left / size); col * size < right; col++) {
+                var key = level + '/' + col + '_' + row;
+                needed[key] = true;
+                var tile = this.tiles[key];
+                if (!tile) {
+                    tile = document.createElement('img');
+                    tile.className = 'deepzoom-tile';
+                    tile.addEventListener('error', this.retry.bind(this, key, tile));
+                    tile.src = this.base + key + '.' + this.format;
+                    this.layer.appendChild(tile);
+                    this.tiles[key] = tile;
+                }
+                var offsetX = col ? this.overlap : 0;
+                var offsetY = row ? this.overlap : 0;
+                tile.style.left = this.x + (col * size - offsetX) * factor + 'px';
+                tile.style.top = this.y + (row * size - offsetY) * factor + 'px';
+                tile.style.width = (Math.min(size + offsetX + this.overlap, levelWidth - col * size + offsetX)) * factor + 'px';
+                tile.style.height = (Math.min(size + offsetY + this.overlap, levelHeight - row * size + offsetY)) * factor + 'px';
+            }
+        }
+        for (var existing in this.tiles) {
+            if (!needed[existing]) {
+                this.layer.removeChild(this.tiles[existing]);
+                delete this.tiles[existing];
+            }
+        }
+    };
+
+    // Пока сервер создает тайлы, он отвечает 503: тайл скрывается (видна уменьшенная
+    // копия) и запрашивается снова через RETRY_DELAY, но не больше MAX_RETRIES раз
+    var RETRY_DELAY = 2000;
+    var MAX_RETRIES = 15;
+
+    DeepZoomViewer.prototype.retry = function(key, tile) {
+        tile.style.visibility = 'hidden';
+        var failures = this.failures[key] = (this.failures[key] || 0) + 1;
+        if (failures > MAX_RETRIES) return;
+        var viewer = this;
+        setTimeout(function() {
+            if (viewer.tiles[key] !== tile) return;
+            viewer.layer.removeChild(tile);
+            delete viewer.tiles[key];
+            viewer.schedule();
+        }, RETRY_DELAY);
+    };
+
+    window.DeepZoomViewer = DeepZoomViewer;
+})();
@@ -0,0 +1,61 @@
+// Общие скрипты сайта музея. Собираются в dist/museum.min.js командой build_assets
+
+// Автоматическое скрытие сообщений через 5 секунд
+document.addEventListener('DOMContentLoaded', function() {
+    setTimeout(function() {
+        var alerts = document.querySelectorAll('.alert');
+        alerts.forEach(function(alert) {
+            var bsAlert = new bootstrap.Alert(alert);
+            bsAlert.close();
+        });
+    }, 5000);
+});
+
+// Подсказки в строке поиска
+document.addEventListener('DOMContentLoaded', function() {
+    var input = document.getElementById('navbarSearch');
+    var menu = document.getElementById('navbarSearchSuggestions');
+    if (!input || !menu) return;
+    var timer = null;
+    var controller = null;
+
+    function hide() {
+        menu.classList.remove('show');
+    }
+
+    function render(suggestions) {
+        menu.innerHTML = '';
+        suggestions.forEach(function(item) {
+            var li = document.createElement('li');
+            var a = document.createElement('a');
+            a.className = 'dropdown-item text-truncate';
+            a.href = item.url;
+            a.textContent = item.label;
+            li.appendChild(a);
+            menu.appendChild(li);
+        });
+        menu.classList.toggle('show', suggestions.length > 0);
+    }
+
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        var query = input.value.trim();
+        if (!query) { hide(); return; }
+        timer = setTimeout(function() {
+            if (controller) controller.abort();
+            controller = new AbortController();
+            fetch(input.dataset.autocompleteUrl + '?q=' + encodeURIComponent(query),
+                  {signal: controller.signal})
+                .then(function(response) { return response.json(); })
+                .then(function(data) { render(data.suggestions); })
+                .catch(function() {});
+        }, 80);
+    });
+
+    input.addEventListener('keydown', function(event) {
+        if (event.key === 'Escape') hide();
+    });
+    document.addEventListener('click', function(event) {
+        if (!menu.contains(event.target) && event.target !== input) hide();
+    });
+});